@@ -1,18 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, UploadFile, File
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any
-from src.utils.data_processor import DataProcessor
+from fastapi.responses import Response, JSONResponse, StreamingResponse
+from typing import List, Dict, Any, Optional
+from src.utils.data_processor import DataProcessor, MEASUREMENT_COLUMNS, INSERT_COLUMNS, read_measurements_csv, normalize_measurements
 from src.utils.user_db import UserDB
-from src.utils.auth import create_access_token, create_refresh_token, verify_token
-from src.models.user import UserCreate, UserInDB, Token, UserUpdate, PasswordUpdate
+from src.utils.user_import import ROLES, UserImportError, parse_user_file, import_users
+from src.utils.auth import create_access_token, create_refresh_token, verify_token, new_token_id
+from src.utils.token_store import RefreshTokenStore
+from src.models.user import UserCreate, UserInDB, Token, TokenRefresh, UserUpdate, PasswordUpdate
+from src.models.sensor import SensorUpdate
+from src.models.tariff import TariffLoad
+from src.models.simulation import SimulationRequest
+from src.utils import metrics
+from src.utils.query_tracer import query_tracer
+from src.utils.ingest_jobs import IngestJobManager, JobConflictError
+from src.utils.spool import SpoolIngester
+from src.utils.ring_buffer import MeasurementRingBuffer
+from src.utils.derived_metrics import describe_derived_metrics
+from src.utils.rollups import RollupStore, ROLLUP_SENSORS, period_bounds, baseline_bounds, compare_summaries
+from src.utils.cache import measurement_cache, invalidate_measurement_caches, cache_stats
+from src.utils.sketches import SketchStore, quantile_summary, load_duration_curve, histogram
+from src.utils.bus import create_bus
+from src.utils.db import ReadYourWritesMiddleware, sticky_sessions
+from src.utils.admission import AdmissionController, AdmissionMiddleware, RoutePolicy
+from src.utils.insights import InsightService, InsightStore, SUMMARY_ROWS
+from src.utils.tariffs import TariffStore, TARIFF_DIR, COST_GROUPS, read_tariff_csv
+from src.utils.simulator import StorageSimulator, STORAGE_PARAMETERS, scenario_grid
+from src.utils.export import EXPORT_FORMATS, csv_chunks, ndjson_chunks, parquet_chunks, parquet_available, gzip_chunks
+import io
 import logging
 import os
+import json
+import time
 import asyncio
-from datetime import datetime
+from contextlib import asynccontextmanager
+from datetime import datetime, date, timedelta
 from dotenv import load_dotenv
-import requests
-import pandas as pd
 
 # Load environment variables
 load_dotenv()
@@ -20,48 +44,318 @@ load_dotenv()
 MISTRAL_API_URL = os.getenv('MISTRAL_API_URL')
 MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
 
-# SQL for notifications table
-# CREATE TABLE notifications (
-#     id INT AUTO_INCREMENT PRIMARY KEY,
-#     title VARCHAR(255) NOT NULL,
-#     message TEXT,
-#     type VARCHAR(50),
-#     is_read BOOLEAN DEFAULT FALSE,
-#     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-# );
-
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Energy Dashboard API")
+# Database-backed resources; created in the lifespan hook so importing the
+# app (and starting a worker) never waits on MySQL.
+data_processor: DataProcessor = None
+user_db: UserDB = None
+ingest_jobs: IngestJobManager = None
+spool: SpoolIngester = None
+recent_measurements: MeasurementRingBuffer = None
+rollups: RollupStore = None
+sketches: SketchStore = None
+insights: InsightService = None
+refresh_tokens: RefreshTokenStore = None
+tariffs: TariffStore = None
+simulator: StorageSimulator = None
+
+# Results computed from rollups, valid until the next ingest
+compare_cache = measurement_cache("compare")
+sketch_cache = measurement_cache("sketches")
+heatmap_cache = measurement_cache("heatmaps")
+cost_cache = measurement_cache("costs")
+simulation_cache = measurement_cache("simulations", max_entries=32)
+
+# Larger reads go through the streaming export
+MAX_LATEST_LIMIT = 5000
+
+# Default period of /api/measurements/heatmap: the last four weeks
+HEATMAP_DEFAULT_DAYS = 28
+
+# Measurement batches posted to /api/measurements/upload
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# Hourly costs are computed from raw rows; longer ranges use /api/costs
+MAX_HOURLY_COST_DAYS = 31
+
+# History replayed by /api/simulate (default and maximum)
+SIMULATION_DEFAULT_DAYS = 365
+MAX_SIMULATION_DAYS = 3 * 366
+
+# Admission control: token cost per request and concurrency caps per route
+# template ("METHOD /path" for one method only). Unlisted routes cost 1 token
+# and have no concurrency cap.
+ADMISSION_POLICIES = {
+    "/token": RoutePolicy(cost=5),  # bcrypt
+    "POST /users/": RoutePolicy(cost=5),  # registration hashes the password; listing is cheap
+    "/users/me/change-password": RoutePolicy(cost=5),
+    "/users/import": RoutePolicy(cost=20, max_concurrent=1),
+    "/api/devices/usage": RoutePolicy(cost=5, max_concurrent=4),
+    "/api/measurements/range": RoutePolicy(cost=2),
+    "/api/measurements/series": RoutePolicy(cost=2),
+    "/api/measurements/compare": RoutePolicy(cost=2),
+    "/api/measurements/quantiles": RoutePolicy(cost=2),
+    "/api/measurements/load-duration": RoutePolicy(cost=2),
+    "/api/measurements/histogram": RoutePolicy(cost=2),
+    "/api/measurements/heatmap": RoutePolicy(cost=2),
+    "/api/measurements/export": RoutePolicy(cost=10, max_concurrent=2),
+    "/api/measurements/import": RoutePolicy(cost=20, max_concurrent=2),
+    "/api/measurements/import/spool": RoutePolicy(cost=20, max_concurrent=2),
+    "/api/measurements/upload": RoutePolicy(cost=5, max_concurrent=4),
+    "/api/measurements/rollups/rebuild": RoutePolicy(cost=20, max_concurrent=1),
+    "/api/quality/quarantine/{batch_id}/release": RoutePolicy(cost=20, max_concurrent=1),
+    "/api/ai/insights": RoutePolicy(cost=2),
+    "/api/tariffs/load": RoutePolicy(cost=20, max_concurrent=1),
+    "/api/costs/hourly": RoutePolicy(cost=2),
+    "/api/simulate": RoutePolicy(cost=20, max_concurrent=1),
+}
+admission = AdmissionController(ADMISSION_POLICIES)
+
+# Pub/sub between workers (BUS_URL); single-process when unset
+bus = create_bus()
+
+# Named import sources; clients pick a source, never a file path
+INGEST_SOURCES = {
+    "energy_consumption": "data/energy_consumption.csv",
+}
+
+def _import_heavy_modules():
+    """Import pandas/requests in the background so the first request doesn't pay for it."""
+    import pandas  # noqa: F401
+    import requests  # noqa: F401
+
+def _open_pools():
+    data_processor.db.connect()
+    user_db.db.connect()
+
+def _update_buffer_metrics(*_):
+    metrics.RING_BUFFER_ROWS.set(len(recent_measurements))
+    metrics.RING_BUFFER_BYTES.set(recent_measurements.memory_bytes)
+
+def _publish_ingest(df):
+    """Ingest listener: bring the other workers' buffers and caches up to date."""
+    bus.publish("measurements", recent_measurements.encode_batch(df))
+    bus.publish("invalidate")
+
+def _apply_remote_measurements(payload):
+    recent_measurements.extend_encoded(payload)
+    _update_buffer_metrics()
+
+def _load_revoked_tokens():
+    refresh_tokens.load()
+
+def _remember_revoked_session(entry):
+    """Bus handler: another worker revoked a login session."""
+    refresh_tokens.remember(entry["sid"], entry["expires"])
+
+def _load_sensor_registry():
+    data_processor.sensors.refresh()
+
+def _load_tariffs():
+    tariffs.refresh()
+
+async def _refresh_tariffs(_=None):
+    """Bus handler: another worker changed a tariff."""
+    await asyncio.to_thread(tariffs.refresh)
+    cost_cache.invalidate()
+
+def _publish_db_write(session: str, until: float):
+    bus.publish("db_writes", {"session": session, "until": until})
+
+def _remember_db_write(entry):
+    """Bus handler: a session wrote through another worker; read its data from the primary there too."""
+    sticky_sessions.remember(entry["session"], entry["until"])
+
+async def _refresh_sensors(_=None):
+    """Bus handler: another worker changed the sensor registry."""
+    await asyncio.to_thread(data_processor.sensors.refresh)
+
+def _latest_measurements(limit: int) -> List[Dict[str, Any]]:
+    """Newest rows, newest first: from the ring buffer when it has them all."""
+    buffer = recent_measurements
+    if buffer.seeded and (limit <= len(buffer) or len(buffer) < buffer.capacity):
+        metrics.RING_BUFFER_READS.labels("buffer").inc()
+        return buffer.latest(limit)
+    metrics.RING_BUFFER_READS.labels("database").inc()
+    return data_processor.get_latest_measurements(limit)
+
+async def _unknown_rollup_sensors(names: List[str]) -> List[str]:
+    """The names that are neither a measurements column nor a registered (narrow) sensor."""
+    unknown = [name for name in names if name not in ROLLUP_SENSORS]
+    if unknown:
+        registered = {sensor.name for sensor in await asyncio.to_thread(data_processor.sensors.all)}
+        unknown = [name for name in unknown if name not in registered]
+    return unknown
+
+def _insights_frame():
+    import pandas as pd
+    df = pd.DataFrame(_latest_measurements(SUMMARY_ROWS))
+    if len(df):
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+def _measurements_event(df) -> str:
+    """WebSocket message announcing an ingested batch (its timestamp range)."""
+    timestamps = df['timestamp']
+    return json.dumps({
+        "event": "measurements",
+        "rows": len(df),
+        "first": timestamps.min().isoformat(),
+        "last": timestamps.max().isoformat(),
+    })
+
+def _seed_recent_measurements():
+    """Fill the ring buffer with the newest rows from the database."""
+    rows = data_processor.get_latest_measurements(recent_measurements.capacity)
+    recent_measurements.load(rows)
+    _update_buffer_metrics()
+
+# Steps run by warm_up() after the pools are open, e.g. priming caches
+WARMUP_TASKS = [_import_heavy_modules, _seed_recent_measurements, _load_sensor_registry, _load_revoked_tokens,
+                _load_tariffs]
+
+# Reloaded when the bus (re)connects: other workers' updates may have been missed
+RESYNC_TASKS = [_seed_recent_measurements, _load_sensor_registry, _load_revoked_tokens, _load_tariffs]
+
+async def resync():
+    """Bus listener: catch up on state other workers changed while we were disconnected."""
+    if not getattr(app.state, "warm", False):
+        # warm_up() still has to load everything
+        return
+    for task in RESYNC_TASKS:
+        try:
+            await asyncio.to_thread(task)
+        except Exception as e:
+            logger.error(f"Resync task {task.__name__} failed: {e}")
+    invalidate_measurement_caches()
+
+async def warm_up():
+    """Open the database pools and prime caches without blocking start-up."""
+    delay = 1
+    while True:
+        try:
+            await asyncio.to_thread(_open_pools)
+            break
+        except Exception as e:
+            logger.warning(f"Database not reachable during warm-up ({e}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+    for task in WARMUP_TASKS:
+        try:
+            await asyncio.to_thread(task)
+        except Exception as e:
+            logger.error(f"Warm-up task {task.__name__} failed: {e}")
+    app.state.warm = True
+    logger.info("Warm-up completed")
+
+async def poll_spool(interval: float):
+    """Periodically start a spool import job when new files are waiting."""
+    while True:
+        await asyncio.sleep(interval)
+        if getattr(app.state, "warm", False) and spool.discover():
+            try:
+                ingest_jobs.submit("spool", spool.spool_dir, runner=spool.run_job(ingest_jobs), kind="spool")
+            except JobConflictError:
+                pass
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global data_processor, user_db, ingest_jobs, spool, recent_measurements, rollups, sketches, insights, refresh_tokens, tariffs, simulator
+    data_processor = DataProcessor(
+        host=os.getenv("DB_HOST", "localhost"),
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASSWORD", ""),
+        database=os.getenv("DB_NAME", "energydashboard")
+    )
+    user_db = UserDB(
+        host=os.getenv("DB_HOST", "localhost"),
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASSWORD", ""),
+        database=os.getenv("DB_NAME", "energydashboard")
+    )
+    refresh_tokens = RefreshTokenStore(user_db.db)
+    recent_measurements = MeasurementRingBuffer()
+    data_processor.add_ingest_listener(recent_measurements.extend)
+    data_processor.add_ingest_listener(_update_buffer_metrics)
+    rollups = RollupStore(data_processor.db)
+    data_processor.add_day_listener(rollups.replace_days)
+    sketches = SketchStore(data_processor.db)
+    data_processor.add_day_listener(sketches.replace_days)
+    tariffs = TariffStore(data_processor.db, data_processor.validator.interval_minutes)
+    data_processor.add_day_listener(tariffs.replace_days)
+    data_processor.add_ingest_listener(invalidate_measurement_caches)
+    insights = InsightService(_insights_frame, store=InsightStore(data_processor.db))
+    data_processor.add_ingest_listener(_publish_ingest)
+    bus.subscribe("measurements", _apply_remote_measurements)
+    bus.subscribe("invalidate", invalidate_measurement_caches)
+    bus.subscribe("ws", _broadcast_local)
+    bus.subscribe("sensors", _refresh_sensors)
+    bus.subscribe("sessions", _remember_revoked_session)
+    bus.subscribe("tariffs", _refresh_tariffs)
+    bus.add_resync_listener(resync)
+    if data_processor.db.replicas or user_db.db.replicas:
+        sticky_sessions.add_listener(_publish_db_write)
+        bus.subscribe("db_writes", _remember_db_write)
+    await bus.start()
+    ingest_jobs = IngestJobManager(data_processor)
+    loop = asyncio.get_running_loop()
+
+    def push(message: str):
+        # Ingest listeners run in the inserting thread, not on the loop
+        asyncio.run_coroutine_threadsafe(broadcast(message), loop).add_done_callback(_log_push_error)
+
+    def push_measurements(df):
+        if len(df):
+            push(_measurements_event(df))
+
+    data_processor.add_ingest_listener(push_measurements)
+    ingest_jobs.add_listener(lambda job: push(json.dumps({"event": "ingest_job", "job": job.to_dict()})))
+    spool = SpoolIngester(data_processor)
+    simulator = StorageSimulator(data_processor)
+    app.state.warm = False
+    background_tasks = [asyncio.create_task(warm_up())]
+    spool_interval = float(os.getenv("SPOOL_POLL_SECONDS", "0"))
+    if spool_interval > 0:
+        background_tasks.append(asyncio.create_task(poll_spool(spool_interval)))
+    yield
+    # Clean up resources on shutdown
+    for task in background_tasks:
+        task.cancel()
+    ingest_jobs.shutdown()
+    spool.close()
+    simulator.close()
+    data_processor.close()
+    user_db.close()
+    await bus.close()
+
+app = FastAPI(title="Energy Dashboard API", lifespan=lifespan)
 
 # Configure CORS
+# Shed over-limit requests before any handler work; innermost so 429s still
+# get CORS headers and show up in the request metrics
+app.add_middleware(AdmissionMiddleware, controller=admission, router=app.router)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # In production, replace with specific origins
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
-# OAuth2 scheme
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Request latency per route template
+app.add_middleware(metrics.MetricsMiddleware)
 
-# Initialize data processor
-data_processor = DataProcessor(
-    host=os.getenv("DB_HOST", "localhost"),
-    user=os.getenv("DB_USER", "root"),
-    password=os.getenv("DB_PASSWORD", ""),
-    database=os.getenv("DB_NAME", "energydashboard")
-)
+# Reads after a user's own write skip the (possibly lagging) replicas
+if os.getenv("DB_REPLICAS"):
+    app.add_middleware(ReadYourWritesMiddleware)
 
-user_db = UserDB(
-    host=os.getenv("DB_HOST", "localhost"),
-    user=os.getenv("DB_USER", "root"),
-    password=os.getenv("DB_PASSWORD", ""),
-    database=os.getenv("DB_NAME", "energydashboard")
-)
+# OAuth2 scheme
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class ConnectionManager:
     def __init__(self):
@@ -70,19 +364,47 @@ class ConnectionManager:
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
+        metrics.WEBSOCKET_CONNECTIONS.set(len(self.active_connections))
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        # A failed broadcast may have dropped the connection already
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+        metrics.WEBSOCKET_CONNECTIONS.set(len(self.active_connections))
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         await websocket.send_text(message)
 
     async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        """Send to every client; a client whose send fails is dropped, the rest still get it."""
+        connections = list(self.active_connections)
+        metrics.WEBSOCKET_SENDS_IN_PROGRESS.inc(len(connections))
+        for connection in connections:
+            try:
+                await connection.send_text(message)
+                metrics.WEBSOCKET_MESSAGES.labels("sent").inc()
+            except Exception as e:
+                metrics.WEBSOCKET_MESSAGES.labels("failed").inc()
+                logger.warning(f"Dropping WebSocket client after failed send: {e!r}")
+                self.disconnect(connection)
+            finally:
+                metrics.WEBSOCKET_SENDS_IN_PROGRESS.dec()
 
 manager = ConnectionManager()
 
+async def broadcast(message: str):
+    """Send a message to the WebSocket clients of every worker."""
+    bus.publish("ws", message)
+    await manager.broadcast(message)
+
+def _log_push_error(future):
+    """Done callback for broadcasts scheduled from other threads, whose errors nobody awaits."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Error pushing WebSocket event: {future.exception()}")
+
+async def _broadcast_local(message: str):
+    await manager.broadcast(message)
+
 # Dependency to get current user
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
     credentials_exception = HTTPException(
@@ -93,7 +415,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
     
     payload = verify_token(token)
     username: str = payload.get("sub")
-    if username is None:
+    if username is None or payload.get("type") == "refresh":
+        raise credentials_exception
+    # Logged out, or its refresh token was replayed; an in-memory lookup
+    if refresh_tokens.is_revoked(payload.get("sid")):
         raise credentials_exception
     
     user = user_db.get_user_by_username(username)
@@ -123,16 +448,74 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     # Update last login
     user_db.update_last_login(user.id)
     
-    # Create tokens
-    access_token = create_access_token(data={"sub": user.username, "role": user.role})
-    refresh_token = create_refresh_token(data={"sub": user.username})
-    
+    return _issue_tokens(user, new_token_id())
+
+def _issue_tokens(user: UserInDB, session_id: str) -> dict:
+    access_token = create_access_token(data={"sub": user.username, "role": user.role, "sid": session_id})
+    refresh_token = create_refresh_token(data={"sub": user.username, "sid": session_id})
     return {
         "access_token": access_token,
         "refresh_token": refresh_token,
         "token_type": "bearer"
     }
 
+def _revoke_session(session_id: str):
+    expires = refresh_tokens.revoke_session(session_id)
+    bus.publish("sessions", {"sid": session_id, "expires": expires})
+
+@app.post("/token/refresh", response_model=Token)
+async def refresh_access_token(request: TokenRefresh):
+    """Exchange a refresh token for a new access and refresh token.
+
+    No password check: renewing a session costs a signature check and one
+    insert. Each refresh token is accepted once; presenting one again means
+    it was copied, and ends the whole session for both holders. Within a
+    few seconds of its exchange (tabs refreshing at once, a retried request)
+    a token is exchanged again instead.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = verify_token(request.refresh_token)
+    except HTTPException:
+        metrics.TOKEN_REFRESHES.labels("invalid").inc()
+        raise invalid
+    token_id, session_id = payload.get("jti"), payload.get("sid")
+    if payload.get("type") != "refresh" or not token_id or not session_id or not payload.get("sub"):
+        metrics.TOKEN_REFRESHES.labels("invalid").inc()
+        raise invalid
+    if refresh_tokens.is_revoked(session_id):
+        metrics.TOKEN_REFRESHES.labels("revoked").inc()
+        raise invalid
+
+    outcome = refresh_tokens.consume(token_id, session_id, payload["exp"])
+    if outcome == "reused":
+        logger.warning(f"Refresh token replayed for user '{payload['sub']}', revoking session")
+        metrics.TOKEN_REFRESHES.labels("reused").inc()
+        _revoke_session(session_id)
+        raise invalid
+
+    user = user_db.get_user_by_username(payload["sub"])
+    if user is None or not user.is_active:
+        metrics.TOKEN_REFRESHES.labels("inactive").inc()
+        _revoke_session(session_id)
+        raise invalid
+
+    metrics.TOKEN_REFRESHES.labels(outcome).inc()
+    return _issue_tokens(user, session_id)
+
+@app.post("/token/revoke")
+async def revoke_refresh_token(request: TokenRefresh):
+    """Log out: end the session of a refresh token, including its access tokens."""
+    payload = verify_token(request.refresh_token)
+    if payload.get("type") != "refresh" or not payload.get("sid"):
+        raise HTTPException(status_code=400, detail="Not a refresh token")
+    _revoke_session(payload["sid"])
+    return {"message": "Session revoked"}
+
 @app.post("/users/", response_model=UserInDB)
 async def create_user(user: UserCreate):
     # Check if username exists
@@ -192,13 +575,49 @@ async def change_password(
 
 # Admin endpoints
 @app.get("/users/", response_model=List[UserInDB])
-async def read_users(current_user: UserInDB = Depends(get_current_user)):
+async def read_users(
+    response: Response,
+    limit: int = 100,
+    cursor: int = 0,
+    role: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    search: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """One page of users, optionally filtered by role, active status and a
+    username/email prefix. When there are more, the X-Next-Cursor header holds
+    the value to pass as `cursor` for the next page."""
     if current_user.role not in ["admin", "superadmin"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
-    return user_db.get_all_users()
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    if role is not None and role not in ROLES:
+        raise HTTPException(status_code=400, detail=f"Unknown role: {role}")
+    users, next_cursor = user_db.list_users(limit, cursor, role, is_active, search)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return users
+
+@app.post("/users/import")
+async def import_users_file(file: UploadFile = File(...), current_user: UserInDB = Depends(get_current_user)):
+    """Create users in bulk from a CSV (header: username,email,password[,role,is_active])
+    or JSON array. Valid rows are created; the others are reported per row."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    # Admins cannot create superadmins
+    allowed_roles = ROLES if current_user.role == "superadmin" else ("user", "admin")
+    try:
+        rows = parse_user_file(await file.read(), file.filename or "")
+    except (UserImportError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return await asyncio.to_thread(import_users, user_db, rows, allowed_roles)
+    except Exception as e:
+        logger.error(f"Error in import_users_file: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/users/{user_id}", response_model=UserInDB)
 async def update_user(
@@ -241,6 +660,33 @@ async def delete_user(
         )
     return {"message": "User deleted successfully"}
 
+@app.get("/api/admin/queries")
+async def get_query_stats(
+    limit: int = 20,
+    order_by: str = "total_ms",
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """List the top-N traced statements by total time, plus the recent slow-query log."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    try:
+        statements = query_tracer.top(limit, order_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "enabled": query_tracer.enabled,
+        "slow_threshold_ms": query_tracer.slow_threshold_ms,
+        "statements": statements,
+        "slow_log": query_tracer.slow_log(limit)
+    }
+
+@app.delete("/api/admin/queries")
+async def reset_query_stats(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    query_tracer.reset()
+    return {"message": "Query statistics reset"}
+
 # Websocket endpoint
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -288,10 +734,29 @@ async def test_alert(current_user: UserInDB = Depends(get_current_user)):
     # Store in DB and get the full notification object with ID
     new_notification = user_db.create_notification(notification)
 
-    # Broadcast to all connected clients
-    await manager.broadcast(str(new_notification))
+    # Broadcast to all connected clients, on every worker
+    await broadcast(json.dumps(new_notification))
     return {"message": "Test alert sent", "data": new_notification}
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the worker is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: warm-up finished and the database is reachable."""
+    if not getattr(app.state, "warm", False):
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    if not await asyncio.to_thread(data_processor.db.ping):
+        return JSONResponse(status_code=503, content={"status": "database unavailable"})
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Expose application metrics in Prometheus text format."""
+    return Response(content=metrics.render_latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 @app.get("/")
 async def root():
     """Root endpoint returning API information."""
@@ -304,12 +769,453 @@ async def root():
 @app.get("/api/measurements/latest")
 async def get_latest_measurements(limit: int = 100) -> List[Dict[str, Any]]:
     """Get the latest measurements."""
+    if not 1 <= limit <= MAX_LATEST_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit must be between 1 and {MAX_LATEST_LIMIT}; use /api/measurements/export for more"
+        )
     try:
-        return data_processor.get_latest_measurements(limit)
+        # A ring buffer miss reads the database
+        return await asyncio.to_thread(_latest_measurements, limit)
     except Exception as e:
         logger.error(f"Error in get_latest_measurements: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/measurements/range")
+async def get_measurements_range(start: datetime, end: datetime = None) -> List[Dict[str, Any]]:
+    """Get raw measurements between start and end (default: now)."""
+    end = end or datetime.now()
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    try:
+        if recent_measurements.covers(start):
+            metrics.RING_BUFFER_READS.labels("buffer").inc()
+            return recent_measurements.between(start, end)
+        metrics.RING_BUFFER_READS.labels("database").inc()
+        return await asyncio.to_thread(data_processor.get_measurements_between, start, end)
+    except Exception as e:
+        logger.error(f"Error in get_measurements_range: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/measurements/series")
+async def get_sensor_series(sensors: str, start: datetime, end: datetime = None) -> List[Dict[str, Any]]:
+    """Measurements of the chosen sensors (comma-separated registry names) between
+    start and end (default: now), one row per timestamp."""
+    end = end or datetime.now()
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    sensor_list = [s.strip() for s in sensors.split(",") if s.strip()]
+    if not sensor_list:
+        raise HTTPException(status_code=400, detail="No sensors given")
+    try:
+        return await asyncio.to_thread(data_processor.get_sensor_series, sensor_list, start, end)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown sensors: {e.args[0]}")
+    except Exception as e:
+        logger.error(f"Error in get_sensor_series: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/measurements/export")
+async def export_measurements(start: datetime, end: datetime = None, format: str = "csv", gzip: bool = False):
+    """Stream raw measurements between start and end (default: now) as CSV (the
+    original meter format), NDJSON or Parquet, optionally gzip-compressed.
+
+    Rows are streamed from the database in fixed-size chunks, so memory use
+    doesn't depend on the size of the export."""
+    end = end or datetime.now()
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet":
+        if gzip:
+            raise HTTPException(status_code=400, detail="Parquet exports are already compressed")
+        if not parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+
+    # The CSV export only has the raw sensors so it can be imported again
+    columns = MEASUREMENT_COLUMNS[1:] if format == "csv" else INSERT_COLUMNS[1:]
+    encode = {"csv": csv_chunks, "ndjson": ndjson_chunks, "parquet": parquet_chunks}[format]
+    body = encode(data_processor.iter_measurements(start, end, columns), columns)
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"measurements_{start:%Y%m%d}_{end:%Y%m%d}.{extension}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}{".gz" if gzip else ""}"'}
+    if gzip:
+        body = gzip_chunks(body)
+        media_type = "application/gzip"
+    # A sync generator: Starlette iterates it in the threadpool, off the event loop
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+@app.get("/api/measurements/derived")
+async def get_derived_metrics():
+    """Definitions of the derived metrics stored alongside the raw sensors."""
+    return describe_derived_metrics()
+
+@app.get("/api/measurements/buffer")
+async def get_measurements_buffer_stats():
+    """Capacity, fill level and memory use of the recent-measurements buffer."""
+    return recent_measurements.stats()
+
+@app.get("/api/measurements/compare")
+async def compare_measurements(
+    period: str = "day",
+    baseline: str = "previous",
+    sensors: str = "power_consumption,solar_power,hydrogen_production",
+    day: Optional[date] = None
+):
+    """Compare the day/week/month containing `day` (default today) with the previous
+    period or the same period last year, per sensor, using the daily rollups."""
+    sensor_list = [s.strip() for s in sensors.split(",") if s.strip()]
+    unknown = await _unknown_rollup_sensors(sensor_list)
+    if unknown or not sensor_list:
+        raise HTTPException(status_code=400, detail=f"Unknown sensors: {', '.join(unknown) or '(none)'}")
+    anchor = day or date.today()
+    try:
+        current_start, current_end = period_bounds(period, anchor)
+        baseline_start, baseline_end = baseline_bounds(period, current_start, baseline)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def compute():
+        current = rollups.summarize(sensor_list, current_start, current_end)
+        previous = rollups.summarize(sensor_list, baseline_start, baseline_end)
+        return {
+            "period": period,
+            "baseline": baseline,
+            "current_range": {"start": current_start.isoformat(), "end": current_end.isoformat()},
+            "baseline_range": {"start": baseline_start.isoformat(), "end": baseline_end.isoformat()},
+            "sensors": compare_summaries(sensor_list, current, previous)
+        }
+
+    try:
+        key = (period, baseline, tuple(sensor_list), anchor)
+        return await asyncio.to_thread(compare_cache.get_or_compute, key, compute)
+    except Exception as e:
+        logger.error(f"Error in compare_measurements: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/measurements/rollups/rebuild")
+async def rebuild_rollups(current_user: UserInDB = Depends(get_current_user)):
+    """Recompute the rollups and quantile sketches from the raw measurements (e.g. after a bulk delete)."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    await asyncio.to_thread(rollups.rebuild)
+    await asyncio.to_thread(sketches.rebuild)
+    invalidate_measurement_caches()
+    bus.publish("invalidate")
+    return {"message": "Rollups and sketches rebuilt"}
+
+@app.get("/api/measurements/heatmap")
+async def get_measurement_heatmap(
+    sensor: str = "power_consumption",
+    start: Optional[date] = None,
+    end: Optional[date] = None
+):
+    """Average of a sensor per weekday × hour of day (7×24) between two dates
+    (default: the last four weeks), from the hourly rollups."""
+    if await _unknown_rollup_sensors([sensor]):
+        raise HTTPException(status_code=400, detail=f"Unknown sensor: {sensor}")
+    end = end or date.today()
+    start = start or end - timedelta(days=HEATMAP_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    def compute():
+        return {
+            "sensor": sensor,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            **rollups.heatmap(sensor, start, end)
+        }
+
+    try:
+        return await asyncio.to_thread(heatmap_cache.get_or_compute, (sensor, start, end), compute)
+    except Exception as e:
+        logger.error(f"Error in get_measurement_heatmap: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sketch_range(sensor: str, start: Optional[date], end: Optional[date]):
+    if sensor not in ROLLUP_SENSORS:
+        raise HTTPException(status_code=400, detail=f"Unknown sensor: {sensor}")
+    end = end or date.today()
+    start = start or end.replace(day=1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start, end
+
+async def _cached_sketch_result(key, compute):
+    try:
+        return await asyncio.to_thread(sketch_cache.get_or_compute, key, compute)
+    except Exception as e:
+        logger.error(f"Error computing sketch result {key[0]}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/measurements/quantiles")
+async def get_measurement_quantiles(
+    sensor: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    percentiles: str = "5,25,50,75,95,99"
+):
+    """Approximate percentiles of a sensor between two dates (default: this month),
+    merged from the per-day quantile sketches."""
+    start, end = _sketch_range(sensor, start, end)
+    try:
+        points = tuple(float(p) for p in percentiles.split(",") if p.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers")
+    if not points or any(p < 0 or p > 100 for p in points):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+
+    def compute():
+        digest = sketches.merged(sensor, start, end)
+        return {
+            "sensor": sensor,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "count": int(digest.count),
+            "min": digest.min if digest.count else None,
+            "max": digest.max if digest.count else None,
+            "quantiles": quantile_summary(digest, points)
+        }
+
+    return await _cached_sketch_result(("quantiles", sensor, start, end, points), compute)
+
+@app.get("/api/measurements/load-duration")
+async def get_load_duration_curve(
+    sensor: str = "power_consumption",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    points: int = 101
+):
+    """Load-duration curve: the value a sensor exceeds during x% of the time."""
+    start, end = _sketch_range(sensor, start, end)
+    if not 2 <= points <= 1001:
+        raise HTTPException(status_code=400, detail="points must be between 2 and 1001")
+
+    def compute():
+        digest = sketches.merged(sensor, start, end)
+        return {
+            "sensor": sensor,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "count": int(digest.count),
+            "curve": load_duration_curve(digest, points)
+        }
+
+    return await _cached_sketch_result(("load-duration", sensor, start, end, points), compute)
+
+@app.get("/api/measurements/histogram")
+async def get_measurement_histogram(
+    sensor: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    bins: int = 20
+):
+    """Approximate value distribution of a sensor in equal-width bins."""
+    start, end = _sketch_range(sensor, start, end)
+    if not 1 <= bins <= 200:
+        raise HTTPException(status_code=400, detail="bins must be between 1 and 200")
+
+    def compute():
+        digest = sketches.merged(sensor, start, end)
+        return {
+            "sensor": sensor,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "count": int(digest.count),
+            "bins": histogram(digest, bins)
+        }
+
+    return await _cached_sketch_result(("histogram", sensor, start, end, bins), compute)
+
+@app.get("/api/sensors")
+async def list_sensors():
+    """The sensor registry: built-in sensors and those registered from CSV imports."""
+    try:
+        sensors = await asyncio.to_thread(data_processor.sensors.all)
+    except Exception as e:
+        logger.error(f"Error in list_sensors: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return [sensor._asdict() for sensor in sensors]
+
+@app.put("/api/sensors/{name}")
+async def update_sensor(name: str, update: SensorUpdate, current_user: UserInDB = Depends(get_current_user)):
+    """Correct the label, unit, icon or kind guessed for a sensor."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    sensor = await asyncio.to_thread(data_processor.sensors.update, name, **update.dict())
+    if sensor is None:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+    bus.publish("sensors")
+    return sensor._asdict()
+
+@app.get("/api/ai/insights")
+async def get_ai_insights():
+    """Insights and alerts for the newest week of measurements.
+
+    The statistics are computed here; the LLM only sees that summary and is
+    asked at most once per data change, so repeated calls are cache hits."""
+    try:
+        return await asyncio.to_thread(insights.get)
+    except Exception as e:
+        logger.error(f"Error in get_ai_insights: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/tariffs")
+async def list_tariffs():
+    """Configured tariffs and the extent of their price schedules."""
+    return await asyncio.to_thread(tariffs.describe)
+
+@app.post("/api/tariffs/load")
+async def load_tariff(request: TariffLoad, current_user: UserInDB = Depends(get_current_user)):
+    """Create or replace a tariff from a price file in TARIFF_DIR (or, for a
+    fixed tariff, a single price) and recompute its cost rollups."""
+    import pandas as pd
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    if request.source:
+        path = os.path.join(TARIFF_DIR, request.source)
+        if os.path.basename(request.source) != request.source or not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail=f"Unknown tariff file: {request.source}")
+        try:
+            schedule = await asyncio.to_thread(read_tariff_csv, path, request.kind)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"{request.source}: {e}")
+    elif request.kind == "fixed" and request.price is not None:
+        schedule = pd.DataFrame({"valid_from": [pd.Timestamp("2000-01-01")], "price": [request.price]})
+    else:
+        raise HTTPException(status_code=400, detail="Give a source file (or a price for a fixed tariff)")
+    try:
+        tariff = await asyncio.to_thread(tariffs.save, request.name, request.kind, schedule, request.label)
+        await asyncio.to_thread(tariffs.rebuild, tariff)
+    except Exception as e:
+        logger.error(f"Error in load_tariff: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    cost_cache.invalidate()
+    bus.publish("tariffs")
+    return {**tariff._asdict(), "prices": len(schedule)}
+
+@app.put("/api/tariffs/{name}/activate")
+async def activate_tariff(name: str, current_user: UserInDB = Depends(get_current_user)):
+    """Use this tariff when a cost query names none."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    if tariffs.get(name) is None:
+        raise HTTPException(status_code=404, detail="Tariff not found")
+    tariff = await asyncio.to_thread(tariffs.activate, name)
+    cost_cache.invalidate()
+    bus.publish("tariffs")
+    return tariff._asdict()
+
+def _tariff_or_404(name: Optional[str]):
+    tariff = tariffs.get(name)
+    if tariff is None:
+        raise HTTPException(status_code=404, detail="Tariff not found" if name else "No tariff configured")
+    return tariff
+
+@app.get("/api/costs")
+async def get_costs(
+    start: date,
+    end: date,
+    group: str = "month",
+    tariff: Optional[str] = None
+):
+    """Consumption (kWh) and cost (EUR) per day or month under a tariff
+    (default: the active one), read from the daily and monthly cost rollups."""
+    if group not in COST_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group must be one of: {', '.join(COST_GROUPS)}")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    selected = _tariff_or_404(tariff)
+    try:
+        key = (selected.name, start, end, group)
+        return await asyncio.to_thread(
+            cost_cache.get_or_compute, key, lambda: tariffs.costs(selected, start, end, group)
+        )
+    except Exception as e:
+        logger.error(f"Error in get_costs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/costs/hourly")
+async def get_hourly_costs(
+    day: Optional[date] = None,
+    days: int = 1,
+    tariff: Optional[str] = None
+):
+    """Consumption, price and cost per hour from `day` (default today), for
+    dynamic tariffs where the price changes every hour."""
+    if not 1 <= days <= MAX_HOURLY_COST_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {MAX_HOURLY_COST_DAYS}")
+    selected = _tariff_or_404(tariff)
+    start = datetime.combine(day or date.today(), datetime.min.time())
+    end = start + timedelta(days=days)
+    try:
+        hours = await asyncio.to_thread(tariffs.hourly, selected, start, end)
+    except Exception as e:
+        logger.error(f"Error in get_hourly_costs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"tariff": selected.name, "kind": selected.kind, "hours": hours}
+
+@app.get("/api/simulate/parameters")
+async def get_simulation_parameters():
+    """Storage model parameters accepted by /api/simulate, with their defaults."""
+    return STORAGE_PARAMETERS
+
+@app.post("/api/simulate")
+async def simulate_storage(request: SimulationRequest):
+    """Replay measured solar production and consumption through a grid of
+    battery/hydrogen storage scenarios and report grid import, export and
+    self-sufficiency per scenario. List values in `parameters` are swept."""
+    # Default to the end of today rather than now, so repeated requests share
+    # a cache key; ingest invalidates the cache when today gets new data
+    end = request.end or datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+    start = request.start or end - timedelta(days=SIMULATION_DEFAULT_DAYS)
+    if not start < end or end - start > timedelta(days=MAX_SIMULATION_DAYS):
+        raise HTTPException(status_code=400, detail=f"start must be before end and at most {MAX_SIMULATION_DAYS} days earlier")
+    sweep = {name: value if isinstance(value, list) else [value] for name, value in request.parameters.items()}
+    try:
+        scenarios = scenario_grid(sweep)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        key = (start, end, tuple((name, tuple(values)) for name, values in sorted(sweep.items())))
+        return await asyncio.to_thread(
+            simulation_cache.get_or_compute, key, lambda: simulator.run(scenarios, start, end)
+        )
+    except Exception as e:
+        logger.error(f"Error in simulate_storage: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/admission")
+async def get_admission_stats(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return admission.stats()
+
+@app.get("/api/admin/bus")
+async def get_bus_stats(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return bus.stats()
+
+@app.get("/api/admin/replicas")
+async def get_replica_status(current_user: UserInDB = Depends(get_current_user)):
+    """Lag and availability of the read replicas (DB_REPLICAS)."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return {
+        "data": await asyncio.to_thread(data_processor.db.replica_status),
+        "users": await asyncio.to_thread(user_db.db.replica_status),
+        "sticky_seconds": sticky_sessions.window,
+    }
+
+@app.get("/api/admin/caches")
+async def get_cache_stats(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return cache_stats()
+
 @app.get("/api/measurements/daily")
 async def get_daily_aggregations(days: int = 30) -> List[Dict[str, Any]]:
     """Get daily aggregations for the specified number of days."""
@@ -319,33 +1225,145 @@ async def get_daily_aggregations(days: int = 30) -> List[Dict[str, Any]]:
         logger.error(f"Error in get_daily_aggregations: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/measurements/import")
-async def import_data():
-    """Import data from the CSV file."""
+@app.post("/api/measurements/import", status_code=status.HTTP_202_ACCEPTED)
+async def import_data(
+    source: str = "energy_consumption",
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Start a background import job for a CSV source and return its status."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    if source not in INGEST_SOURCES:
+        raise HTTPException(status_code=404, detail=f"Unknown import source: {source}")
+    try:
+        job = ingest_jobs.submit(source, INGEST_SOURCES[source])
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job.to_dict()
+
+@app.post("/api/measurements/import/spool", status_code=status.HTTP_202_ACCEPTED)
+async def import_spool(current_user: UserInDB = Depends(get_current_user)):
+    """Start a background job ingesting all CSV exports waiting in the spool directory."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    try:
+        job = ingest_jobs.submit("spool", spool.spool_dir, runner=spool.run_job(ingest_jobs), kind="spool")
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job.to_dict()
+
+@app.post("/api/measurements/upload")
+async def upload_measurements(file: UploadFile = File(...), current_user: UserInDB = Depends(get_current_user)):
+    """Ingest one meter export (tab-delimited CSV) posted by a site; returns its quality report.
+
+    For small, frequent batches from live meters; whole files go through the spool.
+    """
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    content = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(content) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload larger than {MAX_UPLOAD_BYTES} bytes")
+    def parse():
+        # Up to MAX_UPLOAD_BYTES of CSV; must not block the event loop either
+        return normalize_measurements(read_measurements_csv(io.BytesIO(content)))
+
     try:
-        df = data_processor.process_csv("data/energy_consumption.csv")
-        data_processor.insert_data(df)
-        return {"message": "Data imported successfully"}
+        df = await asyncio.to_thread(parse)
     except Exception as e:
-        logger.error(f"Error in import_data: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid measurements file: {e}")
+    try:
+        report = await asyncio.to_thread(data_processor.insert_data, df, f"upload:{file.filename or 'measurements'}")
+    except Exception as e:
+        logger.error(f"Error in upload_measurements: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    return {"rows": len(df), "report": report}
 
-# Device mapping: known columns to device names
-DEVICE_INFO_MAP = {
-    'Zonnepaneelspanning (V)': {'id': 'solar_voltage', 'label': 'Zonnepaneelspanning', 'icon': 'FiSun', 'unit': 'V'},
-    'Zonnepaneelstroom (A)': {'id': 'solar_current', 'label': 'Zonnepaneelstroom', 'icon': 'FiZap', 'unit': 'A'},
-    'Waterstofproductie (L/u)': {'id': 'hydrogen_production', 'label': 'Waterstofproductie', 'icon': 'FiDroplet', 'unit': 'L/u'},
-    'Stroomverbruik woning (kW)': {'id': 'power_consumption', 'label': 'Stroomverbruik woning', 'icon': 'FiHome', 'unit': 'kW'},
-    'Waterstofverbruik auto (L/u)': {'id': 'hydrogen_consumption', 'label': 'Waterstofverbruik auto', 'icon': 'FiTruck', 'unit': 'L/u'},
-    'Buitentemperatuur (°C)': {'id': 'outside_temperature', 'label': 'Buitentemperatuur', 'icon': 'FiThermometer', 'unit': '°C'},
-    'Binnentemperatuur (°C)': {'id': 'inside_temperature', 'label': 'Binnentemperatuur', 'icon': 'FiThermometer', 'unit': '°C'},
-    'Luchtdruk (hPa)': {'id': 'air_pressure', 'label': 'Luchtdruk', 'icon': 'FiWind', 'unit': 'hPa'},
-    'Luchtvochtigheid (%)': {'id': 'humidity', 'label': 'Luchtvochtigheid', 'icon': 'FiCloudRain', 'unit': '%'},
-    'Accuniveau (%)': {'id': 'battery_level', 'label': 'Accuniveau', 'icon': 'FiBattery', 'unit': '%'},
-    'CO2-concentratie binnen (ppm)': {'id': 'co2_level', 'label': 'CO2-concentratie binnen', 'icon': 'FiActivity', 'unit': 'ppm'},
-    'Waterstofopslag woning (%)': {'id': 'hydrogen_storage_house', 'label': 'Waterstofopslag woning', 'icon': 'FiBox', 'unit': '%'},
-    'Waterstofopslag auto (%)': {'id': 'hydrogen_storage_car', 'label': 'Waterstofopslag auto', 'icon': 'FiBox', 'unit': '%'},
-}
+@app.get("/api/measurements/import/jobs")
+async def list_import_jobs(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return [job.to_dict() for job in ingest_jobs.list()]
+
+@app.get("/api/measurements/import/jobs/{job_id}")
+async def get_import_job(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """Progress of an import job (rows, bytes, rate)."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    job = ingest_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.to_dict()
+
+@app.delete("/api/measurements/import/jobs/{job_id}")
+async def cancel_import_job(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """Cancel an import job; rows committed before cancellation are kept."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    job = ingest_jobs.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.to_dict()
+
+@app.get("/api/quality/reports")
+async def get_quality_reports(limit: int = 50, status: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    """Data-quality reports of the latest ingest batches, newest first."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    if not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    if status not in (None, "ok", "warning", "quarantined"):
+        raise HTTPException(status_code=400, detail="status must be ok, warning or quarantined")
+    try:
+        return await asyncio.to_thread(data_processor.quality.reports, limit, status)
+    except Exception as e:
+        logger.error(f"Error in get_quality_reports: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/quality/quarantine/{batch_id}")
+async def get_quarantined_rows(batch_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """The rows of a batch held back by validation, with the reason per row."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    try:
+        return await asyncio.to_thread(data_processor.quality.quarantined, batch_id)
+    except Exception as e:
+        logger.error(f"Error in get_quarantined_rows: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/quality/quarantine/{batch_id}/release")
+async def release_quarantined_rows(batch_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """Accept quarantined rows as they are: insert them without validation."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    try:
+        rows = await asyncio.to_thread(data_processor.release_quarantined, batch_id)
+    except Exception as e:
+        logger.error(f"Error in release_quarantined_rows: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not rows:
+        raise HTTPException(status_code=404, detail="No quarantined rows for this batch")
+    return {"message": f"{rows} rows released", "rows": rows}
+
+@app.delete("/api/quality/quarantine/{batch_id}")
+async def discard_quarantined_rows(batch_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """Drop quarantined rows for good."""
+    if current_user.role not in ["admin", "superadmin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    rows = await asyncio.to_thread(data_processor.quality.discard, batch_id)
+    if not rows:
+        raise HTTPException(status_code=404, detail="No quarantined rows for this batch")
+    return {"message": f"{rows} rows discarded", "rows": rows}
+
+def _device_info(column):
+    """Device metadata for a CSV column from the sensor registry, or None."""
+    try:
+        sensor = data_processor.sensors.get(column)
+    except Exception as e:
+        logger.warning(f"Sensor registry unavailable: {e}")
+        return None
+    if sensor is None:
+        return None
+    return {'id': sensor.name, 'label': sensor.label, 'icon': sensor.icon, 'unit': sensor.unit}
 
 IGNORE_COLUMNS = {'Tijdstip', 'timestamp'}
 
@@ -411,7 +1429,9 @@ def ai_guess_device(column_name):
         "hydrogen storage car": "Waterstofopslag auto",
         "hydrogen storage house": "Waterstofopslag woning"
     }
+    import requests
     try:
+        start = time.perf_counter()
         response = requests.post(
             MISTRAL_API_URL,
             headers={"Authorization": f"Bearer {MISTRAL_API_KEY}"},
@@ -425,6 +1445,8 @@ def ai_guess_device(column_name):
                 "temperature": 0.1
             }
         )
+        metrics.EXTERNAL_CALL_DURATION.labels("mistral").observe(time.perf_counter() - start)
+        metrics.EXTERNAL_CALLS.labels("mistral", response.status_code).inc()
         if response.status_code == 200:
             result = response.json().get('choices', [{}])[0].get('message', {}).get('content')
             import re
@@ -482,6 +1504,7 @@ def ai_guess_device(column_name):
                     unit = fallback_units.get(column_name.lower(), '')
                 return {'label': label, 'unit': unit, 'icon': icon}
     except Exception as e:
+        metrics.EXTERNAL_CALLS.labels("mistral", "error").inc()
         logger.error(f"Mistral API error: {e}")
     # Fallback
     return {
@@ -533,7 +1556,7 @@ async def get_devices_usage():
             })
             continue
         # Sensoren: gemiddelde waarde
-        info = DEVICE_INFO_MAP.get(col)
+        info = _device_info(col)
         if info:
             label = info['label']
             icon = info['icon']
@@ -561,6 +1584,7 @@ async def get_devices_usage():
 
 @app.get("/api/devices/current")
 async def get_devices_current():
+    import pandas as pd
     df = data_processor.process_csv("data/energy_consumption.csv")
     devices = []
     # Sorteer op tijdstip als kolom bestaat
@@ -569,11 +1593,11 @@ async def get_devices_current():
             df['Tijdstip'] = pd.to_datetime(df['Tijdstip'], dayfirst=True, errors='coerce')
             df = df.sort_values('Tijdstip')
         except Exception as e:
-            print('DEBUG: Fout bij sorteren op Tijdstip:', e)
+            logger.debug(f"Fout bij sorteren op Tijdstip: {e}")
     for col in df.columns:
         if col in IGNORE_COLUMNS:
             continue
-        info = DEVICE_INFO_MAP.get(col)
+        info = _device_info(col)
         if info:
             label = info['label']
             icon = info['icon']
@@ -592,10 +1616,10 @@ async def get_devices_current():
             tijdstip = None
             if 'Tijdstip' in df.columns:
                 tijdstip = df.loc[df[col].dropna().index[-1], 'Tijdstip']
-            print(f'DEBUG: {col} -> {current} (tijdstip: {tijdstip})')
+            logger.debug(f"{col} -> {current} (tijdstip: {tijdstip})")
             usage_str = f"{current:,.2f}".replace(",", "X", 1).replace(".", ",").replace("X", ".")
         except Exception as e:
-            print(f'DEBUG: Fout bij {col}:', e)
+            logger.debug(f"Fout bij {col}: {e}")
             usage_str = ''
         devices.append({
             'id': device_id,
@@ -606,12 +1630,6 @@ async def get_devices_current():
         })
     return devices
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Clean up resources on shutdown."""
-    data_processor.close()
-    user_db.connection.close()
-
 # Remove debug prints for Mistral API
 # print('DEBUG: MISTRAL_API_URL:', MISTRAL_API_URL)
 # print('DEBUG: MISTRAL_API_KEY:', MISTRAL_API_KEY) 
\ No newline at end of file
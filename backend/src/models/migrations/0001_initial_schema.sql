@@ -1,6 +1,5 @@
--- Create database if not exists
-CREATE DATABASE IF NOT EXISTS energydashboard;
-USE energydashboard;
+-- Initial schema. The database itself is created by the migration runner
+-- (DB_NAME), so this file only creates objects inside it.
 
 -- Create users table
 CREATE TABLE IF NOT EXISTS users (
@@ -0,0 +1,22 @@
+"""Add the derived metric columns to measurements and daily_aggregations."""
+
+DERIVED_COLUMNS = [
+    'solar_power',
+    'net_balance',
+    'hydrogen_per_kwh',
+    'battery_level_rate',
+    'hydrogen_storage_house_rate',
+]
+
+
+def upgrade(ctx):
+    # Databases created from a recent schema.sql already have them
+    for table, prefix in (('measurements', ''), ('daily_aggregations', 'avg_')):
+        missing = [f"{prefix}{column}" for column in DERIVED_COLUMNS
+                   if not ctx.column_exists(table, f"{prefix}{column}")]
+        if missing:
+            # Appending nullable columns is an instant/in-place change in InnoDB
+            ctx.execute(
+                f"ALTER TABLE {table} "
+                + ", ".join(f"ADD COLUMN {column} DECIMAL(10,2)" for column in missing)
+            )
@@ -0,0 +1,74 @@
+-- Recreate the daily aggregation event so it also averages the derived metrics
+DROP EVENT IF EXISTS update_daily_aggregations;
+
+DELIMITER //
+CREATE EVENT update_daily_aggregations
+ON SCHEDULE EVERY 1 DAY
+STARTS CURRENT_DATE + INTERVAL 1 DAY
+DO
+BEGIN
+    INSERT INTO daily_aggregations (
+        date,
+        avg_solar_voltage,
+        avg_solar_current,
+        avg_hydrogen_production,
+        avg_power_consumption,
+        avg_hydrogen_consumption,
+        avg_outside_temperature,
+        avg_inside_temperature,
+        avg_air_pressure,
+        avg_humidity,
+        avg_battery_level,
+        avg_co2_level,
+        avg_hydrogen_storage_house,
+        avg_hydrogen_storage_car,
+        avg_solar_power,
+        avg_net_balance,
+        avg_hydrogen_per_kwh,
+        avg_battery_level_rate,
+        avg_hydrogen_storage_house_rate
+    )
+    SELECT 
+        DATE(timestamp),
+        AVG(solar_voltage),
+        AVG(solar_current),
+        AVG(hydrogen_production),
+        AVG(power_consumption),
+        AVG(hydrogen_consumption),
+        AVG(outside_temperature),
+        AVG(inside_temperature),
+        AVG(air_pressure),
+        AVG(humidity),
+        AVG(battery_level),
+        AVG(co2_level),
+        AVG(hydrogen_storage_house),
+        AVG(hydrogen_storage_car),
+        AVG(solar_power),
+        AVG(net_balance),
+        AVG(hydrogen_per_kwh),
+        AVG(battery_level_rate),
+        AVG(hydrogen_storage_house_rate)
+    FROM measurements
+    WHERE DATE(timestamp) = DATE_SUB(CURRENT_DATE, INTERVAL 1 DAY)
+    GROUP BY DATE(timestamp)
+    ON DUPLICATE KEY UPDATE
+        avg_solar_voltage = VALUES(avg_solar_voltage),
+        avg_solar_current = VALUES(avg_solar_current),
+        avg_hydrogen_production = VALUES(avg_hydrogen_production),
+        avg_power_consumption = VALUES(avg_power_consumption),
+        avg_hydrogen_consumption = VALUES(avg_hydrogen_consumption),
+        avg_outside_temperature = VALUES(avg_outside_temperature),
+        avg_inside_temperature = VALUES(avg_inside_temperature),
+        avg_air_pressure = VALUES(avg_air_pressure),
+        avg_humidity = VALUES(avg_humidity),
+        avg_battery_level = VALUES(avg_battery_level),
+        avg_co2_level = VALUES(avg_co2_level),
+        avg_hydrogen_storage_house = VALUES(avg_hydrogen_storage_house),
+        avg_hydrogen_storage_car = VALUES(avg_hydrogen_storage_car),
+        avg_solar_power = VALUES(avg_solar_power),
+        avg_net_balance = VALUES(avg_net_balance),
+        avg_hydrogen_per_kwh = VALUES(avg_hydrogen_per_kwh),
+        avg_battery_level_rate = VALUES(avg_battery_level_rate),
+        avg_hydrogen_storage_house_rate = VALUES(avg_hydrogen_storage_house_rate);
+END //
+DELIMITER ;
@@ -0,0 +1,20 @@
+-- Create daily per-sensor rollups (maintained on ingest)
+CREATE TABLE IF NOT EXISTS measurement_rollups_daily (
+    date DATE NOT NULL,
+    sensor VARCHAR(64) NOT NULL,
+    value_sum DOUBLE NOT NULL,
+    value_count INT NOT NULL,
+    value_min DOUBLE,
+    value_max DOUBLE,
+    PRIMARY KEY (date, sensor),
+    INDEX idx_sensor_date (sensor, date)
+) ENGINE=InnoDB;
+
+-- Mergeable quantile sketch (t-digest) per sensor per day
+CREATE TABLE IF NOT EXISTS sensor_sketches (
+    date DATE NOT NULL,
+    sensor VARCHAR(64) NOT NULL,
+    digest BLOB NOT NULL,
+    PRIMARY KEY (date, sensor),
+    INDEX idx_sensor_date (sensor, date)
+) ENGINE=InnoDB;
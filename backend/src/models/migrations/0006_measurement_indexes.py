@@ -0,0 +1,37 @@
+"""Re-index measurements for ingest speed, online.
+
+idx_power_consumption and idx_solar_voltage slow down every insert and no
+query filters on those values. The non-unique timestamp index is replaced
+by a unique key so a batch that is imported twice updates its rows instead
+of duplicating them.
+
+Both statements run with ALGORITHM=INPLACE, LOCK=NONE: reads and inserts
+continue while InnoDB rebuilds the index. MySQL refuses the statement
+rather than silently locking the table if that isn't possible.
+"""
+
+ONLINE = "ALGORITHM=INPLACE, LOCK=NONE"
+
+
+def upgrade(ctx):
+    drops = [f"DROP INDEX {index}" for index in ('idx_power_consumption', 'idx_solar_voltage')
+             if ctx.index_exists('measurements', index)]
+    if drops:
+        ctx.execute(f"ALTER TABLE measurements {', '.join(drops)}, {ONLINE}")
+
+    if ctx.index_exists('measurements', 'uq_timestamp'):
+        return
+    duplicates = ctx.query_value("""
+        SELECT COUNT(*) FROM (
+            SELECT timestamp FROM measurements GROUP BY timestamp HAVING COUNT(*) > 1
+        ) AS d
+    """)
+    if duplicates:
+        raise ctx.error(
+            f"measurements has {duplicates} duplicated timestamps; remove the duplicates "
+            "(keep one row per timestamp) and run the migrations again"
+        )
+    changes = ["ADD UNIQUE KEY uq_timestamp (timestamp)"]
+    if ctx.index_exists('measurements', 'idx_timestamp'):
+        changes.append("DROP INDEX idx_timestamp")
+    ctx.execute(f"ALTER TABLE measurements {', '.join(changes)}, {ONLINE}")
@@ -0,0 +1,45 @@
+-- Sensor registry: one row per sensor, whether stored as a measurements
+-- column ('wide') or as rows in measurement_values ('narrow')
+CREATE TABLE IF NOT EXISTS sensors (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(64) NOT NULL,
+    source_column VARCHAR(255) NULL,
+    label VARCHAR(255) NOT NULL,
+    unit VARCHAR(32) NOT NULL DEFAULT '',
+    icon VARCHAR(32) NOT NULL DEFAULT 'FiCpu',
+    kind ENUM('rate', 'level', 'instantaneous') NOT NULL DEFAULT 'instantaneous',
+    storage ENUM('wide', 'narrow') NOT NULL DEFAULT 'narrow',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_name (name),
+    UNIQUE KEY uq_source_column (source_column)
+) ENGINE=InnoDB;
+
+-- Narrow storage: adding a sensor adds rows, never columns
+CREATE TABLE IF NOT EXISTS measurement_values (
+    sensor_id SMALLINT UNSIGNED NOT NULL,
+    timestamp DATETIME NOT NULL,
+    value DOUBLE NOT NULL,
+    PRIMARY KEY (sensor_id, timestamp),
+    CONSTRAINT fk_measurement_values_sensor FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+) ENGINE=InnoDB;
+
+-- The sensors that already have a column in measurements
+INSERT IGNORE INTO sensors (name, source_column, label, unit, icon, kind, storage) VALUES
+    ('solar_voltage', 'Zonnepaneelspanning (V)', 'Zonnepaneelspanning', 'V', 'FiSun', 'instantaneous', 'wide'),
+    ('solar_current', 'Zonnepaneelstroom (A)', 'Zonnepaneelstroom', 'A', 'FiZap', 'instantaneous', 'wide'),
+    ('hydrogen_production', 'Waterstofproductie (L/u)', 'Waterstofproductie', 'L/u', 'FiDroplet', 'rate', 'wide'),
+    ('power_consumption', 'Stroomverbruik woning (kW)', 'Stroomverbruik woning', 'kW', 'FiHome', 'rate', 'wide'),
+    ('hydrogen_consumption', 'Waterstofverbruik auto (L/u)', 'Waterstofverbruik auto', 'L/u', 'FiTruck', 'rate', 'wide'),
+    ('outside_temperature', 'Buitentemperatuur (°C)', 'Buitentemperatuur', '°C', 'FiThermometer', 'instantaneous', 'wide'),
+    ('inside_temperature', 'Binnentemperatuur (°C)', 'Binnentemperatuur', '°C', 'FiThermometer', 'instantaneous', 'wide'),
+    ('air_pressure', 'Luchtdruk (hPa)', 'Luchtdruk', 'hPa', 'FiWind', 'instantaneous', 'wide'),
+    ('humidity', 'Luchtvochtigheid (%)', 'Luchtvochtigheid', '%', 'FiCloudRain', 'instantaneous', 'wide'),
+    ('battery_level', 'Accuniveau (%)', 'Accuniveau', '%', 'FiBattery', 'level', 'wide'),
+    ('co2_level', 'CO2-concentratie binnen (ppm)', 'CO2-concentratie binnen', 'ppm', 'FiActivity', 'instantaneous', 'wide'),
+    ('hydrogen_storage_house', 'Waterstofopslag woning (%)', 'Waterstofopslag woning', '%', 'FiBox', 'level', 'wide'),
+    ('hydrogen_storage_car', 'Waterstofopslag auto (%)', 'Waterstofopslag auto', '%', 'FiBox', 'level', 'wide'),
+    ('solar_power', NULL, 'Zonnevermogen', 'W', 'FiSun', 'rate', 'wide'),
+    ('net_balance', NULL, 'Netto balans', 'kW', 'FiActivity', 'rate', 'wide'),
+    ('hydrogen_per_kwh', NULL, 'Waterstof per kWh', 'L/kWh', 'FiDroplet', 'instantaneous', 'wide'),
+    ('battery_level_rate', NULL, 'Verandering accuniveau', '%/u', 'FiBattery', 'rate', 'wide'),
+    ('hydrogen_storage_house_rate', NULL, 'Verandering waterstofopslag woning', '%/u', 'FiBox', 'rate', 'wide');
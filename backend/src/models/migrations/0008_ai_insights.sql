@@ -0,0 +1,11 @@
+-- LLM answers per measurement summary fingerprint, shared by all workers.
+-- A 'pending' row is a claim by the worker currently calling the LLM.
+CREATE TABLE IF NOT EXISTS ai_insights (
+    fingerprint CHAR(40) PRIMARY KEY,
+    status ENUM('pending', 'done') NOT NULL DEFAULT 'pending',
+    provider VARCHAR(32),
+    result JSON,
+    claimed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_status_created (status, created_at)
+) ENGINE=InnoDB;
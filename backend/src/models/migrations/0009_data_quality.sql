@@ -0,0 +1,31 @@
+-- One data-quality report per validated ingest batch
+CREATE TABLE IF NOT EXISTS data_quality_reports (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    batch_id CHAR(32) NOT NULL,
+    source VARCHAR(255),
+    status ENUM('ok', 'warning', 'quarantined') NOT NULL,
+    rows_in INT NOT NULL,
+    rows_written INT NOT NULL,
+    duplicates INT NOT NULL DEFAULT 0,
+    off_grid INT NOT NULL DEFAULT 0,
+    gaps INT NOT NULL DEFAULT 0,
+    missing_slots INT NOT NULL DEFAULT 0,
+    out_of_range INT NOT NULL DEFAULT 0,
+    interpolated INT NOT NULL DEFAULT 0,
+    quarantined_rows INT NOT NULL DEFAULT 0,
+    details JSON,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_batch_id (batch_id),
+    INDEX idx_status (status, id)
+) ENGINE=InnoDB;
+
+-- Rows held back by validation, as read from the file, until released or discarded
+CREATE TABLE IF NOT EXISTS measurement_quarantine (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    batch_id CHAR(32) NOT NULL,
+    timestamp DATETIME NULL,
+    reason VARCHAR(1024) NOT NULL,
+    payload JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_batch (batch_id, id)
+) ENGINE=InnoDB;
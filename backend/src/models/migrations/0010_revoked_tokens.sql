@@ -0,0 +1,8 @@
+-- Refresh tokens that were already exchanged ('token', by jti) and revoked
+-- login sessions ('session', by sid), kept until what they cover expires
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    token_id CHAR(32) PRIMARY KEY,
+    kind ENUM('token', 'session') NOT NULL,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_expires_at (expires_at)
+) ENGINE=InnoDB;
@@ -0,0 +1,40 @@
+-- Price schedules: fixed and dynamic tariffs are (valid_from, price) steps,
+-- time-of-use tariffs a weekly pattern of (weekday, start minute, price)
+CREATE TABLE IF NOT EXISTS tariffs (
+    id SMALLINT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(64) NOT NULL UNIQUE,
+    kind ENUM('fixed', 'tou', 'dynamic') NOT NULL,
+    label VARCHAR(255) NOT NULL,
+    active BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS tariff_prices (
+    tariff_id SMALLINT NOT NULL,
+    valid_from DATETIME NOT NULL,
+    price DOUBLE NOT NULL,
+    PRIMARY KEY (tariff_id, valid_from),
+    FOREIGN KEY (tariff_id) REFERENCES tariffs(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS tariff_periods (
+    tariff_id SMALLINT NOT NULL,
+    weekday TINYINT NOT NULL,
+    start_minute SMALLINT NOT NULL,
+    price DOUBLE NOT NULL,
+    PRIMARY KEY (tariff_id, weekday, start_minute),
+    FOREIGN KEY (tariff_id) REFERENCES tariffs(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Consumption (kWh) and cost (EUR) per tariff per day and per month,
+-- maintained on ingest
+CREATE TABLE IF NOT EXISTS energy_costs (
+    tariff_id SMALLINT NOT NULL,
+    period ENUM('day', 'month') NOT NULL,
+    period_start DATE NOT NULL,
+    kwh DOUBLE NOT NULL,
+    unpriced_kwh DOUBLE NOT NULL DEFAULT 0,
+    cost DOUBLE NOT NULL,
+    PRIMARY KEY (tariff_id, period, period_start),
+    FOREIGN KEY (tariff_id) REFERENCES tariffs(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
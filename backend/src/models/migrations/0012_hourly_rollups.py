@@ -0,0 +1,56 @@
+"""Add hourly per-sensor rollups and fill them from the existing measurements.
+
+Same shape as measurement_rollups_daily (additive sum/count), one row per
+sensor per hour of a day; the weekday × hour heatmap is built from these.
+Narrow-storage sensors (measurement_values) are filled under their name,
+and get the daily rollups they were missing too.
+"""
+
+ROLLUP_SENSORS = [
+    'solar_voltage', 'solar_current', 'hydrogen_production', 'power_consumption',
+    'hydrogen_consumption', 'outside_temperature', 'inside_temperature', 'air_pressure',
+    'humidity', 'battery_level', 'co2_level', 'hydrogen_storage_house', 'hydrogen_storage_car',
+    'solar_power', 'net_balance', 'hydrogen_per_kwh', 'battery_level_rate',
+    'hydrogen_storage_house_rate',
+]
+
+
+def upgrade(ctx):
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS measurement_rollups_hourly (
+            date DATE NOT NULL,
+            hour TINYINT UNSIGNED NOT NULL,
+            sensor VARCHAR(64) NOT NULL,
+            value_sum DOUBLE NOT NULL,
+            value_count INT NOT NULL,
+            PRIMARY KEY (date, hour, sensor),
+            INDEX idx_sensor_date (sensor, date)
+        ) ENGINE=InnoDB
+    """)
+    if ctx.query_value("SELECT COUNT(*) FROM measurement_rollups_hourly"):
+        return
+    for sensor in ROLLUP_SENSORS:
+        if not ctx.column_exists('measurements', sensor):
+            continue
+        ctx.execute(f"""
+            INSERT INTO measurement_rollups_hourly (date, hour, sensor, value_sum, value_count)
+            SELECT DATE(timestamp), HOUR(timestamp), %s, SUM({sensor}), COUNT({sensor})
+            FROM measurements
+            WHERE {sensor} IS NOT NULL
+            GROUP BY DATE(timestamp), HOUR(timestamp)
+        """, (sensor,))
+    ctx.execute("""
+        INSERT INTO measurement_rollups_hourly (date, hour, sensor, value_sum, value_count)
+        SELECT DATE(v.timestamp), HOUR(v.timestamp), s.name, SUM(v.value), COUNT(*)
+        FROM measurement_values v JOIN sensors s ON s.id = v.sensor_id
+        WHERE s.storage = 'narrow'
+        GROUP BY DATE(v.timestamp), HOUR(v.timestamp), s.name
+    """)
+    ctx.execute("""
+        INSERT IGNORE INTO measurement_rollups_daily
+            (date, sensor, value_sum, value_count, value_min, value_max)
+        SELECT DATE(v.timestamp), s.name, SUM(v.value), COUNT(*), MIN(v.value), MAX(v.value)
+        FROM measurement_values v JOIN sensors s ON s.id = v.sensor_id
+        WHERE s.storage = 'narrow'
+        GROUP BY DATE(v.timestamp), s.name
+    """)
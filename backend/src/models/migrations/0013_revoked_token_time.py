@@ -0,0 +1,12 @@
+"""Record when a refresh token was exchanged.
+
+Another tab or a retried request may present the token again right after
+it was rotated; /token/refresh accepts that for a short grace window
+instead of treating it as a replay. Older entries have no time and get
+no grace.
+"""
+
+
+def upgrade(ctx):
+    if not ctx.column_exists('revoked_tokens', 'revoked_at'):
+        ctx.execute("ALTER TABLE revoked_tokens ADD COLUMN revoked_at DATETIME NULL")
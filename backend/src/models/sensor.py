@@ -0,0 +1,8 @@
+from pydantic import BaseModel, constr
+from typing import Literal, Optional
+
+class SensorUpdate(BaseModel):
+    label: Optional[constr(min_length=1, max_length=255)] = None
+    unit: Optional[constr(max_length=32)] = None
+    icon: Optional[constr(min_length=1, max_length=32)] = None
+    kind: Optional[Literal["rate", "level", "instantaneous"]] = None
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Union
+from datetime import datetime
+
+class SimulationRequest(BaseModel):
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    # Storage parameter -> value, or list of values to sweep; the scenarios
+    # are every combination of the lists
+    parameters: Dict[str, Union[float, List[float]]] = {}
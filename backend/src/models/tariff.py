@@ -0,0 +1,10 @@
+from pydantic import BaseModel, confloat, constr
+from typing import Literal, Optional
+
+class TariffLoad(BaseModel):
+    name: constr(pattern=r'^[a-z0-9_]{1,64}$')
+    kind: Literal["fixed", "tou", "dynamic"]
+    # A file in TARIFF_DIR; a fixed tariff may give a single price instead
+    source: Optional[constr(min_length=1, max_length=255)] = None
+    price: Optional[confloat(ge=0)] = None
+    label: Optional[constr(min_length=1, max_length=255)] = None
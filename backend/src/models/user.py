@@ -40,6 +40,9 @@ class Token(BaseModel):
     refresh_token: str
     token_type: str = "bearer"
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
 class TokenData(BaseModel):
     username: Optional[str] = None
     role: Optional[str] = None 
\ No newline at end of file
@@ -0,0 +1,206 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from .auth import token_subject
+from .metrics import ADMISSION_BUCKETS, ADMISSION_DECISIONS, ADMISSION_IN_FLIGHT
+
+
+class RoutePolicy(NamedTuple):
+    """Admission settings for one route template, or one method of it."""
+    cost: float = 1.0                     # tokens taken from the caller's bucket
+    max_concurrent: Optional[int] = None  # requests in progress across all callers
+
+
+DEFAULT_POLICY = RoutePolicy()
+
+# Never limited: probes and scrapes must keep working under load
+EXEMPT_ROUTES = {"/healthz", "/readyz", "/metrics"}
+
+
+class TokenBuckets:
+    """Token buckets per key (user or client IP), refilled continuously.
+
+    Only recently seen keys are kept; a bucket evicted after ``max_keys``
+    newer keys would have been full again anyway.
+    """
+
+    def __init__(self, kind: str, rate: float, burst: float, max_keys: int = 10000):
+        self.kind = kind
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = ADMISSION_BUCKETS.labels(kind)
+
+    def take(self, key: str, cost: float) -> float:
+        """Take cost tokens; return 0 if admitted, else seconds until they'd be available."""
+        now = time.monotonic()
+        cost = min(cost, self.burst)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                self._size.set(len(self._buckets))
+            else:
+                self._buckets.move_to_end(key)
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                return 0.0
+            bucket[0] = tokens
+            return (cost - tokens) / self.rate
+
+
+class AdmissionController:
+    """Decides whether a request may start, before it reaches its handler.
+
+    Callers are identified by the subject of a valid bearer token, otherwise
+    by client address (run uvicorn with ``--proxy-headers`` behind a proxy).
+    Each request costs its route's weight in tokens; routes with
+    ``max_concurrent`` additionally shed requests while that many are running.
+    Policies are keyed by route template (``"/users/"``, any method) or by
+    method and template (``"POST /users/"``), which takes precedence.
+    """
+
+    def __init__(self, policies: Dict[str, RoutePolicy] = None,
+                 user_rate: float = None, user_burst: float = None,
+                 ip_rate: float = None, ip_burst: float = None,
+                 enabled: bool = None):
+        if enabled is None:
+            enabled = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self.policies = dict(policies or {})
+        self.users = TokenBuckets(
+            "user",
+            user_rate or float(os.getenv("ADMISSION_USER_RATE", "10")),
+            user_burst or float(os.getenv("ADMISSION_USER_BURST", "40")),
+        )
+        self.ips = TokenBuckets(
+            "ip",
+            ip_rate or float(os.getenv("ADMISSION_IP_RATE", "5")),
+            ip_burst or float(os.getenv("ADMISSION_IP_BURST", "20")),
+        )
+        self._in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def policy_key(self, method: str, route: str) -> str:
+        """The policies key that applies to a request (also its concurrency slot)."""
+        key = f"{method} {route}"
+        return key if key in self.policies else route
+
+    def policy(self, key: str) -> RoutePolicy:
+        return self.policies.get(key, DEFAULT_POLICY)
+
+    def admit(self, key: str, user: Optional[str], client_ip: str) -> Tuple[bool, float, str]:
+        """Return (admitted, retry_after_seconds, outcome) for a ``policy_key``."""
+        policy = self.policy(key)
+        # Concurrency first: a request turned away for it keeps its tokens
+        if policy.max_concurrent is not None:
+            with self._lock:
+                running = self._in_flight.get(key, 0)
+                if running >= policy.max_concurrent:
+                    return False, 1.0, "concurrency_limited"
+                self._in_flight[key] = running + 1
+        if user:
+            wait = self.users.take(user, policy.cost)
+        else:
+            wait = self.ips.take(client_ip, policy.cost)
+        if wait:
+            if policy.max_concurrent is not None:
+                with self._lock:
+                    self._in_flight[key] -= 1
+            return False, wait, "rate_limited"
+        if policy.max_concurrent is not None:
+            ADMISSION_IN_FLIGHT.labels(key).inc()
+        return True, 0.0, "admitted"
+
+    def release(self, key: str):
+        if self.policy(key).max_concurrent is None:
+            return
+        with self._lock:
+            self._in_flight[key] -= 1
+        ADMISSION_IN_FLIGHT.labels(key).dec()
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = dict(self._in_flight)
+        return {
+            "enabled": self.enabled,
+            "user_bucket": {"rate": self.users.rate, "burst": self.users.burst},
+            "ip_bucket": {"rate": self.ips.rate, "burst": self.ips.burst},
+            "policies": {key: p._asdict() for key, p in self.policies.items()},
+            "in_flight": in_flight,
+        }
+
+
+def _bearer_subject(scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token_subject(token)
+    return None
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that sheds over-limit requests with 429 and Retry-After.
+
+    The route template is resolved against the router up front, so limits
+    apply per template (``/users/{user_id}``) and are checked before the
+    request body is read or any handler work (database, bcrypt) starts.
+    """
+
+    def __init__(self, app, controller: AdmissionController, router):
+        self.app = app
+        self.controller = controller
+        self.router = router
+
+    def _route(self, scope):
+        partial = None
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+            if match == Match.PARTIAL and partial is None:
+                # Path matches but the method doesn't; the router will answer 405
+                partial = route
+        return partial
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+        matched = self._route(scope)
+        route = matched.path if matched is not None else "unmatched"
+        if route in EXEMPT_ROUTES or scope.get("method") == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = (scope.get("client") or ("unknown",))[0]
+        key = self.controller.policy_key(scope.get("method"), route)
+        admitted, retry_after, outcome = self.controller.admit(key, _bearer_subject(scope), client_ip)
+        ADMISSION_DECISIONS.labels(route, outcome).inc()
+        if not admitted:
+            if matched is not None:
+                # Lets the request metrics label shed requests by route too
+                scope["route"] = matched
+            response = JSONResponse(
+                {"detail": "Too many requests, please retry later"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(key)
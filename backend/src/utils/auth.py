@@ -4,6 +4,7 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
 import os
+import secrets
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -38,11 +39,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def new_token_id() -> str:
+    """Random id for a refresh token (jti) or a login session (sid)."""
+    return secrets.token_hex(16)
+
 def create_refresh_token(data: dict) -> str:
-    """Create a new JWT refresh token."""
+    """Create a new JWT refresh token.
+
+    Every refresh token gets its own id, so the server can accept it once
+    and rotate it; ``data`` should carry the session id (``sid``).
+    """
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": new_token_id(), "type": "refresh"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -56,4 +65,11 @@ def verify_token(token: str) -> dict:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        ) 
\ No newline at end of file
+        ) 
+
+def token_subject(token: str) -> Optional[str]:
+    """Return the subject of a valid token, or None (never raises)."""
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
@@ -0,0 +1,377 @@
+import asyncio
+import fcntl
+import inspect
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+from .metrics import BUS_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+# Frames are JSON lines; measurement batches can be large
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+# A broker client whose unsent output grows beyond this is dropped
+MAX_CLIENT_BACKLOG = 4 * 1024 * 1024
+
+# Frames published while disconnected are held up to this size, oldest dropped first
+MAX_PENDING_BYTES = 4 * 1024 * 1024
+
+RECONNECT_DELAY = 0.5
+
+
+class MessageBus:
+    """Pub/sub between the worker processes of one deployment.
+
+    ``publish`` delivers to the subscribers in every *other* worker; the
+    publishing worker handles its own copy locally, without a round trip.
+    It is thread-safe, so ingest threads can publish directly. Handlers run
+    on the event loop and may be plain functions or coroutine functions.
+
+    Frames published while the connection is down are held and sent on
+    reconnect. Frames from other workers can still be missed in the
+    meantime, so resync listeners run on every (re)connect to reload
+    whatever state the bus keeps in sync.
+
+    This base class is the single-process bus: nothing leaves the process.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Callable[[Any], Any]]] = defaultdict(list)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._resync_listeners: List[Callable[[], Any]] = []
+        self._pending = deque()  # (channel, frame) waiting for a connection
+        self._pending_bytes = 0
+
+    @property
+    def backend(self) -> str:
+        return "local"
+
+    def subscribe(self, channel: str, handler: Callable[[Any], Any]):
+        self._handlers[channel].append(handler)
+
+    def add_resync_listener(self, listener: Callable[[], Any]):
+        """Call ``listener()`` on the event loop whenever the bus (re)connects."""
+        self._resync_listeners.append(listener)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    async def close(self):
+        pass
+
+    def publish(self, channel: str, data: Any = None):
+        if self._loop is None:
+            return
+        frame = json.dumps({"origin": self.origin, "channel": channel, "data": data})
+        BUS_MESSAGES.labels(channel, "published").inc()
+        if self._in_loop_thread():
+            self._send(channel, frame)
+        else:
+            self._loop.call_soon_threadsafe(self._send, channel, frame)
+
+    def _in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _send(self, channel: str, frame: str):
+        """Hand a frame to the backend (called on the event loop)."""
+
+    def _hold(self, channel: str, frame: str):
+        """Keep a frame for the next connection."""
+        self._pending.append((channel, frame))
+        self._pending_bytes += len(frame)
+        BUS_MESSAGES.labels(channel, "held").inc()
+        while self._pending_bytes > MAX_PENDING_BYTES:
+            channel, frame = self._pending.popleft()
+            self._pending_bytes -= len(frame)
+            BUS_MESSAGES.labels(channel, "dropped").inc()
+
+    def _take_pending(self) -> list:
+        frames = list(self._pending)
+        self._pending.clear()
+        self._pending_bytes = 0
+        return frames
+
+    def _resync(self):
+        """Run the resync listeners (called on the event loop after connecting)."""
+        for listener in self._resync_listeners:
+            try:
+                result = listener()
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                logger.error(f"Bus resync listener failed: {e}")
+
+    def _dispatch(self, frame):
+        try:
+            message = json.loads(frame)
+        except ValueError:
+            logger.warning("Ignoring malformed bus frame")
+            return
+        if message.get("origin") == self.origin:
+            return
+        channel = message.get("channel")
+        BUS_MESSAGES.labels(channel, "received").inc()
+        for handler in self._handlers.get(channel, ()):
+            try:
+                result = handler(message.get("data"))
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                logger.error(f"Bus handler for '{channel}' failed: {e}")
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, "origin": self.origin, "channels": sorted(self._handlers),
+                "pending": len(self._pending)}
+
+
+class UnixSocketBus(MessageBus):
+    """Bus over a Unix socket on the local host, no extra services needed.
+
+    One worker is elected broker with an exclusive ``flock`` on
+    ``<path>.lock``; it listens on the socket and relays every frame to all
+    other connected workers. Every worker, the broker included, connects as
+    a client. When the broker exits the lock is released and the next worker
+    that fails to connect takes over.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._lock_file = None
+        self._clients: set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def backend(self) -> str:
+        return "unix"
+
+    async def start(self):
+        await super().start()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        if self._writer:
+            self._writer.close()
+        if self._server:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        if self._lock_file:
+            self._lock_file.close()
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_FRAME_BYTES)
+            except (FileNotFoundError, ConnectionRefusedError):
+                await self._try_become_broker()
+                await asyncio.sleep(0.05)
+                continue
+            except OSError as e:
+                logger.warning(f"Bus connection to {self.path} failed: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            self._writer = writer
+            logger.info(f"Connected to message bus at {self.path}")
+            for channel, frame in self._take_pending():
+                self._send(channel, frame)
+            self._resync()
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self._dispatch(line)
+            except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+                logger.warning(f"Message bus connection lost: {e}")
+            finally:
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _try_become_broker(self):
+        if self._server is not None:
+            return
+        lock_file = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # Another worker is (becoming) the broker
+            lock_file.close()
+            await asyncio.sleep(RECONNECT_DELAY)
+            return
+        try:
+            # Left behind by a broker that died
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._lock_file = lock_file
+        self._server = await asyncio.start_unix_server(self._serve_client, self.path, limit=MAX_FRAME_BYTES)
+        logger.info(f"Message bus broker listening on {self.path}")
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for client in list(self._clients):
+                    if client is writer:
+                        continue
+                    if client.transport.get_write_buffer_size() > MAX_CLIENT_BACKLOG:
+                        logger.warning("Dropping message bus client that stopped reading")
+                        self._clients.discard(client)
+                        client.close()
+                        continue
+                    client.write(line)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            # Cancelled when the broker shuts down
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    def _send(self, channel: str, frame: str):
+        if self._writer is None or self._writer.is_closing():
+            self._hold(channel, frame)
+            return
+        self._writer.write(frame.encode("utf-8") + b"\n")
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({
+            "path": self.path,
+            "connected": self._writer is not None,
+            "broker": self._server is not None,
+            "broker_clients": len(self._clients),
+        })
+        return stats
+
+
+class RedisBus(MessageBus):
+    """Bus over Redis pub/sub (or any server speaking the Redis protocol).
+
+    Works across hosts. Needs the optional ``redis`` package.
+    """
+
+    def __init__(self, url: str, channel: str = "energydashboard"):
+        super().__init__()
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+        self._connected = False
+        self._flushing = False
+
+    @property
+    def backend(self) -> str:
+        return "redis"
+
+    async def start(self):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("BUS_URL uses Redis but the 'redis' package is not installed")
+        await super().start()
+        self._client = redis.from_url(self.url)
+        self._task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        if self._client:
+            await self._client.close()
+
+    async def _listen(self):
+        while True:
+            pubsub = self._client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                self._connected = True
+                logger.info(f"Subscribed to message bus channel '{self.channel}'")
+                self._flush_pending()
+                self._resync()
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Message bus subscription lost: {e}")
+            finally:
+                self._connected = False
+                await pubsub.close()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _send(self, channel: str, frame: str):
+        if not self._connected or self._pending:
+            # Keep the order: behind the frames already waiting
+            self._hold(channel, frame)
+            self._flush_pending()
+            return
+        asyncio.ensure_future(self._publish(channel, frame))
+
+    async def _publish(self, channel: str, frame: str):
+        try:
+            await self._client.publish(self.channel, frame)
+        except Exception as e:
+            logger.warning(f"Message bus publish failed, holding the message: {e}")
+            self._hold(channel, frame)
+
+    def _flush_pending(self):
+        if self._connected and self._pending and not self._flushing:
+            self._flushing = True
+            asyncio.ensure_future(self._publish_pending())
+
+    async def _publish_pending(self):
+        try:
+            while self._connected and self._pending:
+                entry = self._pending[0]
+                try:
+                    await self._client.publish(self.channel, entry[1])
+                except Exception as e:
+                    logger.warning(f"Message bus publish failed, holding {len(self._pending)} messages: {e}")
+                    return
+                # Unless _hold() dropped it meanwhile
+                if self._pending and self._pending[0] is entry:
+                    self._pending.popleft()
+                    self._pending_bytes -= len(entry[1])
+        finally:
+            self._flushing = False
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({"channel": self.channel, "connected": self._connected})
+        return stats
+
+
+def create_bus(url: str = None) -> MessageBus:
+    """Bus for ``BUS_URL``: unset for a single worker, ``unix:///path/to.sock``
+    for workers on one host, or ``redis://host:6379/0`` across hosts."""
+    url = url if url is not None else os.getenv("BUS_URL", "")
+    if not url:
+        return MessageBus()
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return UnixSocketBus(parsed.path)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisBus(url)
+    raise ValueError(f"Unsupported BUS_URL scheme: {parsed.scheme}")
@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List
+
+
+class VersionedCache:
+    """Small LRU cache whose entries are valid until the next ``invalidate()``.
+
+    Results derived from measurement data are cached until the next ingest:
+    invalidation bumps a version number and drops all entries. A result whose
+    computation started before an invalidation is returned but not stored.
+    """
+
+    def __init__(self, name: str, max_entries: int = 256):
+        self.name = name
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == self.version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            version = self.version
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            # Don't store a result computed from data that changed meanwhile
+            if version == self.version:
+                self._entries[key] = (version, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *_):
+        """Drop all cached results (accepts and ignores ingest listener arguments)."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'version': self.version,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_caches: List[VersionedCache] = []
+
+
+def measurement_cache(name: str, max_entries: int = 256) -> VersionedCache:
+    """Create a cache that is invalidated whenever new measurements are ingested."""
+    cache = VersionedCache(name, max_entries)
+    _caches.append(cache)
+    return cache
+
+
+def invalidate_measurement_caches(*_):
+    """Ingest listener: invalidate every cache created with measurement_cache()."""
+    for cache in _caches:
+        cache.invalidate()
+
+
+def cache_stats() -> List[dict]:
+    return [cache.stats() for cache in _caches]
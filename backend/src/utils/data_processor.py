@@ -1,10 +1,15 @@
-import pandas as pd
-import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, errorcode
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from itertools import compress, repeat
 import os
+from typing import TYPE_CHECKING, Iterable, List, Tuple
 from dotenv import load_dotenv
+from .db import Database
+from .metrics import observe_query, observe_query_block, DATA_QUALITY_BATCHES, DATA_QUALITY_ISSUES
+from .derived_metrics import DERIVED_COLUMNS, DERIVED_METRICS, add_derived_metrics
+from .sensors import SensorRegistry
+from .quality import BatchValidator, QualityStore
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +18,140 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Rename columns to match database schema
+COLUMN_MAPPING = {
+    'Tijdstip': 'timestamp',
+    'Zonnepaneelspanning (V)': 'solar_voltage',
+    'Zonnepaneelstroom (A)': 'solar_current',
+    'Waterstofproductie (L/u)': 'hydrogen_production',
+    'Stroomverbruik woning (kW)': 'power_consumption',
+    'Waterstofverbruik auto (L/u)': 'hydrogen_consumption',
+    'Buitentemperatuur (°C)': 'outside_temperature',
+    'Binnentemperatuur (°C)': 'inside_temperature',
+    'Luchtdruk (hPa)': 'air_pressure',
+    'Luchtvochtigheid (%)': 'humidity',
+    'Accuniveau (%)': 'battery_level',
+    'CO2-concentratie binnen (ppm)': 'co2_level',
+    'Waterstofopslag woning (%)': 'hydrogen_storage_house',
+    'Waterstofopslag auto (%)': 'hydrogen_storage_car'
+}
+
+# Measurement columns in database order
+MEASUREMENT_COLUMNS = list(COLUMN_MAPPING.values())
+
+# Raw and derived columns written on ingest
+INSERT_COLUMNS = MEASUREMENT_COLUMNS + DERIVED_COLUMNS
+
+# Values of sensors without a measurements column
+NARROW_INSERT_QUERY = """
+    INSERT INTO measurement_values (sensor_id, timestamp, value)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE value = VALUES(value)
+"""
+
+# Concurrent day refreshes can deadlock on the aggregate tables; retried this often
+DAY_REFRESH_ATTEMPTS = 3
+
+def batch_columns(columns: Iterable[str]) -> List[str]:
+    """The sensor columns (INSERT_COLUMNS order) a batch with these columns has values for.
+
+    Derived columns count when all their inputs are present.
+    """
+    columns = set(columns)
+    derived = {m.id for m in DERIVED_METRICS if all(c in columns for c in m.inputs)}
+    return [c for c in INSERT_COLUMNS[1:] if c in derived or (c in columns and c not in DERIVED_COLUMNS)]
+
+def day_ranges(days: Iterable[date]) -> List[Tuple[datetime, datetime]]:
+    """Merge dates into [start, end) ranges of consecutive days."""
+    ranges = []
+    for day in sorted(set(days)):
+        start = datetime.combine(day, datetime.min.time())
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], start + timedelta(days=1))
+        else:
+            ranges.append((start, start + timedelta(days=1)))
+    return ranges
+
+def measurement_frame(rows, columns: List[str] = None) -> "pd.DataFrame":
+    """Stored measurement rows (timestamp first) as a float DataFrame, NULL -> NaN."""
+    import pandas as pd
+    columns = columns or INSERT_COLUMNS
+    frame = pd.DataFrame(rows, columns=columns)
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+    values = columns[1:]
+    frame[values] = frame[values].astype(float)
+    return frame
+
+def measurement_rows(rows: List[dict]) -> List[dict]:
+    """API form of stored rows, as the ring buffer returns them: ISO timestamps, floats."""
+    for row in rows:
+        row['timestamp'] = row['timestamp'].isoformat()
+        for column in INSERT_COLUMNS[1:]:
+            if row[column] is not None:
+                row[column] = float(row[column])
+    return rows
+
+def read_measurement_days(cursor, days: Iterable[date], lock: bool = False,
+                          columns: List[str] = None) -> "pd.DataFrame":
+    """Every stored measurement of the given dates, oldest first.
+
+    ``columns`` (timestamp first) defaults to INSERT_COLUMNS. With ``lock``
+    the rows are read with shared locks: inserts into those days wait until
+    the caller's transaction ends.
+    """
+    columns = columns or INSERT_COLUMNS
+    ranges = day_ranges(days)
+    if not ranges:
+        return measurement_frame([], columns)
+    where = ' OR '.join(['(timestamp >= %s AND timestamp < %s)'] * len(ranges))
+    cursor.execute(f"""
+        SELECT {', '.join(columns)} FROM measurements
+        WHERE {where} ORDER BY timestamp
+    """ + (" LOCK IN SHARE MODE" if lock else ""), tuple(bound for pair in ranges for bound in pair))
+    return measurement_frame(cursor.fetchall(), columns)
+
+def iter_measurement_windows(cursor, window_days: int = 31, columns: List[str] = None):
+    """(days, frame) over all stored measurements, a window of whole days at a time (rebuilds)."""
+    cursor.execute("SELECT MIN(timestamp), MAX(timestamp) FROM measurements")
+    first, last = cursor.fetchone()
+    if first is None:
+        return
+    day, last_day = first.date(), last.date()
+    while day <= last_day:
+        days = [day + timedelta(days=i) for i in range(window_days) if day + timedelta(days=i) <= last_day]
+        yield days, read_measurement_days(cursor, days, columns=columns)
+        day += timedelta(days=window_days)
+
+def _is_deadlock(error: Exception) -> bool:
+    return isinstance(error, Error) and error.errno == errorcode.ER_LOCK_DEADLOCK
+
+def read_measurements_csv(source, **kwargs):
+    """Read a meter export (tab-delimited, comma decimals, dd-mm-YYYY HH:MM timestamps)."""
+    # pandas is imported on first use to keep worker start-up fast
+    import pandas as pd
+    return pd.read_csv(source,
+                       delimiter='\t',
+                       encoding='utf-8',
+                       decimal=',',  # Handle European decimal format
+                       parse_dates=['Tijdstip'],
+                       dayfirst=True,  # Explicitly set dayfirst for European format
+                       date_parser=lambda x: pd.to_datetime(x, format='%d-%m-%Y %H:%M'),
+                       **kwargs)
+
+def normalize_measurements(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Rename the Dutch CSV headers to database columns and ensure a datetime timestamp."""
+    import pandas as pd
+    df = df.rename(columns=COLUMN_MAPPING)
+    
+    # Convert timestamp to datetime if it's not already
+    if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='%d-%m-%Y %H:%M')
+    
+    return df
+
 class DataProcessor:
     def __init__(self, host=None, user=None, password=None, database=None):
         """Initialize the data processor with database connection."""
@@ -20,159 +159,322 @@ class DataProcessor:
         self.user = user or os.getenv('DB_USER', 'root')
         self.password = password or os.getenv('DB_PASSWORD', '')
         self.database = database or os.getenv('DB_NAME', 'energydashboard')
-        self.conn = None
+        self.db = None
+        self.sensors: SensorRegistry = None
+        self.validator = BatchValidator()
+        self.quality: QualityStore = None
+        self._ingest_listeners = []
+        self._day_listeners = []
+        self._last_row = None  # previous batch tail, for rates of change
         self.connect()
 
     def connect(self):
-        """Connect to the MySQL database."""
+        """Set up the database connection pool (opened lazily on first use)."""
+        self.db = Database(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            pool_name="data_processor"
+        )
+        self.sensors = SensorRegistry(self.db)
+        self.quality = QualityStore(self.db)
+
+    def add_ingest_listener(self, listener):
+        """Register a callable that receives every successfully inserted DataFrame.
+
+        The batch may overwrite rows stored before (re-imports); aggregates
+        that must not count those twice are day listeners instead.
+        """
+        self._ingest_listeners.append(listener)
+
+    def add_day_listener(self, listener):
+        """Register an aggregate that is recomputed for every day an insert touches.
+
+        ``listener(cursor, frame, days)`` runs in a transaction on the primary;
+        ``frame`` holds all stored rows of ``days``, locked against concurrent
+        inserts. Listeners replace their rows for those days instead of adding
+        the batch, so re-imported or overlapping batches are counted once.
+        """
+        self._day_listeners.append(listener)
+
+    def refresh_days(self, days: Iterable[date]):
+        """Recompute the day listeners' aggregates of the given dates from the stored rows."""
+        days = sorted(set(days))
+        if not days or not self._day_listeners:
+            return
+        for attempt in range(1, DAY_REFRESH_ATTEMPTS + 1):
+            try:
+                with self.db.transaction() as cursor:
+                    frame = read_measurement_days(cursor, days, lock=True)
+                    for listener in self._day_listeners:
+                        # A failing aggregate must not take the others down with it
+                        cursor.execute("SAVEPOINT day_listener")
+                        try:
+                            listener(cursor, frame, days)
+                        except Exception as e:
+                            if _is_deadlock(e):
+                                raise
+                            cursor.execute("ROLLBACK TO SAVEPOINT day_listener")
+                            logger.error(f"Error in day listener: {e}")
+                return
+            except Error as e:
+                if not _is_deadlock(e) or attempt == DAY_REFRESH_ATTEMPTS:
+                    logger.error(f"Error refreshing aggregates of {len(days)} days: {e}")
+                    return
+                logger.warning(f"Deadlock refreshing aggregates, retrying ({attempt}/{DAY_REFRESH_ATTEMPTS})")
+
+    def process_csv(self, file_path: str) -> "pd.DataFrame":
+        """Process the CSV file and return a DataFrame."""
         try:
-            self.conn = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
-            logger.info("Successfully connected to database")
-        except Error as e:
-            logger.error(f"Error connecting to database: {e}")
+            return normalize_measurements(read_measurements_csv(file_path))
+        except Exception as e:
+            logger.error(f"Error processing CSV file: {e}")
             raise
 
-    def process_csv(self, file_path: str) -> pd.DataFrame:
-        """Process the CSV file and return a DataFrame."""
+    def iter_csv_chunks(self, file_path: str, chunksize: int = 5000):
+        """Yield (DataFrame, bytes_read) pairs while reading the CSV file in chunks."""
         try:
-            # Read CSV with tab delimiter and handle special characters
-            df = pd.read_csv(file_path, 
-                           delimiter='\t',
-                           encoding='utf-8',
-                           decimal=',',  # Handle European decimal format
-                           parse_dates=['Tijdstip'],
-                           dayfirst=True,  # Explicitly set dayfirst for European format
-                           date_parser=lambda x: pd.to_datetime(x, format='%d-%m-%Y %H:%M'))
-            
-            # Rename columns to match database schema
-            column_mapping = {
-                'Tijdstip': 'timestamp',
-                'Zonnepaneelspanning (V)': 'solar_voltage',
-                'Zonnepaneelstroom (A)': 'solar_current',
-                'Waterstofproductie (L/u)': 'hydrogen_production',
-                'Stroomverbruik woning (kW)': 'power_consumption',
-                'Waterstofverbruik auto (L/u)': 'hydrogen_consumption',
-                'Buitentemperatuur (°C)': 'outside_temperature',
-                'Binnentemperatuur (°C)': 'inside_temperature',
-                'Luchtdruk (hPa)': 'air_pressure',
-                'Luchtvochtigheid (%)': 'humidity',
-                'Accuniveau (%)': 'battery_level',
-                'CO2-concentratie binnen (ppm)': 'co2_level',
-                'Waterstofopslag woning (%)': 'hydrogen_storage_house',
-                'Waterstofopslag auto (%)': 'hydrogen_storage_car'
-            }
-            
-            df = df.rename(columns=column_mapping)
-            
-            # Convert timestamp to datetime if it's not already
-            if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-                df['timestamp'] = pd.to_datetime(df['timestamp'], format='%d-%m-%Y %H:%M')
-            
-            return df
-            
+            with open(file_path, 'rb') as f:
+                for chunk in read_measurements_csv(f, chunksize=chunksize):
+                    yield normalize_measurements(chunk), f.tell()
         except Exception as e:
             logger.error(f"Error processing CSV file: {e}")
             raise
 
-    def insert_data(self, df: pd.DataFrame):
-        """Insert data into the database."""
-        cursor = None
+    @staticmethod
+    def _narrow_values(df, narrow, timestamps) -> list:
+        """(sensor_id, timestamp, value) rows for the registered extra columns, NaN skipped."""
+        import numpy as np
+        values = []
+        for column, sensor in narrow.items():
+            readings = df[column].to_numpy(dtype=float, na_value=np.nan)
+            present = ~np.isnan(readings)
+            values.extend(zip(repeat(sensor.id), compress(timestamps, present), readings[present].tolist()))
+        return values
+
+    def _validate(self, df: "pd.DataFrame", source: str = None):
+        """Run the quality checks on a batch and record the report; returns (clean batch, report)."""
+        previous = self._last_row['timestamp'].iloc[0] if self._last_row is not None else None
+        result = self.validator.validate(df, previous)
+        report = result.report
+        DATA_QUALITY_BATCHES.labels(report['status']).inc()
+        for check in ('duplicates', 'off_grid', 'gaps', 'out_of_range', 'quarantined_rows'):
+            if report[check]:
+                DATA_QUALITY_ISSUES.labels(check).inc(report[check])
+        report['batch_id'] = self.quality.save(report, result.quarantine, source)
+        if report['status'] == 'quarantined':
+            logger.warning(f"Quarantined batch {report['batch_id']} of {len(df)} rows: {report['details']['reason']}")
+        return result.clean, report
+
+    def insert_data(self, df: "pd.DataFrame", source: str = None, validate: bool = True):
+        """Validate and insert a batch; returns its data-quality report (None if not validated).
+
+        A batch that fails validation as a whole is quarantined, not inserted.
+        """
+        report = None
+        if validate:
+            df, report = self._validate(df, source)
+            if not len(df):
+                return report
+        # Columns the batch leaves out keep their stored values on re-import
+        present = batch_columns(df.columns)
+        missing = [c for c in INSERT_COLUMNS[1:] if c not in present]
+        # Derived metrics are materialized once per batch, not per request
+        previous = self._last_row
+        if previous is not None and len(df) and previous['timestamp'].iloc[0] >= df['timestamp'].min():
+            previous = None
+        df = add_derived_metrics(df, previous)
+        # Columns we have no measurements column for go to measurement_values
+        extra = [c for c in df.columns if c not in INSERT_COLUMNS]
+        narrow = self.sensors.register_columns(df, extra) if extra else {}
         try:
-            cursor = self.conn.cursor()
-            
             # Prepare the insert query
-            insert_query = """
-                INSERT INTO measurements (
-                    timestamp, solar_voltage, solar_current, hydrogen_production,
-                    power_consumption, hydrogen_consumption, outside_temperature,
-                    inside_temperature, air_pressure, humidity, battery_level,
-                    co2_level, hydrogen_storage_house, hydrogen_storage_car
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                )
+            # Re-imported timestamps overwrite their row (unique key on timestamp)
+            insert_query = f"""
+                INSERT INTO measurements ({', '.join(INSERT_COLUMNS)})
+                VALUES ({', '.join(['%s'] * len(INSERT_COLUMNS))})
+                ON DUPLICATE KEY UPDATE {', '.join(f'{c} = VALUES({c})' for c in present) or 'timestamp = timestamp'}
             """
             
-            # Convert DataFrame rows to list of tuples
-            values = df.values.tolist()
+            # Convert DataFrame rows to list of tuples (by column name, NaN -> NULL)
+            frame = df.reindex(columns=INSERT_COLUMNS[1:]).astype(object)
+            rows = frame.where(frame.notna(), None).values.tolist()
+            timestamps = df['timestamp'].to_numpy().astype('datetime64[us]').tolist()
+            values = [(ts, *row) for ts, row in zip(timestamps, rows)]
+            narrow_values = self._narrow_values(df, narrow, timestamps) if narrow else []
             
-            # Execute batch insert
-            cursor.executemany(insert_query, values)
-            self.conn.commit()
+            # Execute batch insert (timed apart from validation, derived metrics and listeners)
+            with observe_query_block("DataProcessor", "insert_data"), self.db.transaction() as cursor:
+                cursor.executemany(insert_query, values)
+                if narrow_values:
+                    cursor.executemany(NARROW_INSERT_QUERY, narrow_values)
+                if missing:
+                    # Listeners (ring buffer, other workers) get the rows as stored
+                    stored = read_measurement_days(cursor, df['timestamp'].dt.date.unique(),
+                                                   columns=['timestamp'] + missing).set_index('timestamp')
+                    df = df.assign(**{c: df['timestamp'].map(stored[c]) for c in missing})
             
             logger.info(f"Successfully inserted {len(values)} records")
             
         except Error as e:
-            if self.conn:
-                self.conn.rollback()
             logger.error(f"Error inserting data: {e}")
             raise
-        finally:
-            if cursor:
-                cursor.close()
 
+        # Listeners see registered sensors under their names, like the built-in ones
+        df = df.rename(columns={column: sensor.name for column, sensor in narrow.items()})
+        if len(df) and (self._last_row is None or df['timestamp'].iloc[-1] >= self._last_row['timestamp'].iloc[0]):
+            self._last_row = df.iloc[[-1]].reindex(columns=MEASUREMENT_COLUMNS)
+
+        # Aggregates first, so listeners that invalidate caches or notify clients see them
+        self.refresh_days(df['timestamp'].dt.date.unique())
+
+        for listener in self._ingest_listeners:
+            try:
+                listener(df)
+            except Exception as e:
+                logger.error(f"Error in ingest listener: {e}")
+        return report
+
+    def release_quarantined(self, batch_id: str) -> int:
+        """Insert a batch's quarantined rows without validation; returns how many there were.
+
+        Rows that were stored with their out-of-range values nulled only get
+        those empty columns filled; values stored since are kept. The rows go
+        through ``insert_data``, so aggregates of the touched days are
+        recomputed rather than added to.
+        """
+        df = self.quality.quarantined_frame(batch_id)
+        if not len(df):
+            return 0
+        df = df.drop_duplicates('timestamp', keep='last').set_index('timestamp')
+        try:
+            with self.db.cursor(primary=True) as cursor:
+                stored = read_measurement_days(cursor, df.index.date, columns=MEASUREMENT_COLUMNS)
+        except Error as e:
+            logger.error(f"Error reading stored rows for release: {e}")
+            raise
+        stored = stored.set_index('timestamp').reindex(df.index)
+        merged = stored.combine_first(df).reindex(columns=df.columns.union(stored.columns, sort=False))
+        self.insert_data(merged.reset_index(), source=f"release:{batch_id}", validate=False)
+        self.quality.discard(batch_id)
+        return len(df)
+
+    @observe_query
     def get_latest_measurements(self, limit: int = 100) -> list:
         """Get the latest measurements from the database."""
-        cursor = None
         try:
-            cursor = self.conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT * FROM measurements 
+            query = f"""
+                SELECT {', '.join(INSERT_COLUMNS)} FROM measurements
                 ORDER BY timestamp DESC 
                 LIMIT %s
             """
             
-            cursor.execute(query, (limit,))
-            results = cursor.fetchall()
-            
-            # Convert datetime objects to strings
-            for row in results:
-                row['timestamp'] = row['timestamp'].isoformat()
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute(query, (limit,))
+                results = cursor.fetchall()
             
-            return results
+            return measurement_rows(results)
             
         except Error as e:
             logger.error(f"Error fetching latest measurements: {e}")
             raise
-        finally:
-            if cursor:
-                cursor.close()
 
+    @observe_query
+    def get_measurements_between(self, start: datetime, end: datetime) -> list:
+        """Get measurements with start <= timestamp <= end, oldest first."""
+        try:
+            query = f"""
+                SELECT {', '.join(INSERT_COLUMNS)} FROM measurements
+                WHERE timestamp BETWEEN %s AND %s
+                ORDER BY timestamp
+            """
+            
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute(query, (start, end))
+                results = cursor.fetchall()
+            
+            return measurement_rows(results)
+            
+        except Error as e:
+            logger.error(f"Error fetching measurements between {start} and {end}: {e}")
+            raise
+
+    def iter_measurements(self, start: datetime, end: datetime, columns=None, chunk_size: int = 5000):
+        """Yield measurements with start <= timestamp <= end, oldest first, as
+        lists of tuples (timestamp first, then ``columns``) streamed from the server."""
+        columns = list(columns or INSERT_COLUMNS[1:])
+        query = f"""
+            SELECT timestamp, {', '.join(columns)} FROM measurements
+            WHERE timestamp BETWEEN %s AND %s
+            ORDER BY timestamp
+        """
+        try:
+            yield from self.db.stream(query, (start, end), chunk_size)
+        except Error as e:
+            logger.error(f"Error streaming measurements between {start} and {end}: {e}")
+            raise
+
+    @observe_query
+    def get_sensor_series(self, names, start: datetime, end: datetime) -> list:
+        """Measurements of the named sensors between start and end, oldest first,
+        one row per timestamp whichever storage each sensor uses.
+
+        Wide sensors are read as columns of measurements; narrow sensors with
+        one primary-key range scan per sensor on measurement_values, pivoted
+        to columns in pandas. Raises KeyError for unknown sensor names.
+        """
+        import pandas as pd
+        sensors = self.sensors.resolve(names)
+        wide = [s.name for s in sensors if s.storage == 'wide' and s.name in INSERT_COLUMNS]
+        narrow = {s.id: s.name for s in sensors if s.storage == 'narrow'}
+        frames = []
+        try:
+            with self.db.cursor() as cursor:
+                if wide:
+                    cursor.execute(f"""
+                        SELECT timestamp, {', '.join(wide)} FROM measurements
+                        WHERE timestamp BETWEEN %s AND %s
+                    """, (start, end))
+                    frame = pd.DataFrame(cursor.fetchall(), columns=['timestamp', *wide])
+                    frames.append(frame.set_index('timestamp').astype(float))
+                if narrow:
+                    cursor.execute(f"""
+                        SELECT sensor_id, timestamp, value FROM measurement_values
+                        WHERE sensor_id IN ({', '.join(['%s'] * len(narrow))})
+                          AND timestamp BETWEEN %s AND %s
+                    """, (*narrow, start, end))
+                    long = pd.DataFrame(cursor.fetchall(), columns=['sensor_id', 'timestamp', 'value'])
+                    frames.append(long.pivot(index='timestamp', columns='sensor_id', values='value').rename(columns=narrow))
+        except Error as e:
+            logger.error(f"Error fetching sensor series between {start} and {end}: {e}")
+            raise
+
+        frame = pd.concat(frames, axis=1).sort_index() if frames else pd.DataFrame()
+        frame = frame.reindex(columns=[s.name for s in sensors]).astype(object)
+        frame = frame.where(frame.notna(), None)
+        return [
+            {'timestamp': ts.isoformat(), **dict(zip(frame.columns, row))}
+            for ts, row in zip(frame.index, frame.values.tolist())
+        ]
+
+    @observe_query
     def get_daily_aggregations(self, days: int = 7) -> list:
         """Get daily aggregations for the specified number of days."""
-        cursor = None
         try:
-            cursor = self.conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT 
-                    DATE(timestamp) as date,
-                    AVG(solar_voltage) as avg_solar_voltage,
-                    AVG(solar_current) as avg_solar_current,
-                    AVG(hydrogen_production) as avg_hydrogen_production,
-                    AVG(power_consumption) as avg_power_consumption,
-                    AVG(hydrogen_consumption) as avg_hydrogen_consumption,
-                    AVG(outside_temperature) as avg_outside_temperature,
-                    AVG(inside_temperature) as avg_inside_temperature,
-                    AVG(air_pressure) as avg_air_pressure,
-                    AVG(humidity) as avg_humidity,
-                    AVG(battery_level) as avg_battery_level,
-                    AVG(co2_level) as avg_co2_level,
-                    AVG(hydrogen_storage_house) as avg_hydrogen_storage_house,
-                    AVG(hydrogen_storage_car) as avg_hydrogen_storage_car
+            # Every sensor with a measurements column (see the sensors registry)
+            averages = ',\n'.join(f"AVG({c}) as avg_{c}" for c in INSERT_COLUMNS[1:])
+            query = f"""
+                SELECT DATE(timestamp) as date, {averages}
                 FROM measurements
                 WHERE timestamp >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
                 GROUP BY DATE(timestamp)
                 ORDER BY date DESC
             """
             
-            cursor.execute(query, (days,))
-            results = cursor.fetchall()
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute(query, (days,))
+                results = cursor.fetchall()
             
             # Convert date objects to strings
             for row in results:
@@ -183,12 +485,8 @@ class DataProcessor:
         except Error as e:
             logger.error(f"Error fetching daily aggregations: {e}")
             raise
-        finally:
-            if cursor:
-                cursor.close()
 
     def close(self):
         """Close the database connection."""
-        if self.conn:
-            self.conn.close()
-            logger.info("Database connection closed") 
\ No newline at end of file
+        if self.db:
+            self.db.close() 
\ No newline at end of file
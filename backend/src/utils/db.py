@@ -0,0 +1,385 @@
+import mysql.connector
+from mysql.connector import Error, pooling
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence
+from dotenv import load_dotenv
+from .auth import token_subject
+from .metrics import DB_POOL_WAIT, DB_READS, DB_REPLICA_LAG
+from .query_tracer import query_tracer
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Replicas further behind than this (seconds) are skipped
+REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', '5'))
+# Replica lag is re-measured at most this often (seconds)
+REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '5'))
+# An unreachable replica is left alone this long (seconds)
+REPLICA_RETRY_AFTER = 30.0
+# After a write, the writer's reads go to the primary this long (seconds)
+STICKY_SECONDS = float(os.getenv('DB_STICKY_SECONDS', str(REPLICA_MAX_LAG * 2)))
+
+# Who the current request acts for ('user:<name>' or 'ip:<address>'); set
+# by ReadYourWritesMiddleware, copied into threads by asyncio.to_thread
+db_session: ContextVar[Optional[str]] = ContextVar('db_session', default=None)
+
+
+def _split_host(host: str):
+    name, _, port = host.partition(':')
+    return name, int(port or os.getenv('DB_PORT', '3306'))
+
+
+class StickySessions:
+    """Sessions that wrote recently and must read from the primary.
+
+    A write made on behalf of a session (see ``db_session``) pins that
+    session's reads to the primary for ``window`` seconds, longer than a
+    usable replica can lag, so a user always sees their own changes.
+    Writes without a session (ingest, background jobs) pin nobody.
+    Listeners hear about every pin, to share it with other workers.
+    """
+
+    def __init__(self, window: float = STICKY_SECONDS):
+        self.window = window
+        self._until: Dict[str, float] = {}
+        self._listeners: List[Callable[[str, float], None]] = []
+
+    def add_listener(self, listener: Callable[[str, float], None]):
+        self._listeners.append(listener)
+
+    def wrote(self):
+        session = db_session.get()
+        if session is None:
+            return
+        until = time.time() + self.window
+        self.remember(session, until)
+        for listener in self._listeners:
+            try:
+                listener(session, until)
+            except Exception as e:
+                logger.warning(f"Sticky session listener failed: {e}")
+
+    def remember(self, session: str, until: float):
+        now = time.time()
+        if len(self._until) > 10000:
+            self._until = {k: v for k, v in self._until.items() if v > now}
+        self._until[session] = until
+
+    def is_sticky(self) -> bool:
+        session = db_session.get()
+        return session is not None and self._until.get(session, 0) > time.time()
+
+
+sticky_sessions = StickySessions()
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware that tags each request with its ``db_session``: the
+    bearer token's user, or else the client address."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        session = None
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    subject = token_subject(token)
+                    session = f"user:{subject}" if subject else None
+                break
+        if session is None:
+            session = f"ip:{(scope.get('client') or ('unknown',))[0]}"
+        reset = db_session.set(session)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            db_session.reset(reset)
+
+
+class Replica:
+    """A read replica pool and what is known about its health and lag."""
+
+    def __init__(self, db: "Database", max_lag: float = REPLICA_MAX_LAG,
+                 check_interval: float = REPLICA_CHECK_INTERVAL):
+        self.db = db
+        self.name = f"{db.host}:{db.port}"
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag: Optional[float] = None
+        self._checked_at = float('-inf')
+        self._down_until = 0.0
+        self._check_lock = threading.Lock()
+
+    def usable(self) -> bool:
+        """Reachable and at most max_lag seconds behind (measured every
+        check_interval seconds, by one thread while the others go on)."""
+        now = time.monotonic()
+        if now < self._down_until:
+            return False
+        if now - self._checked_at >= self.check_interval and self._check_lock.acquire(blocking=False):
+            try:
+                self.lag = self._measure_lag()
+                DB_REPLICA_LAG.labels(self.name).set(self.lag if self.lag is not None else -1)
+            except Error as e:
+                self.failed(e)
+                return False
+            finally:
+                self._checked_at = now
+                self._check_lock.release()
+        return self.lag is not None and self.lag <= self.max_lag
+
+    def _measure_lag(self) -> Optional[float]:
+        with self.db.connection() as conn:
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            try:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except Error:
+                    # MySQL < 8.0.22
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+            finally:
+                cursor.close()
+        if status is None:
+            # Not replicating (e.g. a second standalone instance in tests)
+            return 0.0
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        # NULL: the replication threads are stopped, the lag is unbounded
+        return float(lag) if lag is not None else None
+
+    def failed(self, error: Exception):
+        if time.monotonic() >= self._down_until:
+            logger.warning(f"Replica {self.name} unavailable ({error}), using the primary "
+                           f"for {REPLICA_RETRY_AFTER:.0f}s")
+        self._down_until = time.monotonic() + REPLICA_RETRY_AFTER
+
+
+class Database:
+    """Small wrapper around a MySQL connection pool.
+
+    Connections are checked out per operation instead of sharing a single
+    connection, so background work and requests don't serialize on one socket.
+    Checkout blocks while all connections are in use; the wait is recorded in
+    the ``db_pool_wait_seconds`` histogram.
+
+    The pool is created on first use, so constructing a Database never touches
+    the network. If the server is down the pool creation is retried on the next
+    checkout, and dead pooled connections are reconnected by the pool itself.
+
+    With replicas (``DB_REPLICAS``, comma-separated host[:port], same
+    credentials) reads from ``cursor()`` and ``stream()`` are spread over
+    the replicas that are reachable and not lagging; ``transaction()`` and
+    ``connection()`` always use the primary. Reads fall back to the primary
+    when no replica qualifies, for a session that just wrote, and when the
+    caller asks for ``primary=True`` (read-modify-write, freshly committed
+    state).
+    """
+
+    def __init__(self, host=None, user=None, password=None, database=None,
+                 pool_name: str = "energydashboard", pool_size: int = None, tracer=None,
+                 replicas: Sequence[str] = None):
+        self.host, self.port = _split_host(host or os.getenv('DB_HOST', 'localhost'))
+        self.user = user or os.getenv('DB_USER', 'root')
+        self.password = password if password is not None else os.getenv('DB_PASSWORD', '')
+        self.database = database or os.getenv('DB_NAME', 'energydashboard')
+        self.pool_name = pool_name
+        self.pool_size = pool_size or int(os.getenv('DB_POOL_SIZE', '5'))
+        self.tracer = tracer or query_tracer
+        self.pool = None
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._wait = DB_POOL_WAIT.labels(pool_name)
+        self._pool_lock = threading.Lock()
+        self._streams = threading.BoundedSemaphore(int(os.getenv('DB_MAX_STREAMS', '2')))
+        if replicas is None:
+            replicas = [h.strip() for h in os.getenv('DB_REPLICAS', '').split(',') if h.strip()]
+        self.replicas = [
+            Replica(Database(host, self.user, self.password, self.database,
+                             pool_name=f"{pool_name}_replica{i}", pool_size=self.pool_size,
+                             tracer=self.tracer, replicas=()))
+            for i, host in enumerate(replicas)
+        ]
+        self._reads = {route: DB_READS.labels(pool_name, route)
+                       for route in ('primary', 'replica', 'sticky', 'fallback')}
+        self._round_robin = itertools.count()
+
+    def connect(self):
+        """Create the connection pool if it doesn't exist yet."""
+        with self._pool_lock:
+            if self.pool is not None:
+                return
+            try:
+                self.pool = pooling.MySQLConnectionPool(
+                    pool_name=self.pool_name,
+                    pool_size=self.pool_size,
+                    pool_reset_session=False,
+                    host=self.host,
+                    port=self.port,
+                    user=self.user,
+                    password=self.password,
+                    database=self.database,
+                    autocommit=True
+                )
+                logger.info("Successfully connected to database")
+            except Error as e:
+                logger.error(f"Error connecting to database: {e}")
+                raise
+
+    @contextmanager
+    def connection(self):
+        """Check out a pooled connection for the duration of the block."""
+        if self.pool is None:
+            self.connect()
+        start = time.perf_counter()
+        self._slots.acquire()
+        try:
+            conn = self.pool.get_connection()
+        except Exception:
+            self._slots.release()
+            raise
+        self._wait.observe(time.perf_counter() - start)
+        try:
+            yield conn
+        finally:
+            conn.close()
+            self._slots.release()
+
+    def _read_replica(self, primary: bool) -> Optional[Replica]:
+        """The replica to read from, or None for the primary."""
+        if not self.replicas:
+            return None
+        if primary:
+            self._reads['primary'].inc()
+            return None
+        if sticky_sessions.is_sticky():
+            self._reads['sticky'].inc()
+            return None
+        candidates = [r for r in self.replicas if r.usable()]
+        if not candidates:
+            self._reads['fallback'].inc()
+            return None
+        self._reads['replica'].inc()
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    @contextmanager
+    def cursor(self, dictionary: bool = False, buffered: bool = True, primary: bool = False):
+        """Yield a cursor for read queries (autocommit), on a replica unless
+        ``primary`` is set or no replica qualifies."""
+        replica = self._read_replica(primary)
+        with ExitStack() as stack:
+            conn = None
+            if replica is not None:
+                try:
+                    conn = stack.enter_context(replica.db.connection())
+                except Error as e:
+                    replica.failed(e)
+                    self._reads['fallback'].inc()
+            if conn is None:
+                conn = stack.enter_context(self.connection())
+            cursor = conn.cursor(dictionary=dictionary, buffered=buffered)
+            try:
+                # EXPLAIN needs the connection free, which unbuffered reads don't allow
+                yield self.tracer.wrap(cursor, conn if buffered else None, streamed=not buffered)
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self, dictionary: bool = False):
+        """Yield a cursor inside a transaction; commit on success, rollback on error."""
+        with self.connection() as conn:
+            conn.start_transaction()
+            cursor = conn.cursor(dictionary=dictionary, buffered=True)
+            try:
+                yield self.tracer.wrap(cursor, conn)
+                conn.commit()
+                sticky_sessions.wrote()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def stream(self, query: str, params=(), chunk_size: int = 5000, primary: bool = False):
+        """Yield the result rows of a query in lists of at most chunk_size tuples.
+
+        Rows are read from an unbuffered cursor, so the server streams them
+        and memory stays flat regardless of the result size. Streams use their
+        own connection (at most ``DB_MAX_STREAMS`` at a time) instead of a
+        pooled one: a long export must not hold a pool slot, and a stream
+        abandoned half-way leaves unread rows that would make a pooled
+        connection unusable; closing a private connection simply discards them.
+        Like ``cursor()``, streams read from a replica when one qualifies.
+        """
+        replica = self._read_replica(primary)
+        source = replica.db if replica is not None else self
+        with self._streams:
+            try:
+                conn = source._connect_stream()
+            except Error as e:
+                if replica is None:
+                    raise
+                replica.failed(e)
+                self._reads['fallback'].inc()
+                conn = self._connect_stream()
+            try:
+                cursor = self.tracer.wrap(conn.cursor(buffered=False), None, streamed=True)
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                try:
+                    conn.close()
+                except Error as e:
+                    logger.warning(f"Error closing stream connection: {e}")
+
+    def _connect_stream(self):
+        return mysql.connector.connect(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password,
+            database=self.database
+        )
+
+    def ping(self) -> bool:
+        """Return True when a pooled connection can reach the server."""
+        try:
+            with self.connection() as conn:
+                conn.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"Database ping failed: {e}")
+            return False
+
+    def replica_status(self) -> List[dict]:
+        return [{
+            'replica': r.name,
+            'lag_seconds': r.lag,
+            'usable': r.usable(),
+        } for r in self.replicas]
+
+    def close(self):
+        """Close idle pooled connections."""
+        for replica in self.replicas:
+            replica.db.close()
+        if self.pool:
+            try:
+                self.pool._remove_connections()
+            except Error as e:
+                logger.error(f"Error closing connection pool: {e}")
+            logger.info("Database connection closed")
@@ -0,0 +1,87 @@
+from typing import TYPE_CHECKING, Callable, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class DerivedMetric(NamedTuple):
+    """A metric computed from raw sensor columns, stored like any other sensor."""
+    id: str
+    label: str
+    unit: str
+    inputs: Tuple[str, ...]
+    compute: Callable[["pd.DataFrame"], "pd.Series"]
+
+
+def _solar_power(df):
+    # P = U * I (W)
+    return df['solar_voltage'] * df['solar_current']
+
+
+def _net_balance(df):
+    # Solar production minus house consumption in kW; positive means surplus
+    return _solar_power(df) / 1000 - df['power_consumption']
+
+
+# Below this solar input the production/input ratio is meaningless noise
+MIN_SOLAR_KW = 0.05
+
+
+def _hydrogen_per_kwh(df):
+    # Electrolyser output (L/u) per kW of solar input = litres per kWh
+    solar_kw = _solar_power(df) / 1000
+    return df['hydrogen_production'] / solar_kw.where(solar_kw >= MIN_SOLAR_KW)
+
+
+def _rate_of_change(column):
+    def compute(df):
+        hours = df['timestamp'].diff().dt.total_seconds() / 3600
+        return df[column].diff() / hours.where(hours > 0)
+    return compute
+
+
+DERIVED_METRICS: List[DerivedMetric] = [
+    DerivedMetric('solar_power', 'Zonnevermogen', 'W',
+                  ('solar_voltage', 'solar_current'), _solar_power),
+    DerivedMetric('net_balance', 'Netto balans', 'kW',
+                  ('solar_voltage', 'solar_current', 'power_consumption'), _net_balance),
+    DerivedMetric('hydrogen_per_kwh', 'Waterstof per kWh', 'L/kWh',
+                  ('hydrogen_production', 'solar_voltage', 'solar_current'), _hydrogen_per_kwh),
+    DerivedMetric('battery_level_rate', 'Verandering accuniveau', '%/u',
+                  ('timestamp', 'battery_level'), _rate_of_change('battery_level')),
+    DerivedMetric('hydrogen_storage_house_rate', 'Verandering waterstofopslag woning', '%/u',
+                  ('timestamp', 'hydrogen_storage_house'), _rate_of_change('hydrogen_storage_house')),
+]
+
+DERIVED_COLUMNS = [metric.id for metric in DERIVED_METRICS]
+
+
+def add_derived_metrics(df: "pd.DataFrame", previous: Optional["pd.DataFrame"] = None) -> "pd.DataFrame":
+    """Return a copy of the batch with all derived metric columns added.
+
+    The batch is sorted by timestamp. ``previous`` is the last row of the
+    preceding batch, so rates of change are continuous across batches.
+    Metrics whose inputs are missing from the batch are left empty.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = df.sort_values('timestamp', kind='stable')
+    frame = df
+    if previous is not None and len(previous):
+        frame = pd.concat([previous, df], ignore_index=True)
+    offset = len(frame) - len(df)
+
+    result = df.copy()
+    for metric in DERIVED_METRICS:
+        if not all(column in frame for column in metric.inputs):
+            result[metric.id] = np.nan
+            continue
+        values = metric.compute(frame).replace([np.inf, -np.inf], np.nan)
+        result[metric.id] = values.to_numpy()[offset:]
+    return result
+
+
+def describe_derived_metrics() -> List[dict]:
+    return [{'id': m.id, 'label': m.label, 'unit': m.unit, 'inputs': list(m.inputs)}
+            for m in DERIVED_METRICS]
@@ -0,0 +1,110 @@
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, List, Sequence
+from .data_processor import COLUMN_MAPPING
+
+EXPORT_FORMATS = {
+    'csv': ('text/tab-separated-values; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Database column -> original CSV header
+DUTCH_HEADERS = {column: header for header, column in COLUMN_MAPPING.items()}
+
+
+def _dutch_number(value) -> str:
+    if value is None:
+        return ''
+    return str(value).replace('.', ',')
+
+
+def csv_chunks(chunks: Iterable[List[tuple]], columns: Sequence[str]) -> Iterator[bytes]:
+    """Encode row chunks in the meter export format: tab-delimited, Dutch
+    headers, comma decimals and dd-mm-YYYY HH:MM timestamps, so an export can
+    be imported again as-is."""
+    header = [DUTCH_HEADERS['timestamp']] + [DUTCH_HEADERS.get(c, c) for c in columns]
+    yield ('\t'.join(header) + '\n').encode('utf-8')
+    for rows in chunks:
+        lines = [
+            '\t'.join([row[0].strftime('%d-%m-%Y %H:%M')] + [_dutch_number(v) for v in row[1:]])
+            for row in rows
+        ]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def ndjson_chunks(chunks: Iterable[List[tuple]], columns: Sequence[str]) -> Iterator[bytes]:
+    """Encode row chunks as one JSON object per line."""
+    names = ['timestamp'] + list(columns)
+    for rows in chunks:
+        lines = []
+        for row in rows:
+            record = dict(zip(names, row))
+            record['timestamp'] = row[0].isoformat()
+            for column in columns:
+                if record[column] is not None:
+                    record[column] = float(record[column])
+            lines.append(json.dumps(record))
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parquet_chunks(chunks: Iterable[List[tuple]], columns: Sequence[str]) -> Iterator[bytes]:
+    """Encode row chunks as a Parquet file, one row group per chunk (requires pyarrow)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([('timestamp', pa.timestamp('s'))] + [(c, pa.float64()) for c in columns])
+    sink = _DrainableSink()
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for rows in chunks:
+            arrays = [pa.array([row[0] for row in rows], pa.timestamp('s'))]
+            for index in range(1, len(columns) + 1):
+                arrays.append(pa.array([None if row[index] is None else float(row[index]) for row in rows],
+                                       pa.float64()))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a byte stream incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
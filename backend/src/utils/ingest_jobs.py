@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobConflictError(Exception):
+    """Raised when a job is submitted for a source that already has one running."""
+
+    def __init__(self, job: "IngestJob"):
+        super().__init__(f"An import for '{job.source}' is already {job.status} (job {job.id})")
+        self.job = job
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class IngestJob:
+    """State and progress of a single import job."""
+
+    def __init__(self, source: str, path: str, kind: str = "csv"):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.path = path
+        self.kind = kind
+        self.status = QUEUED
+        self.rows = 0
+        self.quarantined_rows = 0
+        self.bytes_read = 0
+        try:
+            self.total_bytes = os.path.getsize(path)
+        except OSError:
+            self.total_bytes = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._started = None
+        self._finished = None
+        self._last_notify = 0.0
+        self._cancel = threading.Event()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def to_dict(self) -> dict:
+        elapsed = 0.0
+        if self._started is not None:
+            end = self._finished if self.finished_at else time.monotonic()
+            elapsed = end - self._started
+        return {
+            "id": self.id,
+            "source": self.source,
+            "kind": self.kind,
+            "status": self.status,
+            "rows": self.rows,
+            "quarantined_rows": self.quarantined_rows,
+            "bytes_read": self.bytes_read,
+            "total_bytes": self.total_bytes,
+            "progress": round(self.bytes_read / self.total_bytes, 4) if self.total_bytes else None,
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else 0.0,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class IngestJobManager:
+    """Runs import jobs on a small background thread pool.
+
+    At most one job per source runs at a time: within a worker this is checked
+    on submit, across workers a MySQL ``GET_LOCK`` is held while the job runs.
+    Listeners are called with the job on every state change and (throttled)
+    on progress.
+    """
+
+    def __init__(self, data_processor, max_workers: int = 2, chunksize: int = 5000,
+                 history: int = 100, progress_interval: float = 0.5):
+        self.data_processor = data_processor
+        self.chunksize = chunksize
+        self.history = history
+        self.progress_interval = progress_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._active: Dict[str, IngestJob] = {}
+        self._listeners: List[Callable[[IngestJob], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[IngestJob], None]):
+        self._listeners.append(listener)
+
+    def submit(self, source: str, path: str, runner: Callable[[IngestJob], None] = None,
+               kind: str = "csv") -> IngestJob:
+        """Queue a job for the source; raises JobConflictError if one is already active."""
+        job = IngestJob(source, path, kind)
+        with self._lock:
+            active = self._active.get(source)
+            if active is not None:
+                raise JobConflictError(active)
+            self._active[source] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest.status not in FINISHED_STATES:
+                    break
+                del self._jobs[oldest_id]
+        self._executor.submit(self._run, job, runner or self._import_csv)
+        self._notify(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        return list(self._jobs.values())[::-1]
+
+    def cancel(self, job_id: str) -> Optional[IngestJob]:
+        """Request cancellation; the job stops at the next chunk boundary."""
+        job = self._jobs.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES:
+            job._cancel.set()
+        return job
+
+    def shutdown(self):
+        for job in list(self._active.values()):
+            job._cancel.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def report_progress(self, job: IngestJob, rows: int, bytes_read: int):
+        """Add imported rows and update the byte position, notifying listeners (throttled)."""
+        job.rows += rows
+        job.bytes_read = bytes_read
+        now = time.monotonic()
+        if now - job._last_notify >= self.progress_interval:
+            job._last_notify = now
+            self._notify(job)
+
+    def _run(self, job: IngestJob, runner: Callable[[IngestJob], None]):
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+        job._started = time.monotonic()
+        self._notify(job)
+        try:
+            job.check_cancelled()
+            with self.data_processor.db.connection() as conn:
+                if not self._acquire_source_lock(conn, job.source):
+                    raise RuntimeError(f"An import for '{job.source}' is running in another worker")
+                try:
+                    runner(job)
+                finally:
+                    self._release_source_lock(conn, job.source)
+            job.status = COMPLETED
+        except JobCancelled:
+            job.status = CANCELLED
+            logger.info(f"Import job {job.id} cancelled after {job.rows} rows")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            logger.error(f"Import job {job.id} failed: {e}")
+        finally:
+            job._finished = time.monotonic()
+            job.finished_at = datetime.utcnow()
+            with self._lock:
+                if self._active.get(job.source) is job:
+                    del self._active[job.source]
+            self._notify(job)
+
+    def _import_csv(self, job: IngestJob):
+        for chunk, bytes_read in self.data_processor.iter_csv_chunks(job.path, self.chunksize):
+            job.check_cancelled()
+            report = self.data_processor.insert_data(chunk, source=job.source)
+            if report:
+                job.quarantined_rows += report['quarantined_rows']
+            self.report_progress(job, len(chunk), bytes_read)
+
+    def _acquire_source_lock(self, conn, source: str) -> bool:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (f"ingest:{source}",))
+            return cursor.fetchone()[0] == 1
+        finally:
+            cursor.close()
+
+    def _release_source_lock(self, conn, source: str):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (f"ingest:{source}",))
+            cursor.fetchone()
+        finally:
+            cursor.close()
+
+    def _notify(self, job: IngestJob):
+        for listener in self._listeners:
+            try:
+                listener(job)
+            except Exception as e:
+                logger.error(f"Error notifying import job listener: {e}")
@@ -0,0 +1,461 @@
+from mysql.connector import Error
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+from .metrics import EXTERNAL_CALLS, EXTERNAL_CALL_DURATION
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Sensors described in the summary: name -> (label, unit)
+INSIGHT_SENSORS = {
+    'power_consumption': ('Stroomverbruik woning', 'kW'),
+    'solar_power': ('Zonnevermogen', 'W'),
+    'net_balance': ('Netto balans', 'kW'),
+    'hydrogen_production': ('Waterstofproductie', 'L/u'),
+    'hydrogen_consumption': ('Waterstofverbruik auto', 'L/u'),
+    'battery_level': ('Accuniveau', '%'),
+    'hydrogen_storage_house': ('Waterstofopslag woning', '%'),
+    'hydrogen_storage_car': ('Waterstofopslag auto', '%'),
+    'inside_temperature': ('Binnentemperatuur', '°C'),
+    'outside_temperature': ('Buitentemperatuur', '°C'),
+    'co2_level': ('CO2-concentratie binnen', 'ppm'),
+    'humidity': ('Luchtvochtigheid', '%'),
+}
+
+# Summaries cover the newest week of measurements (15-minute intervals)
+SUMMARY_ROWS = 7 * 96
+
+# |z| above this (against the whole window) counts as an anomaly
+ANOMALY_Z = 3.0
+
+MAX_ITEMS = 3
+
+
+def _round(value, digits: int = 2):
+    return None if value is None or value != value else round(float(value), digits)
+
+
+def summarize_measurements(df: "pd.DataFrame", sensors: Dict[str, tuple] = INSIGHT_SENSORS) -> Optional[dict]:
+    """Compact statistical summary of a measurement window for the LLM prompt.
+
+    Per sensor: latest value, the last 24 hours (mean, min, max and when the
+    peak was), the change against the 24 hours before, the trend per hour
+    and how many readings were anomalous. Plus energy totals for the last
+    day and a naive forecast for tomorrow (the average full day). Values are
+    rounded, so the summary (and its fingerprint) only changes when the data
+    changes in a way that matters.
+    """
+    import numpy as np
+    import pandas as pd
+    if df is None or not len(df):
+        return None
+    df = df.sort_values('timestamp')
+    end = df['timestamp'].iloc[-1]
+    last_day = df['timestamp'] > end - pd.Timedelta(hours=24)
+    previous_day = (df['timestamp'] > end - pd.Timedelta(hours=48)) & ~last_day
+    hours = ((df['timestamp'] - end).dt.total_seconds() / 3600).to_numpy()
+
+    summary = {
+        'period': {
+            'start': df['timestamp'].iloc[0].isoformat(),
+            'end': end.isoformat(),
+            'rows': int(len(df)),
+        },
+        'sensors': {},
+    }
+    for name, (label, unit) in sensors.items():
+        if name not in df:
+            continue
+        values = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=float)
+        recent = values[last_day.to_numpy()]
+        present = ~np.isnan(recent)
+        if not present.any():
+            continue
+        mean = np.nanmean(recent)
+        before = values[previous_day.to_numpy()]
+        mean_before = np.nanmean(before) if (~np.isnan(before)).any() else None
+        delta = (mean - mean_before) / abs(mean_before) * 100 if mean_before else None
+        recent_hours = hours[last_day.to_numpy()][present]
+        trend = np.polyfit(recent_hours, recent[present], 1)[0] if present.sum() >= 2 else None
+        std = np.nanstd(values)
+        anomalies = int((np.abs(recent[present] - np.nanmean(values)) > ANOMALY_Z * std).sum()) if std > 0 else 0
+        peak = int(np.nanargmax(np.where(np.isnan(recent), -np.inf, recent)))
+        latest = values[~np.isnan(values)][-1]
+        summary['sensors'][name] = {
+            'label': label,
+            'unit': unit,
+            'latest': _round(latest),
+            'mean_24h': _round(mean),
+            'min_24h': _round(np.nanmin(recent)),
+            'max_24h': _round(np.nanmax(recent)),
+            'peak_at': df['timestamp'][last_day].iloc[peak].isoformat(),
+            'change_vs_previous_24h_pct': _round(delta, 1),
+            'trend_per_hour': _round(trend, 3),
+            'anomalies_24h': anomalies,
+        }
+
+    # Energy: kW (or W) readings times the interval they cover
+    interval_h = df['timestamp'].diff().dt.total_seconds().median() / 3600 if len(df) > 1 else 0.25
+    energy = {}
+    if 'power_consumption' in df:
+        consumption = pd.to_numeric(df['power_consumption'], errors='coerce') * interval_h
+        energy['consumption_kwh_24h'] = _round(consumption[last_day].sum())
+        daily = consumption.groupby(df['timestamp'].dt.date).agg(['sum', 'count'])
+        full_days = daily[daily['count'] >= 0.9 * 24 / interval_h] if interval_h else daily.iloc[0:0]
+        if len(full_days):
+            energy['forecast_kwh_tomorrow'] = _round(full_days['sum'].mean())
+    if 'solar_power' in df:
+        solar = pd.to_numeric(df['solar_power'], errors='coerce') / 1000 * interval_h
+        energy['solar_kwh_24h'] = _round(solar[last_day].sum())
+    summary['energy'] = energy
+    return summary
+
+
+def summary_fingerprint(summary: dict) -> str:
+    return hashlib.sha1(json.dumps(summary, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class StubProvider:
+    """Rule-based insights from the summary alone: no network, deterministic.
+
+    Used when no LLM is configured, in tests, and as the fallback when the
+    LLM call fails or another worker is still waiting for it.
+    """
+
+    name = 'stub'
+
+    def generate(self, summary: dict) -> Dict[str, List[str]]:
+        sensors = summary.get('sensors', {})
+        energy = summary.get('energy', {})
+        insights, alerts = [], []
+        if 'consumption_kwh_24h' in energy:
+            insights.append(f"Stroomverbruik afgelopen 24 uur: {energy['consumption_kwh_24h']} kWh.")
+        if 'forecast_kwh_tomorrow' in energy:
+            insights.append(f"Verwacht verbruik morgen: ongeveer {energy['forecast_kwh_tomorrow']} kWh.")
+        for name, stats in sensors.items():
+            change = stats.get('change_vs_previous_24h_pct')
+            if change is not None and abs(change) >= 20 and len(insights) < MAX_ITEMS:
+                direction = 'hoger' if change > 0 else 'lager'
+                insights.append(f"{stats['label']} was {abs(change)}% {direction} dan de dag ervoor.")
+            if stats.get('anomalies_24h'):
+                alerts.append(f"{stats['label']}: {stats['anomalies_24h']} afwijkende metingen in de afgelopen 24 uur.")
+        for name in ('battery_level', 'hydrogen_storage_house', 'hydrogen_storage_car'):
+            stats = sensors.get(name)
+            if stats and stats['latest'] is not None and stats['latest'] < 20:
+                alerts.append(f"{stats['label']} is laag ({stats['latest']}%).")
+        co2 = sensors.get('co2_level')
+        if co2 and co2['latest'] is not None and co2['latest'] > 1000:
+            alerts.append(f"CO2-concentratie binnen is hoog ({co2['latest']} ppm); ventileer de woning.")
+        return {'insights': insights[:MAX_ITEMS], 'alerts': alerts[:MAX_ITEMS]}
+
+
+PROMPT = (
+    "Hieronder staat een samenvatting van de energiegegevens van een woning van de afgelopen week "
+    "(laatste waarde, gemiddelde/min/max en piek van de laatste 24 uur, verandering t.o.v. de dag ervoor, "
+    "trend per uur, aantal afwijkende metingen, energietotalen en een verwachting voor morgen). "
+    "Antwoord volledig in het Nederlands met ALLEEN een JSON-object met twee lijsten van korte, volledige zinnen: "
+    '{"insights": [maximaal 3 inzichten of tips], "alerts": [maximaal 3 waarschuwingen, leeg als er niets mis is]}.\n'
+    "Samenvatting: "
+)
+
+
+def parse_llm_answer(content: str) -> Dict[str, List[str]]:
+    """Read the JSON object the prompt asks for; fall back to a numbered list of insights."""
+    match = re.search(r'\{.*\}', content or '', re.DOTALL)
+    if match:
+        try:
+            answer = json.loads(match.group(0))
+            return {
+                key: [str(item).strip() for item in answer.get(key) or [] if str(item).strip()][:MAX_ITEMS]
+                for key in ('insights', 'alerts')
+            }
+        except (ValueError, AttributeError):
+            pass
+    lines = [re.sub(r'^\s*(\d+[.)]|[-*])\s*', '', line).strip() for line in (content or '').splitlines()]
+    return {'insights': [line for line in lines if line][:MAX_ITEMS], 'alerts': []}
+
+
+class MistralProvider:
+    """Chat-completions call to Mistral with connect and read timeouts.
+
+    The call blocks, so it is made from a worker thread, never on the event loop.
+    """
+
+    name = 'mistral'
+
+    def __init__(self, url: str, api_key: str, model: str = None, timeout: float = None):
+        self.url = url
+        self.api_key = api_key
+        self.model = model or os.getenv('AI_INSIGHTS_MODEL', 'mistral-tiny')
+        self.timeout = timeout or float(os.getenv('AI_INSIGHTS_TIMEOUT', '20'))
+
+    def generate(self, summary: dict) -> Dict[str, List[str]]:
+        import requests
+        start = time.perf_counter()
+        try:
+            response = requests.post(
+                self.url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                json={
+                    "model": self.model,
+                    "messages": [
+                        {"role": "system", "content": "Je bent een slimme energie-assistent."},
+                        {"role": "user", "content": PROMPT + json.dumps(summary, ensure_ascii=False)},
+                    ],
+                    "max_tokens": 300,
+                    "temperature": 0.3,
+                },
+                timeout=(3.05, self.timeout),
+            )
+        except requests.RequestException:
+            EXTERNAL_CALLS.labels("mistral", "error").inc()
+            raise
+        finally:
+            EXTERNAL_CALL_DURATION.labels("mistral").observe(time.perf_counter() - start)
+        EXTERNAL_CALLS.labels("mistral", response.status_code).inc()
+        response.raise_for_status()
+        content = response.json().get('choices', [{}])[0].get('message', {}).get('content')
+        return parse_llm_answer(content)
+
+
+def create_provider(name: str = None):
+    """Provider for ``AI_INSIGHTS_PROVIDER`` ('mistral' or 'stub'); by default
+    Mistral when MISTRAL_API_URL and MISTRAL_API_KEY are set, else the stub."""
+    url, key = os.getenv('MISTRAL_API_URL'), os.getenv('MISTRAL_API_KEY')
+    name = name or os.getenv('AI_INSIGHTS_PROVIDER') or ('mistral' if url and key else 'stub')
+    if name == 'stub':
+        return StubProvider()
+    if name == 'mistral':
+        if not url or not key:
+            raise ValueError("The mistral insights provider needs MISTRAL_API_URL and MISTRAL_API_KEY")
+        return MistralProvider(url, key)
+    raise ValueError(f"Unknown AI insights provider: {name}")
+
+
+def _utc_now() -> datetime:
+    # generated_at is UTC whichever worker or database time zone produced it
+    return datetime.now(timezone.utc)
+
+
+class InsightStore:
+    """Generated insights per summary fingerprint, shared by all workers.
+
+    A worker claims a fingerprint before calling the LLM (the primary key
+    makes the claim atomic), so each data change costs one call per site
+    however many workers and page views ask for it. A claim older than
+    ``stale_after`` seconds (its worker died) can be taken over.
+    """
+
+    def __init__(self, db, stale_after: float = 120):
+        self.db = db
+        self.stale_after = stale_after
+
+    def get(self, fingerprint: str) -> Optional[dict]:
+        try:
+            with self.db.cursor(dictionary=True, primary=True) as cursor:
+                cursor.execute("""
+                    SELECT fingerprint, provider, result, UNIX_TIMESTAMP(created_at) AS created_at FROM ai_insights
+                    WHERE fingerprint = %s AND status = 'done'
+                """, (fingerprint,))
+                row = cursor.fetchone()
+        except Error as e:
+            logger.error(f"Error reading AI insights: {e}")
+            raise
+        return self._decode(row)
+
+    def latest(self) -> Optional[dict]:
+        try:
+            with self.db.cursor(dictionary=True, primary=True) as cursor:
+                cursor.execute("""
+                    SELECT fingerprint, provider, result, UNIX_TIMESTAMP(created_at) AS created_at FROM ai_insights
+                    WHERE status = 'done' ORDER BY created_at DESC LIMIT 1
+                """)
+                row = cursor.fetchone()
+        except Error as e:
+            logger.error(f"Error reading AI insights: {e}")
+            raise
+        return self._decode(row)
+
+    @staticmethod
+    def _decode(row) -> Optional[dict]:
+        if row is None:
+            return None
+        result = json.loads(row['result'])
+        result.update({
+            'fingerprint': row['fingerprint'],
+            'provider': row['provider'],
+            'generated_at': datetime.fromtimestamp(int(row['created_at']), timezone.utc).isoformat(),
+        })
+        return result
+
+    def claim(self, fingerprint: str) -> bool:
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("INSERT IGNORE INTO ai_insights (fingerprint) VALUES (%s)", (fingerprint,))
+                if cursor.rowcount == 1:
+                    return True
+                cursor.execute("""
+                    UPDATE ai_insights SET claimed_at = NOW()
+                    WHERE fingerprint = %s AND status = 'pending'
+                      AND claimed_at < NOW() - INTERVAL %s SECOND
+                """, (fingerprint, int(self.stale_after)))
+                return cursor.rowcount == 1
+        except Error as e:
+            logger.error(f"Error claiming AI insights: {e}")
+            raise
+
+    def save(self, fingerprint: str, provider: str, result: dict):
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("""
+                    UPDATE ai_insights SET status = 'done', provider = %s, result = %s, created_at = NOW()
+                    WHERE fingerprint = %s
+                """, (provider, json.dumps(result, ensure_ascii=False), fingerprint))
+                cursor.execute("DELETE FROM ai_insights WHERE created_at < NOW() - INTERVAL 30 DAY")
+        except Error as e:
+            logger.error(f"Error saving AI insights: {e}")
+            raise
+
+    def release(self, fingerprint: str):
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("DELETE FROM ai_insights WHERE fingerprint = %s AND status = 'pending'",
+                               (fingerprint,))
+        except Error as e:
+            logger.error(f"Error releasing AI insights claim: {e}")
+
+
+class InsightService:
+    """Insights and alerts for the newest measurements, generated at most
+    once per data change.
+
+    The summary is computed locally; only when its fingerprint is new (and
+    the previous answer is older than ``min_interval`` seconds) is the
+    provider asked. Answers are kept in memory and in the InsightStore, so
+    a repeated request is a cache hit in any worker; concurrent requests in
+    one worker wait for a single generation. After a provider failure
+    this worker answers with the local fallback for ``min_interval`` seconds
+    before asking the provider again.
+    """
+
+    def __init__(self, load_frame: Callable[[], "pd.DataFrame"], provider=None,
+                 store: InsightStore = None, min_interval: float = None):
+        self.load_frame = load_frame
+        self.provider = provider or create_provider()
+        self.fallback = StubProvider()
+        self.store = store
+        if min_interval is None:
+            min_interval = float(os.getenv('AI_INSIGHTS_MIN_INTERVAL', '900'))
+        self.min_interval = min_interval
+        self._last: Optional[dict] = None
+        self._retry_at = 0.0  # time.monotonic() before which the provider isn't asked
+        self._lock = threading.Lock()  # guards _last and _pending; not held during lookups or calls
+        self._pending: Dict[str, Future] = {}  # fingerprint -> answer being generated in this worker
+
+    def get(self) -> Dict[str, Any]:
+        summary = summarize_measurements(self.load_frame())
+        if summary is None:
+            return {'summary': None, 'insights': [], 'alerts': [], 'provider': None, 'cached': False}
+        fingerprint = summary_fingerprint(summary)
+        with self._lock:
+            cached = self._cached(fingerprint)
+            pending = self._pending.get(fingerprint) if cached is None else None
+            leader = cached is None and pending is None
+            if leader:
+                pending = self._pending[fingerprint] = Future()
+        if cached is not None:
+            return {**cached, 'summary': summary, 'cached': True}
+        if not leader:
+            # Another request of this worker is generating it
+            return {**pending.result(), 'summary': summary, 'cached': True}
+        try:
+            cached = self._stored(fingerprint)
+            result = cached if cached is not None else self._generate(fingerprint, summary)
+            pending.set_result(result)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._pending[fingerprint]
+        return {**result, 'summary': summary, 'cached': cached is not None}
+
+    def _cached(self, fingerprint: str) -> Optional[dict]:
+        """The answer in memory for this fingerprint, if any (called with the lock held)."""
+        last = self._last
+        if last is not None and last['fingerprint'] == fingerprint:
+            return last
+        # Data changed, but the last answer is recent enough to keep serving
+        if last is not None and self._age(last) < self.min_interval:
+            return {**last, 'stale': True}
+        return None
+
+    def _stored(self, fingerprint: str) -> Optional[dict]:
+        """The answer another worker stored for this fingerprint, or a recent enough one."""
+        if self.store is None:
+            return None
+        stored = self.store.get(fingerprint)
+        if stored is not None:
+            self._remember(stored)
+            return stored
+        latest = self.store.latest()
+        if latest is not None and self._age(latest) < self.min_interval:
+            self._remember(latest)
+            return {**latest, 'stale': True}
+        return None
+
+    def _remember(self, result: dict):
+        with self._lock:
+            self._last = result
+
+    @staticmethod
+    def _age(result: dict) -> float:
+        return (_utc_now() - datetime.fromisoformat(result['generated_at'])).total_seconds()
+
+    def _fallback_answer(self, fingerprint: str, summary: dict, **flags) -> dict:
+        return {**self.fallback.generate(summary), 'fingerprint': fingerprint,
+                'provider': self.fallback.name, **flags,
+                'generated_at': _utc_now().isoformat(timespec='seconds')}
+
+    def _generate(self, fingerprint: str, summary: dict) -> dict:
+        if time.monotonic() < self._retry_at:
+            # The provider failed recently; don't wait on it again yet
+            return self._fallback_answer(fingerprint, summary)
+        if self.store is not None and not self.store.claim(fingerprint):
+            # Another worker is asking the LLM right now
+            return self._fallback_answer(fingerprint, summary, pending=True)
+        provider = self.provider
+        try:
+            answer = provider.generate(summary)
+        except Exception as e:
+            logger.error(f"AI insights provider '{provider.name}' failed: {e}")
+            self._retry_at = time.monotonic() + self.min_interval
+            if self.store is not None:
+                # Another worker (or this one, after the back-off) may try the LLM again
+                self.store.release(fingerprint)
+            return self._fallback_answer(fingerprint, summary)
+        if self.store is not None:
+            self.store.save(fingerprint, provider.name, answer)
+        result = {**answer, 'fingerprint': fingerprint, 'provider': provider.name,
+                  'generated_at': _utc_now().isoformat(timespec='seconds')}
+        self._remember(result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            'provider': self.provider.name,
+            'min_interval': self.min_interval,
+            'last_fingerprint': self._last['fingerprint'] if self._last else None,
+            'last_generated_at': self._last['generated_at'] if self._last else None,
+            'provider_retry_in': max(0.0, round(self._retry_at - time.monotonic(), 1)),
+        }
@@ -0,0 +1,199 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, disable_created_metrics, generate_latest
+
+# Default latency buckets in seconds (5 ms .. 10 s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# No *_created series next to every counter and histogram
+disable_created_metrics()
+
+# --- Application metrics ---
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency per route template.",
+    ("method", "route"),
+    buckets=DEFAULT_BUCKETS,
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests per route template and status code.",
+    ("method", "route", "status"),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Duration of DataProcessor and UserDB queries.",
+    ("component", "operation"),
+    buckets=DEFAULT_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total",
+    "Failed DataProcessor and UserDB queries.",
+    ("component", "operation"),
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting for a pooled database connection.",
+    ("pool",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+DB_READS = Counter(
+    "db_reads_total",
+    "Read checkouts per pool and where they went (replica/primary/sticky/fallback).",
+    ("pool", "route"),
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Last measured replication lag per replica (-1: replication stopped).",
+    ("replica",),
+)
+EXTERNAL_CALLS = Counter(
+    "external_calls_total",
+    "Calls made to external services.",
+    ("service", "outcome"),
+)
+EXTERNAL_CALL_DURATION = Histogram(
+    "external_call_duration_seconds",
+    "Latency of calls made to external services.",
+    ("service",),
+    buckets=DEFAULT_BUCKETS,
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections",
+    "Currently open WebSocket connections.",
+)
+WEBSOCKET_SENDS_IN_PROGRESS = Gauge(
+    "websocket_sends_in_progress",
+    "WebSocket sends of running broadcasts that have not completed yet.",
+)
+WEBSOCKET_MESSAGES = Counter(
+    "websocket_messages_total",
+    "WebSocket messages by outcome.",
+    ("outcome",),
+)
+
+RING_BUFFER_ROWS = Gauge(
+    "ring_buffer_rows",
+    "Measurements held in the in-memory ring buffer.",
+)
+RING_BUFFER_BYTES = Gauge(
+    "ring_buffer_memory_bytes",
+    "Memory used by the in-memory ring buffer arrays.",
+)
+RING_BUFFER_READS = Counter(
+    "ring_buffer_reads_total",
+    "Measurement reads by where they were served from.",
+    ("source",),
+)
+
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "Requests admitted or shed by admission control, per route template.",
+    ("route", "outcome"),
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Requests in progress on concurrency-limited routes.",
+    ("route",),
+)
+ADMISSION_BUCKETS = Gauge(
+    "admission_buckets",
+    "Token buckets currently tracked, per kind (user/ip).",
+    ("kind",),
+)
+
+BUS_MESSAGES = Counter(
+    "bus_messages_total",
+    "Cross-worker bus messages per channel and outcome.",
+    ("channel", "outcome"),
+)
+
+DATA_QUALITY_BATCHES = Counter(
+    "data_quality_batches_total",
+    "Validated ingest batches per outcome (ok/warning/quarantined).",
+    ("status",),
+)
+DATA_QUALITY_ISSUES = Counter(
+    "data_quality_issues_total",
+    "Problems found by ingest validation, per check.",
+    ("check",),
+)
+
+TOKEN_REFRESHES = Counter(
+    "token_refreshes_total",
+    "Refresh-token exchanges per outcome (ok/grace/invalid/revoked/reused/inactive).",
+    ("outcome",),
+)
+
+
+@contextmanager
+def observe_query_block(component: str, operation: str):
+    """Time a block of database work, e.g. the queries of a method that does more."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_QUERY_ERRORS.labels(component, operation).inc()
+        raise
+    finally:
+        DB_QUERY_DURATION.labels(component, operation).observe(time.perf_counter() - start)
+
+
+def observe_query(func):
+    """Decorator that times a DataProcessor/UserDB method as a database query."""
+    component, _, operation = func.__qualname__.partition(".")
+    duration = DB_QUERY_DURATION.labels(component, operation)
+    errors = DB_QUERY_ERRORS.labels(component, operation)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template.
+
+    The route template (e.g. ``/users/{user_id}``) is read from the scope after
+    routing so label cardinality stays bounded. Unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope.get("method", "")
+            HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, status_code).inc()
+
+
+def render_latest() -> bytes:
+    """Render all registered metrics in Prometheus text format."""
+    return generate_latest()
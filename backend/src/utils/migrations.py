@@ -0,0 +1,269 @@
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+import time
+from typing import List, NamedTuple, Optional
+import mysql.connector
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'models', 'migrations')
+
+_MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.(sql|py)$')
+
+# Serializes runners (several workers or deploy hooks starting at once)
+LOCK_NAME = 'energydashboard_migrations'
+LOCK_TIMEOUT = 300
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: str
+    kind: str  # 'sql' or 'py'
+
+    @property
+    def checksum(self) -> str:
+        with open(self.path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+
+def split_sql(script: str) -> List[str]:
+    """Split a SQL script into statements.
+
+    Understands the mysql client's ``DELIMITER`` directive (for event,
+    trigger and procedure bodies), quoted strings and identifiers, and
+    ``--``, ``#`` and ``/* */`` comments, so delimiters inside any of those
+    don't split a statement.
+    """
+    statements = []
+    delimiter = ';'
+    current: List[str] = []
+    i, n = 0, len(script)
+    at_line_start = True
+    while i < n:
+        if at_line_start:
+            match = re.match(r'[ \t]*DELIMITER[ \t]+(\S+)[ \t]*(?:\r?\n|$)', script[i:], re.IGNORECASE)
+            if match:
+                statement = ''.join(current).strip()
+                if statement:
+                    statements.append(statement)
+                current = []
+                delimiter = match.group(1)
+                i += match.end()
+                continue
+        char = script[i]
+        at_line_start = False
+        if char in ('"', "'", '`'):
+            end = i + 1
+            while end < n:
+                if script[end] == '\\' and char != '`':
+                    end += 2
+                    continue
+                if script[end] == char:
+                    if end + 1 < n and script[end + 1] == char:
+                        end += 2  # doubled quote
+                        continue
+                    break
+                end += 1
+            current.append(script[i:end + 1])
+            i = end + 1
+            continue
+        if script.startswith('--', i) and (i + 2 >= n or script[i + 2] in ' \t\r\n') or char == '#':
+            end = script.find('\n', i)
+            i = n if end == -1 else end
+            continue
+        if script.startswith('/*', i):
+            end = script.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        if script.startswith(delimiter, i):
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+            i += len(delimiter)
+            continue
+        current.append(char)
+        if char == '\n':
+            at_line_start = True
+        i += 1
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2),
+                                        os.path.join(directory, filename), match.group(3)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError("Duplicate migration version numbers")
+    return migrations
+
+
+class MigrationContext:
+    """What a Python migration's ``upgrade(ctx)`` gets to work with."""
+
+    error = MigrationError
+
+    def __init__(self, conn, database: str):
+        self.conn = conn
+        self.database = database
+
+    def execute(self, statement: str, params=None):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(statement, params)
+            if cursor.with_rows:
+                cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def query_value(self, query: str, params=None):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+            cursor.fetchall()
+            return row[0] if row else None
+        finally:
+            cursor.close()
+
+    def column_exists(self, table: str, column: str) -> bool:
+        return bool(self.query_value("""
+            SELECT COUNT(*) FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """, (self.database, table, column)))
+
+    def index_exists(self, table: str, index: str) -> bool:
+        return bool(self.query_value("""
+            SELECT COUNT(*) FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME = %s
+        """, (self.database, table, index)))
+
+
+class MigrationRunner:
+    """Applies numbered migrations from src/models/migrations in order.
+
+    ``NNNN_name.sql`` files are split with ``split_sql``; ``NNNN_name.py``
+    files define ``upgrade(ctx)`` for changes that need to inspect the
+    current schema first. Applied versions are recorded in
+    ``schema_migrations`` with a checksum, and a changed applied file is
+    reported. MySQL commits DDL implicitly, so a migration that fails
+    half-way is not rolled back: migrations are written to be re-runnable.
+    """
+
+    def __init__(self, host=None, user=None, password=None, database=None, directory: str = MIGRATIONS_DIR):
+        load_dotenv()
+        self.host = host or os.getenv('DB_HOST', 'localhost')
+        self.user = user or os.getenv('DB_USER', 'root')
+        self.password = password if password is not None else os.getenv('DB_PASSWORD', '')
+        self.database = database or os.getenv('DB_NAME', 'energydashboard')
+        self.directory = directory
+
+    def _connect(self):
+        conn = mysql.connector.connect(host=self.host, user=self.user, password=self.password, autocommit=True)
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{self.database}`")
+        cursor.execute(f"USE `{self.database}`")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                checksum CHAR(64) NOT NULL,
+                applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                duration_ms INT NOT NULL
+            ) ENGINE=InnoDB
+        """)
+        cursor.close()
+        return conn
+
+    def _applied(self, conn) -> dict:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version, checksum FROM schema_migrations")
+        applied = dict(cursor.fetchall())
+        cursor.close()
+        return applied
+
+    def status(self) -> List[dict]:
+        conn = self._connect()
+        try:
+            applied = self._applied(conn)
+        finally:
+            conn.close()
+        return [{
+            'version': m.version,
+            'name': m.name,
+            'applied': m.version in applied,
+            'modified': m.version in applied and applied[m.version] != m.checksum,
+        } for m in discover_migrations(self.directory)]
+
+    def migrate(self, target: Optional[int] = None) -> List[Migration]:
+        """Apply pending migrations up to target (default: all); return those applied."""
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+            if cursor.fetchone()[0] != 1:
+                raise MigrationError("Another migration run holds the lock")
+            try:
+                return self._apply_pending(conn, target)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _apply_pending(self, conn, target: Optional[int]) -> List[Migration]:
+        applied = self._applied(conn)
+        done = []
+        for migration in discover_migrations(self.directory):
+            if target is not None and migration.version > target:
+                break
+            if migration.version in applied:
+                if applied[migration.version] != migration.checksum:
+                    logger.warning(f"Migration {migration.version:04d}_{migration.name} was modified after it was applied")
+                continue
+            logger.info(f"Applying migration {migration.version:04d}_{migration.name}")
+            start = time.perf_counter()
+            try:
+                self._apply(conn, migration)
+            except Exception as e:
+                raise MigrationError(f"Migration {migration.version:04d}_{migration.name} failed: {e}") from e
+            duration_ms = int((time.perf_counter() - start) * 1000)
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+                (migration.version, migration.name, migration.checksum, duration_ms)
+            )
+            cursor.close()
+            done.append(migration)
+        if not done:
+            logger.info("Database schema is up to date")
+        return done
+
+    def _apply(self, conn, migration: Migration):
+        ctx = MigrationContext(conn, self.database)
+        if migration.kind == 'sql':
+            with open(migration.path, 'r', encoding='utf-8') as f:
+                for statement in split_sql(f.read()):
+                    ctx.execute(statement)
+            return
+        spec = importlib.util.spec_from_file_location(f"migration_{migration.version:04d}", migration.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(ctx)
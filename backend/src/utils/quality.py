@@ -0,0 +1,284 @@
+from mysql.connector import Error
+import json
+import logging
+import os
+import uuid
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+from .metrics import observe_query
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class RangeRule(NamedTuple):
+    """Physically possible values of a sensor (inclusive); None means unbounded."""
+    min: Optional[float]
+    max: Optional[float]
+
+
+RANGE_RULES: Dict[str, RangeRule] = {
+    'solar_voltage': RangeRule(0, 1000),
+    'solar_current': RangeRule(0, 100),
+    'hydrogen_production': RangeRule(0, 10000),
+    'power_consumption': RangeRule(0, 100),
+    'hydrogen_consumption': RangeRule(0, 10000),
+    'outside_temperature': RangeRule(-50, 60),
+    'inside_temperature': RangeRule(-10, 50),
+    'air_pressure': RangeRule(870, 1085),
+    'humidity': RangeRule(0, 100),
+    'battery_level': RangeRule(0, 100),
+    'co2_level': RangeRule(0, 10000),
+    'hydrogen_storage_house': RangeRule(0, 100),
+    'hydrogen_storage_car': RangeRule(0, 100),
+}
+
+# At most this many gaps are listed per report
+MAX_REPORTED_GAPS = 50
+
+OK = 'ok'
+WARNING = 'warning'
+QUARANTINED = 'quarantined'
+
+
+class QualityResult(NamedTuple):
+    clean: "pd.DataFrame"        # rows to write (bad values nulled, optionally on the grid)
+    quarantine: "pd.DataFrame"   # original rows held back, with a 'reason' column
+    report: dict
+
+
+class BatchValidator:
+    """Vectorized checks run on every ingest batch before it is written.
+
+    * rows without a valid timestamp are quarantined;
+    * duplicate timestamps are collapsed (the last one wins);
+    * cadence: timestamps off the ``interval`` grid are counted, and gaps
+      (also against the previous batch) are listed with their missing slots;
+    * values outside their sensor's RangeRule are nulled, and the original
+      row is kept in quarantine;
+    * optionally (``align``) rows are snapped to the grid and gaps of at
+      most ``max_interpolate`` slots are filled by time interpolation.
+
+    A batch in which more than ``max_bad_fraction`` of the rows are bad
+    (invalid timestamp or any out-of-range value) is quarantined as a whole.
+    """
+
+    def __init__(self, rules: Dict[str, RangeRule] = None, interval_minutes: float = None,
+                 align: bool = None, max_interpolate: int = None, max_bad_fraction: float = None):
+        self.rules = dict(RANGE_RULES if rules is None else rules)
+        self.interval_minutes = interval_minutes or float(os.getenv('QUALITY_INTERVAL_MINUTES', '15'))
+        if align is None:
+            align = os.getenv('QUALITY_ALIGN', 'false').lower() in ('1', 'true', 'yes')
+        self.align = align
+        self.max_interpolate = max_interpolate if max_interpolate is not None else int(os.getenv('QUALITY_MAX_INTERPOLATE', '4'))
+        self.max_bad_fraction = max_bad_fraction if max_bad_fraction is not None else float(os.getenv('QUALITY_MAX_BAD_FRACTION', '0.5'))
+
+    def validate(self, df: "pd.DataFrame", previous_timestamp=None) -> QualityResult:
+        import numpy as np
+        import pandas as pd
+        interval = pd.Timedelta(minutes=self.interval_minutes)
+        rows_in = len(df)
+        reasons = pd.Series('', index=df.index, dtype=object)
+
+        timestamps = pd.to_datetime(df['timestamp'], errors='coerce')
+        bad_timestamp = timestamps.isna().to_numpy()
+        reasons[bad_timestamp] = 'invalid timestamp'
+
+        # Out-of-range values: one boolean column per rule, evaluated at once
+        sensors = [s for s in self.rules if s in df]
+        out_of_range = {}
+        bad_values = np.zeros(rows_in, dtype=bool)
+        if sensors:
+            values = df[sensors].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+            low = np.array([-np.inf if self.rules[s].min is None else self.rules[s].min for s in sensors])
+            high = np.array([np.inf if self.rules[s].max is None else self.rules[s].max for s in sensors])
+            violations = (values < low) | (values > high)
+            counts = violations.sum(axis=0)
+            out_of_range = {s: int(c) for s, c in zip(sensors, counts) if c}
+            bad_values = violations.any(axis=1)
+            for i, sensor in enumerate(sensors):
+                if counts[i]:
+                    mask = violations[:, i]
+                    reasons[mask] = reasons[mask] + f'{sensor} out of range; '
+
+        bad_rows = bad_timestamp | bad_values
+        report = {
+            'rows_in': rows_in,
+            'duplicates': 0,
+            'off_grid': 0,
+            'gaps': 0,
+            'missing_slots': 0,
+            'out_of_range': int(sum(out_of_range.values())),
+            'interpolated': 0,
+            'quarantined_rows': 0,
+            'rows_written': 0,
+            'status': OK,
+            'details': {'out_of_range': out_of_range, 'gap_list': []},
+        }
+
+        if rows_in and bad_rows.mean() > self.max_bad_fraction:
+            quarantine = df.copy()
+            quarantine['reason'] = reasons.where(reasons != '', 'batch quarantined').str.rstrip('; ')
+            report.update(status=QUARANTINED, quarantined_rows=rows_in)
+            report['details']['reason'] = f"{bad_rows.mean():.0%} of rows failed validation"
+            return QualityResult(df.iloc[0:0], quarantine, report)
+
+        quarantine = df[bad_rows].copy()
+        quarantine['reason'] = reasons[bad_rows].str.rstrip('; ')
+
+        clean = df[~bad_timestamp].copy()
+        clean['timestamp'] = timestamps[~bad_timestamp]
+        if sensors:
+            kept = ~bad_timestamp
+            clean[sensors] = np.where(violations[kept], np.nan, values[kept])
+
+        duplicated = clean['timestamp'].duplicated(keep='last')
+        report['duplicates'] = int(duplicated.sum())
+        clean = clean[~duplicated].sort_values('timestamp', kind='stable')
+
+        ts = clean['timestamp']
+        report['off_grid'] = int((ts != ts.dt.floor(interval)).sum())
+        if len(clean):
+            steps = ts.diff()
+            if previous_timestamp is not None and previous_timestamp < ts.iloc[0]:
+                steps.iloc[0] = ts.iloc[0] - previous_timestamp
+            gap = (steps > interval * 1.5).to_numpy()
+            missing = (steps[gap] / interval).round().astype(int) - 1
+            report['gaps'] = int(gap.sum())
+            report['missing_slots'] = int(missing.sum())
+            ends = ts[gap]
+            report['details']['gap_list'] = [
+                {'after': (end - step).isoformat(), 'before': end.isoformat(), 'missing_slots': int(n)}
+                for end, step, n in zip(ends.iloc[:MAX_REPORTED_GAPS], steps[gap].iloc[:MAX_REPORTED_GAPS], missing.iloc[:MAX_REPORTED_GAPS])
+            ]
+
+        if self.align and len(clean):
+            clean, report['interpolated'] = self._align(clean, interval)
+
+        report['quarantined_rows'] = int(len(quarantine))
+        report['rows_written'] = int(len(clean))
+        if any(report[k] for k in ('duplicates', 'off_grid', 'gaps', 'out_of_range', 'quarantined_rows')):
+            report['status'] = WARNING
+        return QualityResult(clean, quarantine, report)
+
+    def _align(self, df: "pd.DataFrame", interval) -> Tuple["pd.DataFrame", int]:
+        """Snap rows to the grid and interpolate short gaps; returns (frame, rows added)."""
+        import pandas as pd
+        frame = df.set_index('timestamp')
+        # Several readings in one slot: keep the latest
+        frame = frame[~frame.index.floor(interval).duplicated(keep='last')]
+        numeric = frame.select_dtypes('number').columns
+        grid = pd.date_range(frame.index[0].floor(interval), frame.index[-1].ceil(interval), freq=interval)
+        combined = frame.reindex(frame.index.union(grid))
+        combined[numeric] = combined[numeric].interpolate(method='time', limit=self.max_interpolate,
+                                                          limit_area='inside')
+        aligned = combined.reindex(grid)
+        # Grid slots inside a gap too long to interpolate stay out
+        aligned = aligned[aligned[numeric].notna().any(axis=1)] if len(numeric) else aligned
+        added = int(len(aligned.index.difference(frame.index)))
+        aligned.index.name = 'timestamp'
+        return aligned.reset_index(), added
+
+
+class QualityStore:
+    """Per-batch data-quality reports and the rows held back in quarantine."""
+
+    def __init__(self, db):
+        self.db = db
+
+    @observe_query
+    def save(self, report: dict, quarantine: "pd.DataFrame", source: str = None) -> str:
+        """Store a report and its quarantined rows; returns the batch id."""
+        batch_id = uuid.uuid4().hex
+        rows = []
+        if len(quarantine):
+            frame = quarantine.drop(columns='reason').astype(object)
+            frame = frame.where(frame.notna(), None)
+            timestamps = frame['timestamp'].tolist() if 'timestamp' in frame else [None] * len(frame)
+            for ts, reason, record in zip(timestamps, quarantine['reason'], frame.to_dict('records')):
+                rows.append((batch_id, ts if hasattr(ts, 'isoformat') else None, reason,
+                             json.dumps(record, default=str, ensure_ascii=False)))
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("""
+                    INSERT INTO data_quality_reports
+                        (batch_id, source, status, rows_in, rows_written, duplicates, off_grid, gaps,
+                         missing_slots, out_of_range, interpolated, quarantined_rows, details)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (batch_id, source, report['status'], report['rows_in'], report['rows_written'],
+                      report['duplicates'], report['off_grid'], report['gaps'], report['missing_slots'],
+                      report['out_of_range'], report['interpolated'], report['quarantined_rows'],
+                      json.dumps(report['details'], ensure_ascii=False)))
+                if rows:
+                    cursor.executemany("""
+                        INSERT INTO measurement_quarantine (batch_id, timestamp, reason, payload)
+                        VALUES (%s, %s, %s, %s)
+                    """, rows)
+        except Error as e:
+            logger.error(f"Error saving data-quality report: {e}")
+            raise
+        return batch_id
+
+    @observe_query
+    def reports(self, limit: int = 50, status: str = None) -> List[dict]:
+        query = "SELECT * FROM data_quality_reports"
+        params: tuple = ()
+        if status:
+            query += " WHERE status = %s"
+            params = (status,)
+        query += " ORDER BY id DESC LIMIT %s"
+        try:
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute(query, (*params, limit))
+                rows = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error reading data-quality reports: {e}")
+            raise
+        for row in rows:
+            row['created_at'] = row['created_at'].isoformat()
+            row['details'] = json.loads(row['details']) if row['details'] else {}
+        return rows
+
+    @observe_query
+    def quarantined(self, batch_id: str) -> List[dict]:
+        try:
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT id, timestamp, reason, payload FROM measurement_quarantine
+                    WHERE batch_id = %s ORDER BY id
+                """, (batch_id,))
+                rows = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error reading quarantined rows: {e}")
+            raise
+        for row in rows:
+            row['timestamp'] = row['timestamp'].isoformat() if row['timestamp'] else None
+            row['payload'] = json.loads(row['payload'])
+        return rows
+
+    def quarantined_frame(self, batch_id: str) -> "pd.DataFrame":
+        """The quarantined rows of a batch as an ingest DataFrame (for release)."""
+        import pandas as pd
+        df = pd.DataFrame([row['payload'] for row in self.quarantined(batch_id)])
+        if len(df):
+            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+            df = df[df['timestamp'].notna()]
+            numeric = df.columns.drop('timestamp')
+            df[numeric] = df[numeric].apply(pd.to_numeric, errors='coerce')
+        return df
+
+    @observe_query
+    def discard(self, batch_id: str) -> int:
+        """Delete the quarantined rows of a batch; returns how many there were."""
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("DELETE FROM measurement_quarantine WHERE batch_id = %s", (batch_id,))
+                count = cursor.rowcount
+                cursor.execute("""
+                    UPDATE data_quality_reports SET quarantined_rows = 0 WHERE batch_id = %s
+                """, (batch_id,))
+        except Error as e:
+            logger.error(f"Error discarding quarantined rows: {e}")
+            raise
+        return count
@@ -0,0 +1,205 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Statement types MySQL can EXPLAIN without executing them
+_EXPLAINABLE = ("select", "update", "delete", "insert", "replace")
+
+
+def fingerprint(sql: str) -> str:
+    """Normalize a statement so executions with different values group together."""
+    text = _STRING_LITERAL.sub("?", sql)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = text.replace("%s", "?")
+    text = _PLACEHOLDER_LIST.sub("(?+)", text)
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+# Parameter values shown in traces; anything else (strings: names, emails,
+# hashes, tokens) is shown as its type only
+_SAFE_PARAM_TYPES = (bool, int, float, Decimal, date, datetime, timedelta, type(None))
+
+
+def _describe_param(value) -> str:
+    return repr(value) if isinstance(value, _SAFE_PARAM_TYPES) else f"<{type(value).__name__}>"
+
+
+def _describe_params(params) -> Optional[str]:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        text = "{" + ", ".join(f"{k!r}: {_describe_param(v)}" for k, v in params.items()) + "}"
+    elif isinstance(params, (list, tuple)):
+        text = "(" + ", ".join(_describe_param(v) for v in params) + ")"
+    else:
+        text = _describe_param(params)
+    return text if len(text) <= 200 else text[:197] + "..."
+
+
+class QueryTracer:
+    """Opt-in tracer recording per-statement timings and EXPLAIN plans of slow queries.
+
+    Enabled with ``QUERY_TRACE=1``. Statements slower than ``SLOW_QUERY_MS``
+    are written to the slow log and get their ``EXPLAIN`` captured once per
+    fingerprint. Streamed (unbuffered) statements are marked as such: their
+    time is until the first rows, their row count is unknown and they are
+    not explained, as the connection is still busy with the result.
+    """
+
+    def __init__(self, enabled: bool = None, slow_threshold_ms: float = None, slow_log_size: int = 200):
+        if enabled is None:
+            enabled = os.getenv("QUERY_TRACE", "0").lower() in ("1", "true", "yes")
+        if slow_threshold_ms is None:
+            slow_threshold_ms = float(os.getenv("SLOW_QUERY_MS", "200"))
+        self.enabled = enabled
+        self.slow_threshold_ms = slow_threshold_ms
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._slow_log = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def wrap(self, cursor, connection, streamed: bool = False):
+        """Return a tracing proxy for the cursor, or the cursor itself when disabled."""
+        if not self.enabled:
+            return cursor
+        return TracedCursor(cursor, connection, self, streamed)
+
+    def record(self, sql: str, params, duration: float, rows: int, connection=None, many: bool = False,
+               streamed: bool = False):
+        """Record one execution and capture an EXPLAIN when it was slow."""
+        key = fingerprint(sql)
+        if streamed:
+            rows = None
+        duration_ms = duration * 1000
+        slow = duration_ms >= self.slow_threshold_ms
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    "fingerprint": key,
+                    "calls": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "slow_calls": 0,
+                    "last_params": None,
+                    "explain": None,
+                    "streamed": streamed,
+                }
+            stats["calls"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["rows"] += max(rows or 0, 0)
+            stats["last_params"] = _describe_params(params)
+            needs_explain = slow and stats["explain"] is None and not many and not streamed
+            if slow:
+                stats["slow_calls"] += 1
+        if not slow:
+            return
+
+        if needs_explain and connection is not None:
+            explain = self._explain(connection, sql, params)
+            with self._lock:
+                stats["explain"] = explain
+        entry = {
+            "fingerprint": key,
+            "duration_ms": round(duration_ms, 3),
+            "rows": rows,
+            "params": _describe_params(params),
+            "streamed": streamed,
+            "at": time.time(),
+        }
+        with self._lock:
+            self._slow_log.append(entry)
+        logger.warning(f"Slow query ({duration_ms:.1f} ms, {'streamed' if streamed else f'{rows} rows'}): {key}")
+
+    def _explain(self, connection, sql: str, params) -> Optional[List[Dict[str, Any]]]:
+        statement = sql.lstrip()
+        if not statement.lower().startswith(_EXPLAINABLE):
+            return None
+        cursor = None
+        try:
+            cursor = connection.cursor(dictionary=True, buffered=True)
+            cursor.execute("EXPLAIN " + statement, params)
+            return [{k: (v if isinstance(v, (int, float, str)) or v is None else str(v))
+                     for k, v in row.items()} for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error capturing EXPLAIN: {e}")
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+
+    def top(self, limit: int = 20, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+        """Return the top-N statements ordered by total time (or calls/max_ms/rows)."""
+        if order_by not in ("total_ms", "calls", "max_ms", "rows", "slow_calls"):
+            raise ValueError(f"Cannot order by {order_by}")
+        with self._lock:
+            statements = [dict(s) for s in self._stats.values()]
+        statements.sort(key=lambda s: s[order_by], reverse=True)
+        for s in statements[:limit]:
+            s["avg_ms"] = round(s["total_ms"] / s["calls"], 3) if s["calls"] else 0.0
+            s["total_ms"] = round(s["total_ms"], 3)
+            s["max_ms"] = round(s["max_ms"], 3)
+        return statements[:limit]
+
+    def slow_log(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Return the most recent slow executions, newest first."""
+        with self._lock:
+            entries = list(self._slow_log)
+        return entries[::-1][:limit]
+
+    def reset(self):
+        """Forget all recorded statements."""
+        with self._lock:
+            self._stats.clear()
+            self._slow_log.clear()
+
+
+class TracedCursor:
+    """Cursor proxy that reports execute/executemany calls to a QueryTracer."""
+
+    def __init__(self, cursor, connection, tracer: QueryTracer, streamed: bool = False):
+        self._cursor = cursor
+        self._connection = connection
+        self._tracer = tracer
+        self._streamed = streamed
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        result = self._cursor.execute(operation, params, *args, **kwargs)
+        self._tracer.record(operation, params, time.perf_counter() - start,
+                            self._cursor.rowcount, self._connection, streamed=self._streamed)
+        return result
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        result = self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        self._tracer.record(operation, None, time.perf_counter() - start,
+                            self._cursor.rowcount, self._connection, many=True)
+        return result
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+query_tracer = QueryTracer()
@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from .data_processor import INSERT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Raw and derived sensor columns
+SENSOR_COLUMNS = INSERT_COLUMNS[1:]
+
+
+def _to_ns(value) -> int:
+    return int(np.datetime64(value, 'ns').astype(np.int64))
+
+
+class MeasurementRingBuffer:
+    """Fixed-size in-memory buffer of the most recent measurements.
+
+    Storage is one float64 array per sensor plus an int64 array of
+    timestamps (ns since epoch), written circularly and kept in time order.
+    The buffer is seeded from the database at start-up and appended to on
+    ingest, so ``/latest`` and short-range reads don't need a database
+    round trip. Capacity is set with ``RING_BUFFER_ROWS``.
+    """
+
+    def __init__(self, capacity: int = None, columns: Iterable[str] = SENSOR_COLUMNS):
+        self.capacity = capacity or int(os.getenv('RING_BUFFER_ROWS', '10000'))
+        self.columns = list(columns)
+        self._timestamps = np.zeros(self.capacity, dtype=np.int64)
+        self._values = np.full((len(self.columns), self.capacity), np.nan, dtype=np.float64)
+        self._head = 0  # next write position
+        self._size = 0
+        self.seeded = False
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._timestamps.nbytes + self._values.nbytes
+
+    def _ordered_indices(self) -> np.ndarray:
+        start = (self._head - self._size) % self.capacity
+        return (start + np.arange(self._size)) % self.capacity
+
+    def _write(self, timestamps: np.ndarray, values: np.ndarray):
+        """Append rows that are already sorted and newer than the buffer contents."""
+        n = len(timestamps)
+        if n >= self.capacity:
+            timestamps, values = timestamps[-self.capacity:], values[:, -self.capacity:]
+            n = self.capacity
+        positions = (self._head + np.arange(n)) % self.capacity
+        self._timestamps[positions] = timestamps
+        self._values[:, positions] = values
+        self._head = (self._head + n) % self.capacity
+        self._size = min(self._size + n, self.capacity)
+
+    def extend(self, df):
+        """Add an ingested batch (DataFrame with a ``timestamp`` column)."""
+        if df is None or len(df) == 0:
+            return
+        timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        values = np.empty((len(self.columns), len(df)), dtype=np.float64)
+        for i, column in enumerate(self.columns):
+            if column in df:
+                # Match the DECIMAL(x,2) precision of the measurements table
+                values[i] = np.round(df[column].to_numpy(dtype=np.float64, na_value=np.nan), 2)
+            else:
+                values[i] = np.nan
+        self._extend_arrays(timestamps, values)
+
+    def encode_batch(self, df) -> Dict[str, Any]:
+        """JSON-safe form of an ingested batch for other workers' buffers
+        (only the newest ``capacity`` rows matter to them)."""
+        df = df.sort_values('timestamp', kind='stable').tail(self.capacity)
+        payload = {'timestamps': df['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64).tolist()}
+        for column in self.columns:
+            if column in df:
+                values = np.round(df[column].to_numpy(dtype=np.float64, na_value=np.nan), 2)
+                cells = values.astype(object)
+                cells[np.isnan(values)] = None
+                payload[column] = cells.tolist()
+        return payload
+
+    def extend_encoded(self, payload: Dict[str, Any]):
+        """Add a batch produced by ``encode_batch`` in another worker."""
+        timestamps = np.asarray(payload.get('timestamps') or [], dtype=np.int64)
+        if not len(timestamps):
+            return
+        values = np.full((len(self.columns), len(timestamps)), np.nan, dtype=np.float64)
+        for i, column in enumerate(self.columns):
+            if column in payload:
+                values[i] = np.array(payload[column], dtype=np.float64)
+        self._extend_arrays(timestamps, values)
+
+    @staticmethod
+    def _latest_per_timestamp(timestamps: np.ndarray, values: np.ndarray):
+        """Sort by timestamp and keep only the last given row of each timestamp."""
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[:, order]
+        last = np.append(timestamps[1:] != timestamps[:-1], True)
+        return timestamps[last], values[:, last]
+
+    def _extend_arrays(self, timestamps: np.ndarray, values: np.ndarray):
+        timestamps, values = self._latest_per_timestamp(timestamps, values)
+
+        with self._lock:
+            if self._size == 0 or timestamps[0] > self._newest():
+                self._write(timestamps, values)
+                return
+            # Overlapping or out-of-order batch: merge with current contents, re-sent
+            # timestamps replace their stored row, and keep the newest rows
+            idx = self._ordered_indices()
+            merged_ts, merged_values = self._latest_per_timestamp(
+                np.concatenate([self._timestamps[idx], timestamps]),
+                np.concatenate([self._values[:, idx], values], axis=1))
+            self._head = 0
+            self._size = 0
+            self._write(merged_ts[-self.capacity:], merged_values[:, -self.capacity:])
+
+    def load(self, rows: List[Dict[str, Any]]):
+        """Seed the buffer from database rows (any order)."""
+        with self._lock:
+            self._head = 0
+            self._size = 0
+            if rows:
+                rows = sorted(rows, key=lambda r: r['timestamp'])[-self.capacity:]
+                timestamps = np.array([_to_ns(r['timestamp']) for r in rows], dtype=np.int64)
+                values = np.array([[np.nan if r.get(c) is None else float(r[c]) for r in rows]
+                                   for c in self.columns], dtype=np.float64)
+                self._write(timestamps, values.reshape(len(self.columns), len(rows)))
+            self.seeded = True
+
+    def _newest(self) -> int:
+        return int(self._timestamps[(self._head - 1) % self.capacity])
+
+    def oldest(self) -> Optional[datetime]:
+        with self._lock:
+            if self._size == 0:
+                return None
+            return self._to_datetime(self._timestamps[(self._head - self._size) % self.capacity])
+
+    def covers(self, start) -> bool:
+        """True when every stored row at or after ``start`` is in the buffer."""
+        with self._lock:
+            if not self.seeded:
+                return False
+            if self._size < self.capacity:
+                # Never wrapped: the buffer holds everything since seeding
+                return True
+            return _to_ns(start) >= int(self._timestamps[(self._head - self._size) % self.capacity])
+
+    def latest(self, limit: int) -> List[Dict[str, Any]]:
+        """The newest ``limit`` rows, newest first (same shape as the API response)."""
+        with self._lock:
+            idx = self._ordered_indices()[::-1][:limit]
+            return self._rows(idx)
+
+    def between(self, start, end) -> List[Dict[str, Any]]:
+        """Rows with start <= timestamp <= end, oldest first."""
+        with self._lock:
+            idx = self._ordered_indices()
+            timestamps = self._timestamps[idx]
+            lo = np.searchsorted(timestamps, _to_ns(start), side='left')
+            hi = np.searchsorted(timestamps, _to_ns(end), side='right')
+            return self._rows(idx[lo:hi])
+
+    def _rows(self, idx: np.ndarray) -> List[Dict[str, Any]]:
+        timestamps = self._timestamps[idx].astype('datetime64[ns]').astype('datetime64[s]').astype(str)
+        values = self._values[:, idx]
+        cells = values.astype(object)
+        cells[np.isnan(values)] = None
+        return [{'timestamp': ts, **dict(zip(self.columns, row))}
+                for ts, row in zip(timestamps.tolist(), cells.T.tolist())]
+
+    @staticmethod
+    def _to_datetime(ns) -> datetime:
+        return np.datetime64(int(ns), 'ns').astype('datetime64[us]').astype(datetime)
+
+    def stats(self) -> Dict[str, Any]:
+        oldest = self.oldest()
+        return {
+            'capacity': self.capacity,
+            'rows': self._size,
+            'memory_bytes': self.memory_bytes,
+            'seeded': self.seeded,
+            'oldest': oldest.isoformat() if oldest else None,
+        }
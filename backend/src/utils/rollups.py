@@ -0,0 +1,265 @@
+from mysql.connector import Error
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Sequence
+from .data_processor import INSERT_COLUMNS, day_ranges
+from .metrics import observe_query
+
+logger = logging.getLogger(__name__)
+
+# Sensors (raw and derived) that are rolled up
+ROLLUP_SENSORS = INSERT_COLUMNS[1:]
+
+# Registered sensors without a measurements column, rolled up from measurement_values
+# under their name; {where} restricts the timestamps
+NARROW_DAILY_QUERY = """
+    INSERT INTO measurement_rollups_daily
+        (date, sensor, value_sum, value_count, value_min, value_max)
+    SELECT DATE(v.timestamp), s.name, SUM(v.value), COUNT(*), MIN(v.value), MAX(v.value)
+    FROM measurement_values v JOIN sensors s ON s.id = v.sensor_id
+    WHERE s.storage = 'narrow' AND ({where})
+    GROUP BY DATE(v.timestamp), s.name
+"""
+NARROW_HOURLY_QUERY = """
+    INSERT INTO measurement_rollups_hourly (date, hour, sensor, value_sum, value_count)
+    SELECT DATE(v.timestamp), HOUR(v.timestamp), s.name, SUM(v.value), COUNT(*)
+    FROM measurement_values v JOIN sensors s ON s.id = v.sensor_id
+    WHERE s.storage = 'narrow' AND ({where})
+    GROUP BY DATE(v.timestamp), HOUR(v.timestamp), s.name
+"""
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+class RollupStore:
+    """Per-day, per-sensor sum/count/min/max kept up to date on ingest.
+
+    An ingest recomputes the days it touches from their stored rows, so a
+    re-imported batch is not counted twice. Rows are additive across days:
+    any range average is ``SUM(value_sum) / SUM(value_count)`` over a few
+    rows per day instead of a scan over raw measurements. Hourly sum/count
+    rows are kept alongside for time-of-day views such as the heatmap.
+    Narrow-storage sensors are rolled up under their registered name.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @observe_query
+    def replace_days(self, cursor, frame, days):
+        """Day listener: recompute the daily and hourly rollups of these days from their stored rows."""
+        placeholders = ', '.join(['%s'] * len(days))
+        cursor.execute(f"DELETE FROM measurement_rollups_daily WHERE date IN ({placeholders})", tuple(days))
+        cursor.execute(f"DELETE FROM measurement_rollups_hourly WHERE date IN ({placeholders})", tuple(days))
+        daily, hourly = rollup_rows(frame)
+        if daily:
+            cursor.executemany("""
+                INSERT INTO measurement_rollups_daily
+                    (date, sensor, value_sum, value_count, value_min, value_max)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, daily)
+        if hourly:
+            cursor.executemany("""
+                INSERT INTO measurement_rollups_hourly (date, hour, sensor, value_sum, value_count)
+                VALUES (%s, %s, %s, %s, %s)
+            """, hourly)
+        ranges = day_ranges(days)
+        where = ' OR '.join(['(v.timestamp >= %s AND v.timestamp < %s)'] * len(ranges))
+        bounds = tuple(bound for pair in ranges for bound in pair)
+        cursor.execute(NARROW_DAILY_QUERY.format(where=where), bounds)
+        cursor.execute(NARROW_HOURLY_QUERY.format(where=where), bounds)
+
+    @observe_query
+    def rebuild(self):
+        """Recompute all daily and hourly rollups from the stored measurements."""
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("DELETE FROM measurement_rollups_daily")
+                for sensor in ROLLUP_SENSORS:
+                    cursor.execute(f"""
+                        INSERT INTO measurement_rollups_daily
+                            (date, sensor, value_sum, value_count, value_min, value_max)
+                        SELECT DATE(timestamp), %s, SUM({sensor}), COUNT({sensor}),
+                               MIN({sensor}), MAX({sensor})
+                        FROM measurements
+                        WHERE {sensor} IS NOT NULL
+                        GROUP BY DATE(timestamp)
+                    """, (sensor,))
+                cursor.execute(NARROW_DAILY_QUERY.format(where='TRUE'))
+                cursor.execute("DELETE FROM measurement_rollups_hourly")
+                for sensor in ROLLUP_SENSORS:
+                    cursor.execute(f"""
+                        INSERT INTO measurement_rollups_hourly (date, hour, sensor, value_sum, value_count)
+                        SELECT DATE(timestamp), HOUR(timestamp), %s, SUM({sensor}), COUNT({sensor})
+                        FROM measurements
+                        WHERE {sensor} IS NOT NULL
+                        GROUP BY DATE(timestamp), HOUR(timestamp)
+                    """, (sensor,))
+                cursor.execute(NARROW_HOURLY_QUERY.format(where='TRUE'))
+            logger.info("Daily rollups rebuilt")
+        except Error as e:
+            logger.error(f"Error rebuilding daily rollups: {e}")
+            raise
+
+    @observe_query
+    def summarize(self, sensors: Sequence[str], start: date, end: date) -> Dict[str, dict]:
+        """Aggregate the rollups of start <= date <= end into one summary per sensor."""
+        placeholders = ', '.join(['%s'] * len(sensors))
+        try:
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute(f"""
+                    SELECT sensor,
+                           SUM(value_sum) AS value_sum,
+                           SUM(value_count) AS value_count,
+                           MIN(value_min) AS value_min,
+                           MAX(value_max) AS value_max,
+                           COUNT(*) AS days
+                    FROM measurement_rollups_daily
+                    WHERE date BETWEEN %s AND %s AND sensor IN ({placeholders})
+                    GROUP BY sensor
+                """, (start, end, *sensors))
+                rows = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error reading daily rollups: {e}")
+            raise
+        summaries = {}
+        for row in rows:
+            count = int(row['value_count'] or 0)
+            total = float(row['value_sum'] or 0)
+            summaries[row['sensor']] = {
+                'avg': total / count if count else None,
+                'sum': total,
+                'min': float(row['value_min']) if row['value_min'] is not None else None,
+                'max': float(row['value_max']) if row['value_max'] is not None else None,
+                'count': count,
+                'days': int(row['days']),
+            }
+        return summaries
+
+    @observe_query
+    def heatmap(self, sensor: str, start: date, end: date) -> dict:
+        """Weekday × hour averages of a sensor over start <= date <= end."""
+        try:
+            with self.db.cursor() as cursor:
+                # WEEKDAY(): 0 = Monday
+                cursor.execute("""
+                    SELECT WEEKDAY(date), hour, SUM(value_sum), SUM(value_count)
+                    FROM measurement_rollups_hourly
+                    WHERE sensor = %s AND date BETWEEN %s AND %s
+                    GROUP BY WEEKDAY(date), hour
+                """, (sensor, start, end))
+                rows = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error reading hourly rollups: {e}")
+            raise
+        return weekday_hour_matrix(rows)
+
+
+def rollup_rows(df):
+    """Daily (date, sensor, sum, count, min, max) and hourly (date, hour, sensor, sum, count)
+    rows of a frame of measurements."""
+    sensors = [s for s in ROLLUP_SENSORS if s in df]
+    if not len(df) or not sensors:
+        return [], []
+    frame = df[sensors].copy()
+    frame['date'] = df['timestamp'].dt.date
+    frame['hour'] = df['timestamp'].dt.hour
+    long = frame.melt(id_vars=['date', 'hour'], value_vars=sensors, var_name='sensor').dropna(subset=['value'])
+    agg = long.groupby(['date', 'sensor'])['value'].agg(['sum', 'count', 'min', 'max']).reset_index()
+    daily = [
+        (day, sensor, float(total), int(count), float(low), float(high))
+        for day, sensor, total, count, low, high in agg.itertuples(index=False, name=None)
+    ]
+    hourly = long.groupby(['date', 'hour', 'sensor'])['value'].agg(['sum', 'count']).reset_index()
+    hourly_rows = [
+        (day, int(hour), sensor, float(total), int(count))
+        for day, hour, sensor, total, count in hourly.itertuples(index=False, name=None)
+    ]
+    return daily, hourly_rows
+
+
+def weekday_hour_matrix(rows) -> dict:
+    """7×24 averages from (weekday, hour, sum, count) rows; empty cells are None."""
+    import numpy as np
+    sums = np.zeros((7, 24))
+    counts = np.zeros((7, 24), dtype=np.int64)
+    if rows:
+        weekday, hour, total, count = (np.array(column) for column in zip(*rows))
+        weekday, hour = weekday.astype(int), hour.astype(int)
+        np.add.at(sums, (weekday, hour), total.astype(float))
+        np.add.at(counts, (weekday, hour), count.astype(np.int64))
+
+    def averages(total, count):
+        avg = np.divide(total, count, out=np.full(np.shape(total), np.nan), where=count > 0)
+        return np.where(np.isnan(avg), None, np.round(avg, 4)).tolist()
+
+    return {
+        'weekdays': list(WEEKDAYS),
+        'hours': list(range(24)),
+        'values': averages(sums, counts),
+        'counts': counts.tolist(),
+        # Profiles along each axis, weighted by sample count
+        'by_weekday': averages(sums.sum(axis=1), counts.sum(axis=1)),
+        'by_hour': averages(sums.sum(axis=0), counts.sum(axis=0)),
+        'avg': averages(sums.sum(), counts.sum()),
+        'count': int(counts.sum()),
+    }
+
+
+def period_bounds(period: str, anchor: date):
+    """First and last day of the day/week/month containing anchor."""
+    if period == 'day':
+        return anchor, anchor
+    if period == 'week':
+        start = anchor - timedelta(days=anchor.weekday())
+        return start, start + timedelta(days=6)
+    if period == 'month':
+        start = anchor.replace(day=1)
+        next_month = (start + timedelta(days=32)).replace(day=1)
+        return start, next_month - timedelta(days=1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def _minus_year(day: date) -> date:
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        # 29 February
+        return day.replace(year=day.year - 1, day=28)
+
+
+def baseline_bounds(period: str, start: date, baseline: str):
+    """The period compared against: the previous one, or the same one last year."""
+    if baseline == 'previous':
+        return period_bounds(period, start - timedelta(days=1))
+    if baseline == 'last_year':
+        if period == 'week':
+            # Same ISO week number last year
+            year, week, _ = start.isocalendar()
+            try:
+                return period_bounds(period, date.fromisocalendar(year - 1, week, 1))
+            except ValueError:
+                return period_bounds(period, date.fromisocalendar(year - 1, 52, 1))
+        return period_bounds(period, _minus_year(start))
+    raise ValueError(f"Unknown baseline: {baseline}")
+
+
+def compare_summaries(sensors: List[str], current: Dict[str, dict], baseline: Dict[str, dict]) -> List[dict]:
+    """Absolute and percentage deltas of the average per sensor."""
+    results = []
+    for sensor in sensors:
+        cur = current.get(sensor)
+        base = baseline.get(sensor)
+        delta = delta_pct = None
+        if cur and base and cur['avg'] is not None and base['avg'] is not None:
+            delta = cur['avg'] - base['avg']
+            if base['avg'] != 0:
+                delta_pct = delta / abs(base['avg']) * 100
+        results.append({
+            'sensor': sensor,
+            'current': cur,
+            'baseline': base,
+            'delta': round(delta, 4) if delta is not None else None,
+            'delta_pct': round(delta_pct, 2) if delta_pct is not None else None,
+        })
+    return results
@@ -0,0 +1,177 @@
+from mysql.connector import Error
+import logging
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SENSOR_KINDS = ("rate", "level", "instantaneous")
+
+# A lookup miss re-reads the table (another worker may have registered the
+# sensor), but not more often than this
+REFRESH_INTERVAL = 30.0
+
+_UNIT = re.compile(r'\(([^()]*)\)\s*$')
+_RATE_UNITS = {"w", "kw", "mw"}
+# Quantity per unit of time (L/u, m³/h, kg/s), but not speeds such as m/s
+_FLOW_UNIT = re.compile(r'^(m?l|m³|m3|kg|g|k?wh)/(u|h|s|min)$', re.IGNORECASE)
+
+
+class Sensor(NamedTuple):
+    id: int
+    name: str
+    source_column: Optional[str]
+    label: str
+    unit: str
+    icon: str
+    kind: str
+    storage: str  # 'wide' (a measurements column) or 'narrow' (measurement_values rows)
+
+
+def describe_column(column: str) -> dict:
+    """Name, label, unit and kind for a new CSV column such as 'Windsnelheid (m/s)'."""
+    match = _UNIT.search(column)
+    unit = match.group(1).strip() if match else ''
+    label = column[:match.start()].strip() if match else column.strip()
+    name = re.sub(r'[^a-z0-9]+', '_', label.lower()).strip('_')[:56] or 'sensor'
+    if name[0].isdigit():
+        name = 's_' + name
+    if unit == '%':
+        kind = 'level'
+    elif unit.lower() in _RATE_UNITS or _FLOW_UNIT.match(unit):
+        kind = 'rate'
+    else:
+        kind = 'instantaneous'
+    return {'name': name, 'label': label or column, 'unit': unit, 'kind': kind}
+
+
+class SensorRegistry:
+    """The ``sensors`` table, cached in memory.
+
+    Built-in sensors are columns of ``measurements``; any other numeric CSV
+    column is registered on first sight and stored narrow, as (sensor,
+    timestamp, value) rows in ``measurement_values``, so a new sensor needs
+    no schema change.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._by_name: Dict[str, Sensor] = {}
+        self._by_source: Dict[str, Sensor] = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            # Primary: called right after another worker registered a sensor
+            with self.db.cursor(primary=True) as cursor:
+                cursor.execute(f"SELECT {', '.join(Sensor._fields)} FROM sensors ORDER BY id")
+                sensors = [Sensor(*row) for row in cursor.fetchall()]
+        except Error as e:
+            logger.error(f"Error loading sensor registry: {e}")
+            raise
+        self._by_name = {s.name: s for s in sensors}
+        self._by_source = {s.source_column: s for s in sensors if s.source_column}
+        self._loaded_at = time.monotonic()
+
+    def refresh(self):
+        with self._lock:
+            self._load()
+
+    def all(self) -> List[Sensor]:
+        with self._lock:
+            if self._loaded_at is None:
+                self._load()
+            return list(self._by_name.values())
+
+    def get(self, key: str) -> Optional[Sensor]:
+        """Look a sensor up by name or by source CSV column."""
+        with self._lock:
+            if self._loaded_at is None:
+                self._load()
+            sensor = self._by_name.get(key) or self._by_source.get(key)
+            if sensor is None and time.monotonic() - self._loaded_at > REFRESH_INTERVAL:
+                self._load()
+                sensor = self._by_name.get(key) or self._by_source.get(key)
+            return sensor
+
+    def resolve(self, names: Iterable[str]) -> List[Sensor]:
+        """Sensors for the given names; raises KeyError listing the unknown ones."""
+        names = list(names)
+        sensors = [self.get(name) for name in names]
+        unknown = [name for name, sensor in zip(names, sensors) if sensor is None]
+        if unknown:
+            raise KeyError(', '.join(unknown))
+        return sensors
+
+    def register_columns(self, df: "pd.DataFrame", columns: Iterable[str]) -> Dict[str, Sensor]:
+        """Map extra batch columns to their sensors, registering unknown ones.
+
+        Non-numeric columns are skipped. Registration is idempotent and safe
+        across workers: the unique source column makes a concurrent duplicate
+        a no-op, and a name taken by another column gets a numeric suffix.
+        """
+        import pandas as pd
+        mapped = {}
+        for column in columns:
+            if not pd.api.types.is_numeric_dtype(df[column]):
+                logger.warning(f"Ignoring non-numeric column '{column}'")
+                continue
+            sensor = self.get(column)
+            if sensor is None:
+                sensor = self._register(column)
+            if sensor.storage != 'narrow':
+                # A wide sensor under another header; its column is written already
+                continue
+            mapped[column] = sensor
+        return mapped
+
+    def _register(self, column: str) -> Sensor:
+        info = describe_column(column)
+        try:
+            with self.db.transaction() as cursor:
+                for attempt in range(1, 100):
+                    name = info['name'] if attempt == 1 else f"{info['name']}_{attempt}"
+                    cursor.execute("""
+                        INSERT IGNORE INTO sensors (name, source_column, label, unit, kind, storage)
+                        VALUES (%s, %s, %s, %s, %s, 'narrow')
+                    """, (name, column, info['label'], info['unit'], info['kind']))
+                    cursor.execute(f"SELECT {', '.join(Sensor._fields)} FROM sensors WHERE source_column = %s",
+                                   (column,))
+                    row = cursor.fetchone()
+                    if row:
+                        break
+                else:
+                    raise ValueError(f"No free sensor name for column '{column}'")
+        except Error as e:
+            logger.error(f"Error registering sensor for column '{column}': {e}")
+            raise
+        sensor = Sensor(*row)
+        with self._lock:
+            self._by_name[sensor.name] = sensor
+            self._by_source[column] = sensor
+        logger.info(f"Registered sensor '{sensor.name}' ({sensor.kind}, {sensor.unit or 'no unit'}) for column '{column}'")
+        return sensor
+
+    def update(self, name: str, **fields) -> Optional[Sensor]:
+        """Change label, unit, icon and/or kind of a sensor; None if it doesn't exist."""
+        fields = {k: v for k, v in fields.items() if k in ('label', 'unit', 'icon', 'kind') and v is not None}
+        if fields.get('kind', SENSOR_KINDS[0]) not in SENSOR_KINDS:
+            raise ValueError(f"kind must be one of: {', '.join(SENSOR_KINDS)}")
+        if fields:
+            try:
+                with self.db.transaction() as cursor:
+                    cursor.execute(
+                        f"UPDATE sensors SET {', '.join(f'{k} = %s' for k in fields)} WHERE name = %s",
+                        (*fields.values(), name)
+                    )
+            except Error as e:
+                logger.error(f"Error updating sensor '{name}': {e}")
+                raise
+        self.refresh()
+        return self._by_name.get(name)
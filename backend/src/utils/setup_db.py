@@ -1,53 +1,33 @@
-import os
-import mysql.connector
-from dotenv import load_dotenv
+import argparse
 import logging
+from .migrations import MigrationRunner
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def setup_database():
-    """Set up the database and create necessary tables."""
-    load_dotenv()
-    
-    # Get database connection parameters from environment variables
-    db_params = {
-        'host': os.getenv('DB_HOST', 'localhost'),
-        'user': os.getenv('DB_USER', 'root'),
-        'password': os.getenv('DB_PASSWORD', '')
-    }
-    
+def setup_database(target: int = None):
+    """Create the database if needed and apply all pending schema migrations."""
     try:
-        # Connect to MySQL
-        conn = mysql.connector.connect(**db_params)
-        cursor = conn.cursor()
-        
-        # Read and execute schema.sql
-        logger.info("Creating database schema...")
-        schema_path = os.path.join(os.path.dirname(__file__), '..', 'models', 'schema.sql')
-        with open(schema_path, 'r') as f:
-            schema_sql = f.read()
-            
-            # Split the SQL file into individual statements
-            statements = schema_sql.split(';')
-            
-            # Execute each statement
-            for statement in statements:
-                if statement.strip():
-                    cursor.execute(statement)
-                    conn.commit()
-        
-        logger.info("Database setup completed successfully!")
-        
+        applied = MigrationRunner().migrate(target)
+        logger.info(f"Database setup completed successfully! ({len(applied)} migrations applied)")
     except Exception as e:
         logger.error(f"Error setting up database: {str(e)}")
         raise
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
+
+def print_status():
+    for migration in MigrationRunner().status():
+        state = "applied" if migration['applied'] else "pending"
+        if migration['modified']:
+            state += " (modified since applied)"
+        print(f"{migration['version']:04d}_{migration['name']}: {state}")
 
 if __name__ == "__main__":
-    setup_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    parser.add_argument("--status", action="store_true", help="list migrations and whether they are applied")
+    parser.add_argument("--target", type=int, help="apply migrations up to and including this version")
+    args = parser.parse_args()
+    if args.status:
+        print_status()
+    else:
+        setup_database(args.target)
@@ -0,0 +1,242 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Storage model parameters and their defaults. Energy in kWh, power in kW,
+# efficiencies as fractions; hydrogen is counted as stored energy (kWh,
+# ~3 kWh per Nm3) rather than litres.
+STORAGE_PARAMETERS = {
+    'battery_kwh': 10.0,
+    'battery_kw': 5.0,              # max charge and discharge power
+    'battery_efficiency': 0.9,      # round trip
+    'battery_initial_soc': 0.5,
+    'hydrogen_kwh': 0.0,            # tank size
+    'hydrogen_initial_soc': 0.5,
+    'electrolyser_kw': 0.0,         # max electric input
+    'electrolyser_efficiency': 0.65,
+    'fuel_cell_kw': 0.0,            # max electric output
+    'fuel_cell_efficiency': 0.5,
+}
+
+# Upper bound on the size of a sweep
+MAX_SCENARIOS = 1000
+
+RESULT_FIELDS = ('grid_import_kwh', 'grid_export_kwh', 'battery_in_kwh', 'battery_out_kwh',
+                 'hydrogen_in_kwh', 'hydrogen_out_kwh', 'battery_final_kwh', 'hydrogen_final_kwh')
+
+
+def scenario_grid(sweep: Dict[str, Sequence[float]]) -> List[Dict[str, float]]:
+    """Every combination of the swept values; unswept parameters keep their default."""
+    unknown = set(sweep) - set(STORAGE_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    names = list(sweep)
+    values = [list(sweep[name]) for name in names]
+    size = 1
+    for v in values:
+        if not v:
+            raise ValueError("Every swept parameter needs at least one value")
+        size *= len(v)
+    if size > MAX_SCENARIOS:
+        raise ValueError(f"{size} scenarios requested, at most {MAX_SCENARIOS} allowed")
+    scenarios = []
+    for combination in itertools.product(*values):
+        scenario = dict(STORAGE_PARAMETERS)
+        scenario.update(zip(names, (float(x) for x in combination)))
+        _check_scenario(scenario)
+        scenarios.append(scenario)
+    return scenarios
+
+
+def _check_scenario(scenario: Dict[str, float]):
+    for name, value in scenario.items():
+        if value < 0:
+            raise ValueError(f"{name} must not be negative")
+    for name in ('battery_efficiency', 'electrolyser_efficiency', 'fuel_cell_efficiency'):
+        if not 0 < scenario[name] <= 1:
+            raise ValueError(f"{name} must be in (0, 1]")
+    for name in ('battery_initial_soc', 'hydrogen_initial_soc'):
+        if scenario[name] > 1:
+            raise ValueError(f"{name} must be in [0, 1]")
+
+
+def simulate(net_kwh: "np.ndarray", params: Dict[str, "np.ndarray"], dt_hours: float) -> Dict[str, "np.ndarray"]:
+    """Replay a net energy series through a batch of storage scenarios.
+
+    ``net_kwh`` is solar production minus consumption per interval; each
+    entry of ``params`` holds one value per scenario. Time has to be stepped
+    (storage state carries over) but every step updates all scenarios at
+    once as NumPy vectors. Surplus charges the battery first, then the
+    electrolyser, and is exported; a deficit is covered by the battery, then
+    the fuel cell, and imported.
+    """
+    import numpy as np
+    battery_cap = params['battery_kwh']
+    battery_step = params['battery_kw'] * dt_hours
+    battery_eff = np.sqrt(params['battery_efficiency'])  # per direction
+    hydrogen_cap = params['hydrogen_kwh']
+    electrolyser_step = params['electrolyser_kw'] * dt_hours
+    electrolyser_eff = params['electrolyser_efficiency']
+    fuel_cell_step = params['fuel_cell_kw'] * dt_hours
+    fuel_cell_eff = params['fuel_cell_efficiency']
+
+    battery = battery_cap * params['battery_initial_soc']
+    hydrogen = hydrogen_cap * params['hydrogen_initial_soc']
+    n = len(battery_cap)
+    grid_import, grid_export = np.zeros(n), np.zeros(n)
+    battery_in, battery_out = np.zeros(n), np.zeros(n)
+    hydrogen_in, hydrogen_out = np.zeros(n), np.zeros(n)
+    minimum = np.minimum
+
+    for energy in net_kwh.tolist():
+        if energy >= 0:
+            charge = minimum(minimum(battery_step, (battery_cap - battery) / battery_eff), energy)
+            battery = battery + charge * battery_eff
+            rest = energy - charge
+            electrolysis = minimum(minimum(electrolyser_step, (hydrogen_cap - hydrogen) / electrolyser_eff), rest)
+            hydrogen = hydrogen + electrolysis * electrolyser_eff
+            grid_export += rest - electrolysis
+            battery_in += charge
+            hydrogen_in += electrolysis
+        else:
+            demand = -energy
+            discharge = minimum(minimum(battery_step, battery * battery_eff), demand)
+            battery = battery - discharge / battery_eff
+            rest = demand - discharge
+            fuel_cell = minimum(minimum(fuel_cell_step, hydrogen * fuel_cell_eff), rest)
+            hydrogen = hydrogen - fuel_cell / fuel_cell_eff
+            grid_import += rest - fuel_cell
+            battery_out += discharge
+            hydrogen_out += fuel_cell
+
+    return {
+        'grid_import_kwh': grid_import,
+        'grid_export_kwh': grid_export,
+        'battery_in_kwh': battery_in,
+        'battery_out_kwh': battery_out,
+        'hydrogen_in_kwh': hydrogen_in,
+        'hydrogen_out_kwh': hydrogen_out,
+        'battery_final_kwh': battery,
+        'hydrogen_final_kwh': hydrogen,
+    }
+
+
+def simulate_chunk(net_kwh: "np.ndarray", scenarios: List[Dict[str, float]], dt_hours: float) -> List[Dict[str, float]]:
+    """simulate() for a list of scenarios, in a worker process."""
+    import numpy as np
+    params = {name: np.array([s[name] for s in scenarios], dtype=float) for name in STORAGE_PARAMETERS}
+    results = simulate(net_kwh, params, dt_hours)
+    return [{field: float(results[field][i]) for field in RESULT_FIELDS} for i in range(len(scenarios))]
+
+
+def summarize(result: Dict[str, float], load_kwh: float, solar_kwh: float, scenario: Dict[str, float]) -> dict:
+    """Self-sufficiency (share of consumption not imported) and self-consumption
+    (share of production not exported) for one scenario."""
+    summary = {key: round(value, 3) for key, value in result.items()}
+    summary['self_sufficiency'] = round(1 - result['grid_import_kwh'] / load_kwh, 4) if load_kwh > 0 else None
+    summary['self_consumption'] = round(1 - result['grid_export_kwh'] / solar_kwh, 4) if solar_kwh > 0 else None
+    summary['battery_cycles'] = round(result['battery_out_kwh'] / scenario['battery_kwh'], 2) \
+        if scenario['battery_kwh'] > 0 else 0.0
+    return summary
+
+
+class StorageSimulator:
+    """What-if runs of battery and hydrogen storage over measured history.
+
+    The history (solar production and house consumption) is read once per
+    run; the scenario grid is split over a process pool, each worker
+    stepping its share of the scenarios as vectors.
+    """
+
+    def __init__(self, data_processor, max_workers: int = None, interval_minutes: float = None):
+        self.data_processor = data_processor
+        self.max_workers = max_workers or int(os.getenv('SIMULATION_WORKERS', '0')) or os.cpu_count() or 1
+        self.interval_minutes = interval_minutes or data_processor.validator.interval_minutes
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs threads (uvicorn, DB pools) is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def load_history(self, start: datetime, end: datetime):
+        """Solar production and consumption (kW) between start and end, one value per
+        interval from the first stored row to the last; gaps count as zero."""
+        import numpy as np
+        timestamps, solar, load = [], [], []
+        for rows in self.data_processor.iter_measurements(start, end, ['solar_power', 'power_consumption'],
+                                                          chunk_size=50000):
+            timestamps.append(np.array([row[0] for row in rows], dtype='datetime64[s]'))
+            chunk = np.array([row[1:] for row in rows], dtype=float)
+            solar.append(chunk[:, 0] / 1000)  # W -> kW
+            load.append(chunk[:, 1])
+        if not solar:
+            return np.zeros(0), np.zeros(0)
+        # Rows are in time order; place each on its interval of the grid
+        timestamps = np.concatenate(timestamps)
+        step = np.timedelta64(round(self.interval_minutes * 60), 's')
+        slots = np.rint((timestamps - timestamps[0]) / step).astype(np.int64)
+        solar_grid, load_grid = np.zeros(slots[-1] + 1), np.zeros(slots[-1] + 1)
+        solar_grid[slots] = np.concatenate(solar)
+        load_grid[slots] = np.concatenate(load)
+        return np.nan_to_num(solar_grid), np.nan_to_num(load_grid)
+
+    def run(self, scenarios: List[Dict[str, float]], start: datetime, end: datetime) -> dict:
+        import numpy as np
+        started = time.perf_counter()
+        solar, load = self.load_history(start, end)
+        dt_hours = self.interval_minutes / 60
+        net_kwh = (solar - load) * dt_hours
+        solar_kwh = float(solar.sum() * dt_hours)
+        load_kwh = float(load.sum() * dt_hours)
+
+        size = -(-len(scenarios) // self.max_workers)
+        chunks = [scenarios[i:i + size] for i in range(0, len(scenarios), size)]
+        if len(net_kwh) and len(chunks) > 1:
+            futures = [self._pool().submit(simulate_chunk, net_kwh, chunk, dt_hours) for chunk in chunks]
+            results = [result for future in futures for result in future.result()]
+        elif len(net_kwh):
+            # A single chunk isn't worth the round trip to a worker
+            results = simulate_chunk(net_kwh, scenarios, dt_hours)
+        else:
+            results = [{field: 0.0 for field in RESULT_FIELDS} for _ in scenarios]
+
+        baseline = {
+            'grid_import_kwh': round(float(np.clip(-net_kwh, 0, None).sum()), 3),
+            'grid_export_kwh': round(float(np.clip(net_kwh, 0, None).sum()), 3),
+        }
+        baseline['self_sufficiency'] = round(1 - baseline['grid_import_kwh'] / load_kwh, 4) if load_kwh > 0 else None
+        elapsed = time.perf_counter() - started
+        logger.info(f"Simulated {len(scenarios)} scenarios over {len(net_kwh)} intervals in {elapsed:.2f}s")
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'intervals': len(net_kwh),
+            'solar_kwh': round(solar_kwh, 3),
+            'load_kwh': round(load_kwh, 3),
+            'baseline': baseline,
+            'scenarios': [
+                {'parameters': scenario, 'results': summarize(result, load_kwh, solar_kwh, scenario)}
+                for scenario, result in zip(scenarios, results)
+            ],
+            'elapsed_seconds': round(elapsed, 3),
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
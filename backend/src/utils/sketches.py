@@ -0,0 +1,195 @@
+from mysql.connector import Error
+import logging
+import struct
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from .data_processor import iter_measurement_windows
+from .metrics import observe_query
+from .rollups import ROLLUP_SENSORS
+
+logger = logging.getLogger(__name__)
+
+# Roughly the number of centroids kept; each costs 8 bytes when stored
+COMPRESSION = 200
+
+_HEADER = struct.Struct('<ddd')  # min, max, total weight
+
+
+class TDigest:
+    """Mergeable quantile sketch (merging t-digest with the arcsine scale function).
+
+    Centroids are kept as two NumPy arrays (means, weights). Building and
+    merging are vectorized: centroids are sorted once and grouped by the
+    integer part of their position on the k-scale, which keeps tails
+    precise and the middle coarse.
+    """
+
+    __slots__ = ('means', 'weights', 'min', 'max')
+
+    def __init__(self, means=None, weights=None, minimum=np.inf, maximum=-np.inf):
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self.min = float(minimum)
+        self.max = float(maximum)
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    @classmethod
+    def from_values(cls, values: Iterable[float], compression: int = COMPRESSION) -> "TDigest":
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return cls()
+        digest = cls(values, np.ones(len(values)), values.min(), values.max())
+        return digest._compress(compression)
+
+    @classmethod
+    def merge_all(cls, digests: Iterable["TDigest"], compression: int = COMPRESSION) -> "TDigest":
+        digests = [d for d in digests if len(d.means)]
+        if not digests:
+            return cls()
+        merged = cls(
+            np.concatenate([d.means for d in digests]),
+            np.concatenate([d.weights for d in digests]),
+            min(d.min for d in digests),
+            max(d.max for d in digests),
+        )
+        return merged._compress(compression)
+
+    def _compress(self, compression: int) -> "TDigest":
+        order = np.argsort(self.means, kind='stable')
+        means, weights = self.means[order], self.weights[order]
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = compression / np.pi * np.arcsin(2 * q - 1)
+        groups = np.floor(k - k.min()).astype(np.int64)
+        group_weights = np.bincount(groups, weights)
+        keep = group_weights > 0
+        group_means = np.bincount(groups, weights * means)[keep] / group_weights[keep]
+        self.means, self.weights = group_means, group_weights[keep]
+        return self
+
+    def quantile(self, q) -> np.ndarray:
+        """Value at quantile(s) q in [0, 1]."""
+        q = np.clip(np.asarray(q, dtype=np.float64), 0, 1)
+        if not len(self.means):
+            return np.full(q.shape, np.nan)
+        total = self.count
+        positions = np.concatenate([[0], np.cumsum(self.weights) - self.weights / 2, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(q * total, positions, values)
+
+    def cdf(self, x) -> np.ndarray:
+        """Fraction of values <= x."""
+        x = np.asarray(x, dtype=np.float64)
+        if not len(self.means):
+            return np.full(x.shape, np.nan)
+        total = self.count
+        positions = np.concatenate([[0], np.cumsum(self.weights) - self.weights / 2, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(x, values, positions) / total
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(self.min, self.max, self.count)
+        return header + self.means.astype('<f4').tobytes() + self.weights.astype('<f4').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        minimum, maximum, _ = _HEADER.unpack_from(data)
+        body = np.frombuffer(data, dtype='<f4', offset=_HEADER.size)
+        half = len(body) // 2
+        return cls(body[:half], body[half:], minimum, maximum)
+
+
+class SketchStore:
+    """One t-digest per sensor per day, merged on query.
+
+    A day's sketch is rebuilt from all its stored rows whenever an ingest
+    touches it, so re-imports and released rows never add weight twice.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @observe_query
+    def replace_days(self, cursor, frame, days):
+        """Day listener: rebuild the sketches of these days from their stored rows."""
+        placeholders = ', '.join(['%s'] * len(days))
+        cursor.execute(f"DELETE FROM sensor_sketches WHERE date IN ({placeholders})", tuple(days))
+        values = day_sketch_rows(frame)
+        if values:
+            cursor.executemany("INSERT INTO sensor_sketches (date, sensor, digest) VALUES (%s, %s, %s)", values)
+
+    @observe_query
+    def rebuild(self):
+        """Recompute every daily sketch from the measurements table."""
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("DELETE FROM sensor_sketches")
+                for _, frame in iter_measurement_windows(cursor):
+                    values = day_sketch_rows(frame)
+                    if values:
+                        cursor.executemany(
+                            "INSERT INTO sensor_sketches (date, sensor, digest) VALUES (%s, %s, %s)", values)
+            logger.info("Sensor sketches rebuilt")
+        except Error as e:
+            logger.error(f"Error rebuilding sensor sketches: {e}")
+            raise
+
+    @observe_query
+    def merged(self, sensor: str, start: date, end: date) -> TDigest:
+        """Merge the daily sketches of start <= date <= end."""
+        try:
+            with self.db.cursor() as cursor:
+                cursor.execute("""
+                    SELECT digest FROM sensor_sketches
+                    WHERE sensor = %s AND date BETWEEN %s AND %s
+                """, (sensor, start, end))
+                rows = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error reading sensor sketches: {e}")
+            raise
+        return TDigest.merge_all(TDigest.from_bytes(bytes(row[0])) for row in rows)
+
+
+def day_sketch_rows(df) -> List[tuple]:
+    """(date, sensor, digest bytes) per day and sensor of a frame of measurements."""
+    sensors = [s for s in ROLLUP_SENSORS if s in df]
+    if not len(df) or not sensors:
+        return []
+    values = []
+    for day, group in df.groupby(df['timestamp'].dt.date):
+        for sensor in sensors:
+            digest = TDigest.from_values(group[sensor].to_numpy(dtype=np.float64, na_value=np.nan))
+            if len(digest.means):
+                values.append((day, sensor, digest.to_bytes()))
+    return values
+
+
+def _round(values) -> List[Optional[float]]:
+    return [None if np.isnan(v) else round(float(v), 4) for v in values]
+
+
+def quantile_summary(digest: TDigest, percentiles: Sequence[float]) -> Dict[str, Optional[float]]:
+    values = digest.quantile(np.asarray(percentiles) / 100)
+    return {f"p{p:g}": v for p, v in zip(percentiles, _round(values))}
+
+
+def load_duration_curve(digest: TDigest, points: int = 101) -> List[dict]:
+    """Value exceeded during x% of the time, for x from 0 to 100."""
+    exceedance = np.linspace(0, 100, points)
+    values = digest.quantile(1 - exceedance / 100)
+    return [{'percent_of_time': round(float(p), 2), 'value': v} for p, v in zip(exceedance, _round(values))]
+
+
+def histogram(digest: TDigest, bins: int = 20) -> List[dict]:
+    """Approximate counts per equal-width bin between min and max."""
+    if not len(digest.means):
+        return []
+    edges = np.linspace(digest.min, digest.max, bins + 1)
+    counts = np.diff(digest.cdf(edges)) * digest.count
+    return [{'start': round(float(lo), 4), 'end': round(float(hi), 4), 'count': round(float(c), 1)}
+            for lo, hi, c in zip(edges[:-1], edges[1:], counts)]
@@ -0,0 +1,127 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+from dotenv import load_dotenv
+from .data_processor import read_measurements_csv, normalize_measurements
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+
+def parse_spool_file(path: str):
+    """Parse one meter export in a worker process. Returns (path, DataFrame, error)."""
+    try:
+        return path, normalize_measurements(read_measurements_csv(path)), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+class SpoolIngester:
+    """Ingests CSV exports that site meters drop into a spool directory.
+
+    New files are parsed in parallel in a process pool (one pandas parse per
+    core), inserted in bulk by the calling thread and then moved to
+    ``done/`` or ``failed/``. Files modified in the last ``settle_seconds``
+    are left alone because the meter may still be writing them.
+    """
+
+    def __init__(self, data_processor, spool_dir: str = None, max_workers: int = None,
+                 settle_seconds: float = 5.0):
+        self.data_processor = data_processor
+        self.spool_dir = spool_dir or os.getenv('SPOOL_DIR', 'data/spool')
+        self.done_dir = os.path.join(self.spool_dir, 'done')
+        self.failed_dir = os.path.join(self.spool_dir, 'failed')
+        self.max_workers = max_workers or int(os.getenv('SPOOL_WORKERS', '0')) or os.cpu_count() or 1
+        self.settle_seconds = settle_seconds
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs threads (uvicorn, DB pools) is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def discover(self) -> List[str]:
+        """Return settled CSV files waiting in the spool directory, oldest first."""
+        if not os.path.isdir(self.spool_dir):
+            return []
+        cutoff = time.time() - self.settle_seconds
+        files = []
+        for entry in os.scandir(self.spool_dir):
+            if entry.is_file() and entry.name.lower().endswith('.csv'):
+                mtime = entry.stat().st_mtime
+                if mtime <= cutoff:
+                    files.append((mtime, entry.path))
+        return [path for _, path in sorted(files)]
+
+    def run(self, job=None, manager=None) -> dict:
+        """Ingest all waiting files; reports progress to an ingest job when given."""
+        files = self.discover()
+        summary = {"files": len(files), "done": 0, "failed": 0, "rows": 0, "quarantined_rows": 0}
+        if not files:
+            return summary
+        os.makedirs(self.done_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+        if job is not None:
+            job.total_bytes = sum(os.path.getsize(path) for path in files)
+
+        futures = [self._pool().submit(parse_spool_file, path) for path in files]
+        bytes_done = 0
+        try:
+            for future in as_completed(futures):
+                if job is not None:
+                    job.check_cancelled()
+                path, df, error = future.result()
+                size = os.path.getsize(path)
+                if error is None:
+                    try:
+                        report = self.data_processor.insert_data(df, source=os.path.basename(path))
+                        if report:
+                            summary["quarantined_rows"] += report['quarantined_rows']
+                    except Exception as e:
+                        error = str(e)
+                if error is None:
+                    self._move(path, self.done_dir)
+                    summary["done"] += 1
+                    summary["rows"] += len(df)
+                else:
+                    logger.error(f"Spool file {path} failed: {error}")
+                    self._move(path, self.failed_dir, error)
+                    summary["failed"] += 1
+                bytes_done += size
+                if manager is not None:
+                    manager.report_progress(job, len(df) if error is None else 0, bytes_done)
+        finally:
+            for future in futures:
+                future.cancel()
+
+        logger.info(f"Spool run finished: {summary}")
+        return summary
+
+    def run_job(self, manager):
+        """Runner for IngestJobManager.submit."""
+        return lambda job: self.run(job, manager)
+
+    def _move(self, path: str, target_dir: str, error: str = None):
+        target = os.path.join(target_dir, os.path.basename(path))
+        if os.path.exists(target):
+            root, ext = os.path.splitext(target)
+            target = f"{root}.{int(time.time())}{ext}"
+        shutil.move(path, target)
+        if error is not None:
+            with open(target + '.error.txt', 'w', encoding='utf-8') as f:
+                f.write(error)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
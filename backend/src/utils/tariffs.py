@@ -0,0 +1,485 @@
+from mysql.connector import Error
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+from .data_processor import iter_measurement_windows
+from .metrics import observe_query
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# fixed:   valid_from,price  - a price that holds until the next row
+# tou:     days,start,price  - weekly pattern, e.g. mon-fri,07:00,0.32
+# dynamic: valid_from,price  - hourly (or finer) market prices
+TARIFF_KINDS = ("fixed", "tou", "dynamic")
+
+# Price files are read from here; clients name a file, never a path
+TARIFF_DIR = os.getenv("TARIFF_DIR", "data/tariffs")
+
+# A dynamic price only covers its own hour; later consumption is unpriced
+DYNAMIC_PRICE_VALIDITY = timedelta(hours=1)
+
+# Average power (kW) per interval; kWh = kW * interval length
+ENERGY_COLUMN = 'power_consumption'
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+COST_GROUPS = ('day', 'month')
+
+
+class Tariff(NamedTuple):
+    id: int
+    name: str
+    kind: str
+    label: str
+    active: bool
+
+
+def parse_days(spec: str) -> List[int]:
+    """Weekdays (0 = Monday) of 'mon-fri', 'sat,sun' or 'all'."""
+    spec = spec.strip().lower()
+    if spec in ('all', '*'):
+        return list(range(7))
+    days = set()
+    for part in spec.split(','):
+        bounds = [p.strip()[:3] for p in part.split('-')]
+        try:
+            indices = [WEEKDAYS.index(b) for b in bounds]
+        except ValueError:
+            raise ValueError(f"Unknown weekday in '{spec}'")
+        if len(indices) == 1:
+            days.add(indices[0])
+        elif len(indices) == 2:
+            first, last = indices
+            days.update(range(first, last + 1) if first <= last else [*range(first, 7), *range(0, last + 1)])
+        else:
+            raise ValueError(f"Invalid day range '{part}'")
+    return sorted(days)
+
+
+def _parse_minutes(value: str) -> int:
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', str(value).strip())
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f"Invalid time '{value}' (expected HH:MM)")
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def _prices(column: "pd.Series") -> "pd.Series":
+    import pandas as pd
+    if not pd.api.types.is_numeric_dtype(column):
+        column = column.astype(str).str.strip().str.replace(',', '.', regex=False)
+    prices = pd.to_numeric(column, errors='coerce')
+    if prices.isna().any():
+        raise ValueError("Every row needs a numeric price (EUR/kWh)")
+    return prices.astype(float)
+
+
+def read_tariff_csv(path: str, kind: str) -> "pd.DataFrame":
+    """Read a price file (comma- or semicolon-separated, header row).
+
+    Returns (valid_from, price) rows for fixed and dynamic tariffs and
+    (weekday, minute, price) rows for time-of-use tariffs; raises ValueError
+    on anything malformed.
+    """
+    import pandas as pd
+    if kind not in TARIFF_KINDS:
+        raise ValueError(f"kind must be one of: {', '.join(TARIFF_KINDS)}")
+    df = pd.read_csv(path, sep=None, engine='python', dtype=str)
+    df.columns = [c.strip().lower() for c in df.columns]
+    if 'price' not in df:
+        raise ValueError("Missing column 'price'")
+    if not len(df):
+        raise ValueError("The file has no prices")
+
+    if kind == 'tou':
+        if not {'days', 'start'} <= set(df.columns):
+            raise ValueError("Time-of-use files need the columns days, start and price")
+        prices = _prices(df['price'])
+        rows = [
+            (weekday, _parse_minutes(start), price)
+            for days, start, price in zip(df['days'], df['start'], prices)
+            for weekday in parse_days(days)
+        ]
+        periods = pd.DataFrame(rows, columns=['weekday', 'minute', 'price'])
+        if periods.duplicated(['weekday', 'minute']).any():
+            raise ValueError("Two prices start at the same weekday and time")
+        return periods.sort_values(['weekday', 'minute'], ignore_index=True)
+
+    column = 'valid_from' if 'valid_from' in df else 'timestamp'
+    if column not in df:
+        raise ValueError("Missing column 'valid_from'")
+    steps = pd.DataFrame({
+        'valid_from': pd.to_datetime(df[column].str.strip(), dayfirst=True, errors='coerce'),
+        'price': _prices(df['price']),
+    })
+    if steps['valid_from'].isna().any():
+        raise ValueError("Every row needs a valid_from date/time")
+    if steps['valid_from'].duplicated().any():
+        raise ValueError("Duplicate valid_from values")
+    return steps.sort_values('valid_from', ignore_index=True)
+
+
+def price_costs(usage: "pd.DataFrame", steps: "pd.DataFrame", kind: str, interval_hours: float) -> "pd.DataFrame":
+    """Join consumption with the price in force at each timestamp.
+
+    ``usage`` has timestamp and ENERGY_COLUMN, ``steps`` (timestamp, price)
+    sorted by timestamp. Returns timestamp, kwh, price and cost per row;
+    price and cost are NaN where no price applies.
+    """
+    import pandas as pd
+    usage = usage[['timestamp', ENERGY_COLUMN]].dropna().sort_values('timestamp')
+    usage = pd.DataFrame({
+        'timestamp': pd.to_datetime(usage['timestamp']).astype('datetime64[ns]'),
+        'kwh': usage[ENERGY_COLUMN].astype(float) * interval_hours,
+    })
+    steps = steps.assign(timestamp=steps['timestamp'].astype('datetime64[ns]'))
+    steps['valid_from'] = steps['timestamp']
+    merged = pd.merge_asof(usage, steps, on='timestamp', direction='backward')
+    if kind == 'dynamic':
+        # merge_asof's tolerance is inclusive; a price is valid for [valid_from, valid_from + 1h)
+        expired = merged['timestamp'] - merged['valid_from'] >= pd.Timedelta(DYNAMIC_PRICE_VALIDITY)
+        merged.loc[expired, 'price'] = float('nan')
+    merged = merged.drop(columns='valid_from')
+    merged['cost'] = merged['kwh'] * merged['price']
+    return merged
+
+
+def cost_rollup_rows(costs: "pd.DataFrame") -> List[tuple]:
+    """(period_start, kwh, unpriced_kwh, cost) per day."""
+    if not len(costs):
+        return []
+    frame = costs.assign(unpriced=costs['kwh'].where(costs['price'].isna(), 0.0),
+                         cost=costs['cost'].fillna(0.0))
+    agg = frame.groupby(frame['timestamp'].dt.date)[['kwh', 'unpriced', 'cost']].sum()
+    return [(start, float(kwh), float(unpriced), float(cost))
+            for start, kwh, unpriced, cost in agg.itertuples(name=None)]
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+class TariffStore:
+    """Price schedules and the energy cost rollups derived from them.
+
+    Costs are kept per tariff, per day and per month in ``energy_costs``.
+    An ingest re-prices the days it touches from their stored rows (a
+    vectorised as-of join) and the months from their days, so re-imports
+    are not counted twice; a cost query over a year reads at most a dozen
+    monthly rows plus the days of two partial months. Every tariff is
+    rolled up, so tariffs can be compared on the same consumption.
+    """
+
+    def __init__(self, db, interval_minutes: float = 15):
+        self.db = db
+        self.interval_hours = interval_minutes / 60
+        self._tariffs: Dict[str, Tariff] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        try:
+            with self.db.cursor(primary=True) as cursor:
+                cursor.execute("SELECT id, name, kind, label, active FROM tariffs ORDER BY id")
+                tariffs = [Tariff(id, name, kind, label, bool(active))
+                           for id, name, kind, label, active in cursor.fetchall()]
+        except Error as e:
+            logger.error(f"Error loading tariffs: {e}")
+            raise
+        with self._lock:
+            self._tariffs = {t.name: t for t in tariffs}
+            self._loaded = True
+
+    def all(self) -> List[Tariff]:
+        if not self._loaded:
+            self.refresh()
+        return list(self._tariffs.values())
+
+    def get(self, name: Optional[str] = None) -> Optional[Tariff]:
+        """The named tariff, or the active one when name is None."""
+        tariffs = self.all()
+        if name is None:
+            return next((t for t in tariffs if t.active), None)
+        return self._tariffs.get(name)
+
+    def describe(self) -> List[dict]:
+        try:
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT t.name, t.kind, t.label, t.active, t.updated_at,
+                           COUNT(p.valid_from) AS prices, MIN(p.valid_from) AS first_price,
+                           MAX(p.valid_from) AS last_price,
+                           (SELECT COUNT(*) FROM tariff_periods tp WHERE tp.tariff_id = t.id) AS periods
+                    FROM tariffs t LEFT JOIN tariff_prices p ON p.tariff_id = t.id
+                    GROUP BY t.id ORDER BY t.id
+                """)
+                rows = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error describing tariffs: {e}")
+            raise
+        for row in rows:
+            row['active'] = bool(row['active'])
+            for key in ('updated_at', 'first_price', 'last_price'):
+                if row[key] is not None:
+                    row[key] = row[key].isoformat()
+        return rows
+
+    @observe_query
+    def save(self, name: str, kind: str, schedule: "pd.DataFrame", label: Optional[str] = None) -> Tariff:
+        """Create or replace a tariff and its complete price schedule.
+
+        ``schedule`` is what read_tariff_csv returns. The first tariff saved
+        becomes the active one. The cost rollups of the tariff are stale
+        afterwards; call rebuild().
+        """
+        if kind not in TARIFF_KINDS:
+            raise ValueError(f"kind must be one of: {', '.join(TARIFF_KINDS)}")
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM tariffs WHERE active")
+                first = cursor.fetchone()[0] == 0
+                cursor.execute("""
+                    INSERT INTO tariffs (name, kind, label, active) VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE kind = VALUES(kind), label = VALUES(label)
+                """, (name, kind, label or name, first))
+                cursor.execute("SELECT id FROM tariffs WHERE name = %s", (name,))
+                tariff_id = cursor.fetchone()[0]
+                cursor.execute("DELETE FROM tariff_prices WHERE tariff_id = %s", (tariff_id,))
+                cursor.execute("DELETE FROM tariff_periods WHERE tariff_id = %s", (tariff_id,))
+                if kind == 'tou':
+                    cursor.executemany("""
+                        INSERT INTO tariff_periods (tariff_id, weekday, start_minute, price)
+                        VALUES (%s, %s, %s, %s)
+                    """, [(tariff_id, int(d), int(m), float(p))
+                          for d, m, p in schedule[['weekday', 'minute', 'price']].itertuples(index=False)])
+                else:
+                    cursor.executemany("""
+                        INSERT INTO tariff_prices (tariff_id, valid_from, price) VALUES (%s, %s, %s)
+                    """, [(tariff_id, ts.to_pydatetime(), float(p))
+                          for ts, p in schedule[['valid_from', 'price']].itertuples(index=False)])
+        except Error as e:
+            logger.error(f"Error saving tariff '{name}': {e}")
+            raise
+        self.refresh()
+        logger.info(f"Saved {kind} tariff '{name}' ({len(schedule)} prices)")
+        return self._tariffs[name]
+
+    def activate(self, name: str) -> Optional[Tariff]:
+        """Make the named tariff the default for cost queries."""
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("UPDATE tariffs SET active = (name = %s)", (name,))
+        except Error as e:
+            logger.error(f"Error activating tariff '{name}': {e}")
+            raise
+        self.refresh()
+        return self._tariffs.get(name)
+
+    def price_steps(self, tariff: Tariff, start: datetime, end: datetime) -> "pd.DataFrame":
+        """(timestamp, price) steps in force between start and end, including
+        the one already in force at start."""
+        import pandas as pd
+        try:
+            with self.db.cursor(primary=True) as cursor:
+                if tariff.kind == 'tou':
+                    cursor.execute("SELECT weekday, start_minute, price FROM tariff_periods WHERE tariff_id = %s",
+                                   (tariff.id,))
+                    periods = pd.DataFrame(cursor.fetchall(), columns=['weekday', 'minute', 'price'])
+                else:
+                    cursor.execute("""
+                        SELECT valid_from, price FROM tariff_prices
+                        WHERE tariff_id = %s AND valid_from <= %s
+                          AND valid_from >= COALESCE(
+                              (SELECT MAX(valid_from) FROM tariff_prices WHERE tariff_id = %s AND valid_from <= %s),
+                              %s)
+                        ORDER BY valid_from
+                    """, (tariff.id, end, tariff.id, start, start))
+                    return pd.DataFrame(cursor.fetchall(), columns=['timestamp', 'price']).astype(
+                        {'timestamp': 'datetime64[ns]', 'price': float})
+        except Error as e:
+            logger.error(f"Error reading prices of tariff '{tariff.name}': {e}")
+            raise
+        # Lay the weekly pattern over every day of the range, starting a week
+        # early so the step in force at start is included
+        days = pd.DataFrame({'day': pd.date_range(pd.Timestamp(start).normalize() - pd.Timedelta(days=7),
+                                                  pd.Timestamp(end).normalize(), freq='D')})
+        days['weekday'] = days['day'].dt.weekday
+        steps = days.merge(periods, on='weekday')
+        steps['timestamp'] = steps['day'] + pd.to_timedelta(steps['minute'].astype(int), unit='m')
+        return steps[['timestamp', 'price']].astype({'price': float}).sort_values('timestamp', ignore_index=True)
+
+    def costs_for(self, tariff: Tariff, usage: "pd.DataFrame") -> "pd.DataFrame":
+        """price_costs() for a batch of measurements under one tariff."""
+        start, end = usage['timestamp'].min(), usage['timestamp'].max()
+        return price_costs(usage, self.price_steps(tariff, start, end), tariff.kind, self.interval_hours)
+
+    def _insert_days(self, cursor, tariff: Tariff, usage: "pd.DataFrame"):
+        if not len(usage):
+            return
+        rows = [(tariff.id, *row) for row in cost_rollup_rows(self.costs_for(tariff, usage))]
+        if rows:
+            cursor.executemany("""
+                INSERT INTO energy_costs (tariff_id, period, period_start, kwh, unpriced_kwh, cost)
+                VALUES (%s, 'day', %s, %s, %s, %s)
+            """, rows)
+
+    @staticmethod
+    def _refresh_months(cursor, first: date, last: date, tariff: Tariff = None):
+        """Recompute the monthly rows of the months first..last from the daily rows."""
+        scope, params = ("AND tariff_id = %s", (tariff.id,)) if tariff else ("", ())
+        start, end = _month_start(first), _next_month(last)
+        cursor.execute(f"""
+            DELETE FROM energy_costs
+            WHERE period = 'month' AND period_start >= %s AND period_start < %s {scope}
+        """, (start, end, *params))
+        cursor.execute(f"""
+            INSERT INTO energy_costs (tariff_id, period, period_start, kwh, unpriced_kwh, cost)
+            SELECT tariff_id, 'month', period_start - INTERVAL (DAY(period_start) - 1) DAY,
+                   SUM(kwh), SUM(unpriced_kwh), SUM(cost)
+            FROM energy_costs
+            WHERE period = 'day' AND period_start >= %s AND period_start < %s {scope}
+            GROUP BY tariff_id, period_start - INTERVAL (DAY(period_start) - 1) DAY
+        """, (start, end, *params))
+
+    @observe_query
+    def replace_days(self, cursor, frame, days):
+        """Day listener: re-price these days under every tariff from their stored rows."""
+        tariffs = self.all()
+        if not tariffs:
+            return
+        placeholders = ', '.join(['%s'] * len(days))
+        cursor.execute(f"""
+            DELETE FROM energy_costs WHERE period = 'day' AND period_start IN ({placeholders})
+        """, tuple(days))
+        if ENERGY_COLUMN in frame:
+            usage = frame[['timestamp', ENERGY_COLUMN]]
+            for tariff in tariffs:
+                self._insert_days(cursor, tariff, usage)
+        self._refresh_months(cursor, min(days), max(days))
+
+    @observe_query
+    def rebuild(self, tariff: Tariff):
+        """Recompute the cost rollups of one tariff from the raw measurements.
+
+        One transaction on the primary: queries never see partial totals, and
+        ingests into the same days wait for it, then re-price their days.
+        """
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("DELETE FROM energy_costs WHERE tariff_id = %s", (tariff.id,))
+                first = last = None
+                for days, usage in iter_measurement_windows(cursor, columns=['timestamp', ENERGY_COLUMN]):
+                    self._insert_days(cursor, tariff, usage)
+                    first, last = first or days[0], days[-1]
+                if first is not None:
+                    self._refresh_months(cursor, first, last, tariff)
+        except Error as e:
+            logger.error(f"Error rebuilding cost rollups of tariff '{tariff.name}': {e}")
+            raise
+        logger.info(f"Cost rollups of tariff '{tariff.name}' rebuilt")
+
+    @observe_query
+    def costs(self, tariff: Tariff, start: date, end: date, group: str = 'month') -> dict:
+        """Consumption and cost per day or month for start <= day <= end.
+
+        Read from the rollups only: whole months in range come from the
+        monthly rows, the partial months at either end from daily rows.
+        """
+        if group not in COST_GROUPS:
+            raise ValueError(f"group must be one of: {', '.join(COST_GROUPS)}")
+        if group == 'day':
+            rows = self._rollups(tariff, 'day', start, end)
+        else:
+            # Whole months are first_full <= day < after_full
+            first_full = start if start.day == 1 else _next_month(start)
+            day_after = end + timedelta(days=1)
+            after_full = day_after if day_after.day == 1 else _month_start(end)
+            rows = []
+            if first_full < after_full:
+                rows += self._rollups(tariff, 'month', first_full, after_full - timedelta(days=1))
+                partial = [(start, first_full - timedelta(days=1)), (after_full, end)]
+            else:
+                partial = [(start, end)]
+            for lo, hi in partial:
+                if lo <= hi:
+                    rows += self._fold_months(self._rollups(tariff, 'day', lo, hi))
+            rows.sort(key=lambda r: r['period_start'])
+        total = {key: round(sum(r[key] for r in rows), 4) for key in ('kwh', 'unpriced_kwh', 'cost')}
+        total['avg_price'] = round(total['cost'] / (total['kwh'] - total['unpriced_kwh']), 5) \
+            if total['kwh'] > total['unpriced_kwh'] else None
+        return {
+            'tariff': tariff.name,
+            'kind': tariff.kind,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'group': group,
+            'total': total,
+            'periods': [{**r, 'period_start': r['period_start'].isoformat()} for r in rows],
+        }
+
+    def _rollups(self, tariff: Tariff, period: str, start: date, end: date) -> List[dict]:
+        try:
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT period_start, kwh, unpriced_kwh, cost FROM energy_costs
+                    WHERE tariff_id = %s AND period = %s AND period_start BETWEEN %s AND %s
+                    ORDER BY period_start
+                """, (tariff.id, period, start, end))
+                rows = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error reading energy cost rollups: {e}")
+            raise
+        return [{
+            'period_start': row['period_start'],
+            'kwh': round(float(row['kwh']), 4),
+            'unpriced_kwh': round(float(row['unpriced_kwh']), 4),
+            'cost': round(float(row['cost']), 4),
+        } for row in rows]
+
+    @staticmethod
+    def _fold_months(days: List[dict]) -> List[dict]:
+        months: Dict[date, dict] = {}
+        for row in days:
+            month = months.setdefault(_month_start(row['period_start']),
+                                      {'period_start': _month_start(row['period_start']),
+                                       'kwh': 0.0, 'unpriced_kwh': 0.0, 'cost': 0.0})
+            for key in ('kwh', 'unpriced_kwh', 'cost'):
+                month[key] = round(month[key] + row[key], 4)
+        return list(months.values())
+
+    @observe_query
+    def hourly(self, tariff: Tariff, start: datetime, end: datetime) -> List[dict]:
+        """Consumption, price and cost per hour, from the raw measurements
+        (meant for short ranges such as one day)."""
+        import pandas as pd
+        try:
+            with self.db.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT timestamp, {ENERGY_COLUMN} FROM measurements
+                    WHERE timestamp >= %s AND timestamp < %s AND {ENERGY_COLUMN} IS NOT NULL
+                    ORDER BY timestamp
+                """, (start, end))
+                usage = pd.DataFrame(cursor.fetchall(), columns=['timestamp', ENERGY_COLUMN])
+        except Error as e:
+            logger.error(f"Error reading consumption for hourly costs: {e}")
+            raise
+        if not len(usage):
+            return []
+        costs = self.costs_for(tariff, usage)
+        hours = costs.groupby(costs['timestamp'].dt.floor('h')).agg(
+            kwh=('kwh', 'sum'), price=('price', 'mean'), cost=('cost', lambda c: c.sum(min_count=1)))
+        return [{
+            'hour': hour.isoformat(),
+            'kwh': round(float(kwh), 4),
+            'price': round(float(price), 5) if pd.notna(price) else None,
+            'cost': round(float(cost), 4) if pd.notna(cost) else None,
+        } for hour, kwh, price, cost in hours.itertuples(name=None)]
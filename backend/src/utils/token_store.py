@@ -0,0 +1,143 @@
+from mysql.connector import Error
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from .auth import REFRESH_TOKEN_EXPIRE_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Expired entries are dropped from memory and the table at most this often
+PRUNE_INTERVAL = 600.0
+
+# A token presented again this soon after its exchange (another tab, a
+# retried request) is a race, not a replay
+REUSE_GRACE_SECONDS = float(os.getenv('REFRESH_REUSE_GRACE_SECONDS', '30'))
+
+
+class RefreshTokenStore:
+    """Revocation list for rotating refresh tokens.
+
+    Issued tokens are never stored; only what can no longer be used is:
+    each refresh token id (``jti``) once it has been exchanged, and whole
+    sessions (``sid``, shared by every token rotated from one login) after
+    a logout or a replayed token. Entries are kept until the tokens they
+    cover have expired, so the list stays small.
+
+    The table is authoritative: exchanging a token is an INSERT on its id,
+    so two workers can't both rotate the same token. The in-memory copy
+    answers the per-request session check without a query; other workers
+    learn about revoked sessions through :meth:`remember`.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._revoked: Dict[str, float] = {}  # id -> expiry (epoch seconds)
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def load(self):
+        """Read the unexpired entries (warm-up)."""
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("DELETE FROM revoked_tokens WHERE expires_at < UTC_TIMESTAMP()")
+                cursor.execute("SELECT token_id, expires_at FROM revoked_tokens")
+                rows = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error loading revoked tokens: {e}")
+            raise
+        with self._lock:
+            for token_id, expires_at in rows:
+                self._revoked[token_id] = _epoch(expires_at)
+            self._next_prune = time.monotonic() + PRUNE_INTERVAL
+        logger.info(f"Loaded {len(rows)} revoked token entries")
+
+    def is_revoked(self, session_id: Optional[str], token_id: Optional[str] = None) -> bool:
+        revoked = self._revoked
+        return (session_id is not None and session_id in revoked) or \
+            (token_id is not None and token_id in revoked)
+
+    def remember(self, token_id: str, expires: float):
+        """Record a revocation made elsewhere (bus handler)."""
+        with self._lock:
+            self._revoked[token_id] = expires
+
+    def consume(self, token_id: str, session_id: str, expires: float) -> str:
+        """Mark a refresh token as exchanged; returns the outcome.
+
+        ``'ok'`` for a first exchange. ``'grace'`` if it was exchanged less
+        than ``REUSE_GRACE_SECONDS`` ago: the caller may issue tokens again
+        without revoking anything. ``'reused'`` if it was exchanged before
+        that or its session is revoked: the caller must then refuse it and
+        revoke the session.
+        """
+        self._prune()
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("""
+                    INSERT IGNORE INTO revoked_tokens (token_id, kind, expires_at, revoked_at)
+                    VALUES (%s, 'token', %s, UTC_TIMESTAMP())
+                """, (token_id, _utc(expires)))
+                if cursor.rowcount == 1:
+                    outcome = 'ok'
+                else:
+                    cursor.execute("""
+                        SELECT 1 FROM revoked_tokens
+                        WHERE token_id = %s AND kind = 'token'
+                          AND revoked_at >= UTC_TIMESTAMP() - INTERVAL %s SECOND
+                    """, (token_id, REUSE_GRACE_SECONDS))
+                    outcome = 'grace' if cursor.fetchone() is not None else 'reused'
+                if outcome != 'reused':
+                    cursor.execute("SELECT 1 FROM revoked_tokens WHERE token_id = %s AND kind = 'session'",
+                                   (session_id,))
+                    if cursor.fetchone() is not None:
+                        outcome = 'reused'
+        except Error as e:
+            logger.error(f"Error consuming refresh token: {e}")
+            raise
+        self.remember(token_id, expires)
+        return outcome
+
+    def revoke_session(self, session_id: str) -> float:
+        """Revoke every token of a session; returns the entry's expiry."""
+        # Outlives any refresh token rotated from this session before now
+        expires = time.time() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS).total_seconds()
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("""
+                    INSERT INTO revoked_tokens (token_id, kind, expires_at) VALUES (%s, 'session', %s)
+                    ON DUPLICATE KEY UPDATE expires_at = GREATEST(expires_at, VALUES(expires_at))
+                """, (session_id, _utc(expires)))
+        except Error as e:
+            logger.error(f"Error revoking session: {e}")
+            raise
+        self.remember(session_id, expires)
+        return expires
+
+    def _prune(self):
+        now = time.monotonic()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + PRUNE_INTERVAL
+        cutoff = time.time()
+        with self._lock:
+            self._revoked = {k: v for k, v in self._revoked.items() if v >= cutoff}
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("DELETE FROM revoked_tokens WHERE expires_at < UTC_TIMESTAMP()")
+        except Error as e:
+            logger.warning(f"Error pruning revoked tokens: {e}")
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+def _utc(epoch: float) -> datetime:
+    return datetime.utcfromtimestamp(epoch).replace(microsecond=0)
+
+
+def _epoch(value: datetime) -> float:
+    return (value - datetime(1970, 1, 1)).total_seconds()
@@ -1,9 +1,10 @@
-import mysql.connector
-from mysql.connector import Error
-from typing import Optional, List
+from mysql.connector import Error, IntegrityError
+from typing import Optional, List, Sequence, Set, Tuple
 from datetime import datetime
 import logging
 from .auth import get_password_hash, verify_password
+from .db import Database
+from .metrics import observe_query, observe_query_block
 from ..models.user import UserCreate, UserUpdate, UserInDB
 
 logger = logging.getLogger(__name__)
@@ -14,88 +15,84 @@ class UserDB:
         self.user = user
         self.password = password
         self.database = database
-        self.connection = None
+        self.db = None
         self.connect()
 
     def connect(self):
-        """Establish database connection."""
-        try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
-            logger.info("Successfully connected to database")
-        except Error as e:
-            logger.error(f"Error connecting to database: {e}")
-            raise
+        """Set up the database connection pool (opened lazily on first use)."""
+        self.db = Database(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            pool_name="user_db"
+        )
 
+    def close(self):
+        """Close the database connection."""
+        if self.db:
+            self.db.close()
+
+    @observe_query
     def create_user(self, user: UserCreate, role: str = "user") -> UserInDB:
         """Create a new user."""
         try:
-            cursor = self.connection.cursor(dictionary=True)
             query = """
                 INSERT INTO users (username, email, password_hash, role)
                 VALUES (%s, %s, %s, %s)
             """
             password_hash = get_password_hash(user.password)
-            cursor.execute(query, (user.username, user.email, password_hash, role))
-            self.connection.commit()
-            
-            # Get the created user
-            cursor.execute("SELECT * FROM users WHERE id = LAST_INSERT_ID()")
-            user_data = cursor.fetchone()
+            with self.db.transaction(dictionary=True) as cursor:
+                cursor.execute(query, (user.username, user.email, password_hash, role))
+                
+                # Get the created user
+                cursor.execute("SELECT * FROM users WHERE id = LAST_INSERT_ID()")
+                user_data = cursor.fetchone()
             return UserInDB(**user_data)
         except Error as e:
             logger.error(f"Error creating user: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def get_user_by_username(self, username: str) -> Optional[UserInDB]:
         """Get user by username."""
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-            user_data = cursor.fetchone()
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+                user_data = cursor.fetchone()
             return UserInDB(**user_data) if user_data else None
         except Error as e:
             logger.error(f"Error getting user: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def get_user_by_email(self, email: str) -> Optional[UserInDB]:
         """Get user by email."""
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-            user_data = cursor.fetchone()
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+                user_data = cursor.fetchone()
             return UserInDB(**user_data) if user_data else None
         except Error as e:
             logger.error(f"Error getting user: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def get_user_by_id(self, user_id: int) -> Optional[UserInDB]:
         """Get user by ID."""
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            user_data = cursor.fetchone()
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+                user_data = cursor.fetchone()
             return UserInDB(**user_data) if user_data else None
         except Error as e:
             logger.error(f"Error getting user by ID: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def update_user(self, user_id: int, user_update: UserUpdate) -> Optional[UserInDB]:
         """Update user information."""
         try:
-            cursor = self.connection.cursor(dictionary=True)
             update_fields = []
             values = []
             
@@ -120,92 +117,175 @@ class UserDB:
             
             query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s"
             values.append(user_id)
-            cursor.execute(query, tuple(values))
-            self.connection.commit()
-            
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            user_data = cursor.fetchone()
+            with self.db.transaction(dictionary=True) as cursor:
+                cursor.execute(query, tuple(values))
+                
+                cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+                user_data = cursor.fetchone()
             return UserInDB(**user_data) if user_data else None
         except Error as e:
             logger.error(f"Error updating user: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def update_user_password(self, user_id: int, new_password: str) -> bool:
         """Update only the user's password."""
         try:
-            cursor = self.connection.cursor()
             password_hash = get_password_hash(new_password)
-            cursor.execute(
-                "UPDATE users SET password_hash = %s WHERE id = %s",
-                (password_hash, user_id)
-            )
-            self.connection.commit()
-            return cursor.rowcount > 0
+            with self.db.transaction() as cursor:
+                cursor.execute(
+                    "UPDATE users SET password_hash = %s WHERE id = %s",
+                    (password_hash, user_id)
+                )
+                return cursor.rowcount > 0
         except Error as e:
             logger.error(f"Error updating user password: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def update_last_login(self, user_id: int):
         """Update user's last login timestamp."""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(
-                "UPDATE users SET last_login = %s WHERE id = %s",
-                (datetime.utcnow(), user_id)
-            )
-            self.connection.commit()
+            with self.db.transaction() as cursor:
+                cursor.execute(
+                    "UPDATE users SET last_login = %s WHERE id = %s",
+                    (datetime.utcnow(), user_id)
+                )
         except Error as e:
             logger.error(f"Error updating last login: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def delete_user(self, user_id: int) -> bool:
         """Delete a user."""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-            self.connection.commit()
-            return cursor.rowcount > 0
+            with self.db.transaction() as cursor:
+                cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+                return cursor.rowcount > 0
         except Error as e:
             logger.error(f"Error deleting user: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def get_all_users(self) -> List[UserInDB]:
         """Get all users."""
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users")
-            users = cursor.fetchall()
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT * FROM users")
+                users = cursor.fetchall()
             return [UserInDB(**user) for user in users]
         except Error as e:
             logger.error(f"Error getting users: {e}")
             raise
-        finally:
-            cursor.close()
+
+    @observe_query
+    def list_users(self, limit: int = 100, after_id: int = 0, role: Optional[str] = None,
+                   is_active: Optional[bool] = None, search: Optional[str] = None) -> Tuple[List[UserInDB], Optional[int]]:
+        """One page of users ordered by id, plus the cursor for the next page (None on the last).
+
+        Keyset pagination: the page starts after ``after_id``, so every page is
+        an index range scan no matter how deep it is. ``search`` is a prefix
+        of the username or email.
+        """
+        conditions = ["id > %s"]
+        params: list = [after_id]
+        if role is not None:
+            conditions.append("role = %s")
+            params.append(role)
+        if is_active is not None:
+            conditions.append("is_active = %s")
+            params.append(is_active)
+        if search:
+            pattern = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conditions.append("(username LIKE %s OR email LIKE %s)")
+            params.extend([pattern, pattern])
+        query = f"""
+            SELECT id, username, email, role, is_active, created_at, updated_at, last_login
+            FROM users
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id
+            LIMIT %s
+        """
+        params.append(limit + 1)
+        try:
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute(query, tuple(params))
+                rows = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error listing users: {e}")
+            raise
+        next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+        return [UserInDB(**row) for row in rows[:limit]], next_cursor
+
+    @observe_query
+    def find_taken(self, usernames: Sequence[str], emails: Sequence[str]) -> Tuple[Set[str], Set[str]]:
+        """Which of the given usernames and emails are already registered (lowercased)."""
+        taken_usernames, taken_emails = set(), set()
+        if not usernames and not emails:
+            return taken_usernames, taken_emails
+        try:
+            with self.db.cursor(primary=True) as cursor:
+                for column, values, taken in (("username", usernames, taken_usernames),
+                                              ("email", emails, taken_emails)):
+                    for start in range(0, len(values), 1000):
+                        batch = values[start:start + 1000]
+                        cursor.execute(
+                            f"SELECT {column} FROM users WHERE {column} IN ({', '.join(['%s'] * len(batch))})",
+                            tuple(batch)
+                        )
+                        taken.update(value.lower() for (value,) in cursor.fetchall())
+        except Error as e:
+            logger.error(f"Error checking existing users: {e}")
+            raise
+        return taken_usernames, taken_emails
+
+    @observe_query
+    def bulk_insert_users(self, rows: Sequence[tuple], batch_size: int = 500) -> List[Tuple[int, str]]:
+        """Insert (username, email, password_hash, role, is_active) rows in batches.
+
+        Returns (index, error) for the rows that failed. A batch that hits a
+        constraint is retried row by row so only the offending rows fail.
+        """
+        query = """
+            INSERT INTO users (username, email, password_hash, role, is_active)
+            VALUES (%s, %s, %s, %s, %s)
+        """
+        errors = []
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            try:
+                with self.db.transaction() as cursor:
+                    cursor.executemany(query, batch)
+                continue
+            except IntegrityError:
+                pass
+            except Error as e:
+                logger.error(f"Error inserting users: {e}")
+                raise
+            for offset, row in enumerate(batch):
+                try:
+                    with self.db.transaction() as cursor:
+                        cursor.execute(query, row)
+                except IntegrityError as e:
+                    errors.append((start + offset, e.msg))
+        return errors
 
     # --- Notification Methods ---
 
+    @observe_query
     def create_notification(self, notification: dict) -> dict:
         """Create a new notification."""
         try:
-            cursor = self.connection.cursor(dictionary=True)
             query = """
                 INSERT INTO notifications (title, message, type)
                 VALUES (%s, %s, %s)
             """
-            cursor.execute(query, (notification['title'], notification['message'], notification['type']))
-            self.connection.commit()
-            
-            notification_id = cursor.lastrowid
-            cursor.execute("SELECT * FROM notifications WHERE id = %s", (notification_id,))
-            new_notification = cursor.fetchone()
+            with self.db.transaction(dictionary=True) as cursor:
+                cursor.execute(query, (notification['title'], notification['message'], notification['type']))
+                
+                notification_id = cursor.lastrowid
+                cursor.execute("SELECT * FROM notifications WHERE id = %s", (notification_id,))
+                new_notification = cursor.fetchone()
             
             # Convert datetime to string for JSON serialization
             if new_notification and 'created_at' in new_notification:
@@ -215,15 +295,14 @@ class UserDB:
         except Error as e:
             logger.error(f"Error creating notification: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def get_all_notifications(self) -> List[dict]:
         """Get all notifications, newest first."""
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM notifications ORDER BY created_at DESC")
-            notifications = cursor.fetchall()
+            with self.db.cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT * FROM notifications ORDER BY created_at DESC")
+                notifications = cursor.fetchall()
             # Convert datetime to string for JSON serialization
             for n in notifications:
                 if 'created_at' in n:
@@ -232,33 +311,29 @@ class UserDB:
         except Error as e:
             logger.error(f"Error getting notifications: {e}")
             raise
-        finally:
-            cursor.close()
 
+    @observe_query
     def mark_notification_as_read(self, notification_id: int) -> bool:
         """Mark a notification as read."""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("UPDATE notifications SET is_read = TRUE WHERE id = %s", (notification_id,))
-            self.connection.commit()
-            return cursor.rowcount > 0
+            with self.db.transaction() as cursor:
+                cursor.execute("UPDATE notifications SET is_read = TRUE WHERE id = %s", (notification_id,))
+                return cursor.rowcount > 0
         except Error as e:
             logger.error(f"Error marking notification as read: {e}")
             raise
-        finally:
-            cursor.close()
 
     def verify_user_credentials(self, username_or_email: str, password: str) -> Optional[UserInDB]:
         """Verify user credentials by username or email."""
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE username = %s OR email = %s", (username_or_email, username_or_email))
-            user_data = cursor.fetchone()
+            # Timed without the bcrypt check below
+            with observe_query_block("UserDB", "verify_user_credentials"):
+                with self.db.cursor(dictionary=True) as cursor:
+                    cursor.execute("SELECT * FROM users WHERE username = %s OR email = %s", (username_or_email, username_or_email))
+                    user_data = cursor.fetchone()
             if user_data and verify_password(password, user_data["password_hash"]):
                 return UserInDB(**user_data)
             return None
         except Error as e:
             logger.error(f"Error verifying credentials: {e}")
-            raise
-        finally:
-            cursor.close() 
\ No newline at end of file
+            raise
\ No newline at end of file
@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+from pydantic import ValidationError
+from .auth import get_password_hash
+from ..models.user import UserCreate
+
+ROLES = ("user", "admin", "superadmin")
+
+# Upper bound on rows per import request
+MAX_IMPORT_ROWS = 20000
+
+
+class UserImportError(ValueError):
+    """Raised when an import file can't be read at all (as opposed to bad rows)."""
+
+
+def parse_user_file(content: bytes, filename: str = "") -> List[Dict[str, Any]]:
+    """Read users from a JSON array or a CSV file with a header row
+    (username, email, password and optionally role and is_active)."""
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json") or text.lstrip().startswith("["):
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise UserImportError(f"Invalid JSON: {e}")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise UserImportError("JSON must be an array of objects")
+    else:
+        sample = text[:4096]
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        rows = list(csv.DictReader(io.StringIO(text), dialect=dialect))
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise UserImportError(f"At most {MAX_IMPORT_ROWS} users per import")
+    return rows
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None or str(value).strip() == "":
+        return True
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "ja", "y"):
+        return True
+    if text in ("0", "false", "no", "nee", "n"):
+        return False
+    raise ValueError(f"Invalid is_active value: {value}")
+
+
+def validate_user_rows(rows: List[Dict[str, Any]], allowed_roles=ROLES) -> Tuple[List[tuple], List[dict]]:
+    """Validate rows; return (index, UserCreate, role, is_active) tuples and per-row errors.
+
+    Usernames and emails repeated within the file are rejected after their
+    first occurrence.
+    """
+    valid, errors = [], []
+    seen_usernames, seen_emails = set(), set()
+    for index, row in enumerate(rows):
+        username = str(row.get("username") or "").strip()
+        try:
+            user = UserCreate(
+                username=username,
+                email=str(row.get("email") or "").strip(),
+                password=str(row.get("password") or ""),
+            )
+            role = str(row.get("role") or "user").strip().lower()
+            if role not in allowed_roles:
+                raise ValueError(f"Role not allowed: {role}")
+            is_active = _parse_bool(row.get("is_active"))
+        except ValidationError as e:
+            details = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errors.append({"row": index, "username": username, "error": details})
+            continue
+        except ValueError as e:
+            errors.append({"row": index, "username": username, "error": str(e)})
+            continue
+        if user.username.lower() in seen_usernames:
+            errors.append({"row": index, "username": username, "error": "Duplicate username in file"})
+            continue
+        if user.email.lower() in seen_emails:
+            errors.append({"row": index, "username": username, "error": "Duplicate email in file"})
+            continue
+        seen_usernames.add(user.username.lower())
+        seen_emails.add(user.email.lower())
+        valid.append((index, user, role, is_active))
+    return valid, errors
+
+
+def hash_passwords(passwords: List[str], max_workers: int = None) -> List[str]:
+    """bcrypt-hash passwords in parallel (bcrypt releases the GIL, so threads use all cores)."""
+    max_workers = max_workers or int(os.getenv("USER_IMPORT_WORKERS", "0")) or os.cpu_count() or 1
+    if len(passwords) < 2 or max_workers == 1:
+        return [get_password_hash(p) for p in passwords]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt") as executor:
+        return list(executor.map(get_password_hash, passwords))
+
+
+def import_users(user_db, rows: List[Dict[str, Any]], allowed_roles=ROLES) -> Dict[str, Any]:
+    """Validate, hash and insert users; report the outcome per rejected row."""
+    valid, errors = validate_user_rows(rows, allowed_roles)
+    taken_usernames, taken_emails = user_db.find_taken(
+        [user.username for _, user, _, _ in valid],
+        [user.email for _, user, _, _ in valid],
+    )
+    pending = []
+    for index, user, role, is_active in valid:
+        if user.username.lower() in taken_usernames:
+            errors.append({"row": index, "username": user.username, "error": "Username already registered"})
+        elif user.email.lower() in taken_emails:
+            errors.append({"row": index, "username": user.username, "error": "Email already registered"})
+        else:
+            pending.append((index, user, role, is_active))
+
+    hashes = hash_passwords([user.password for _, user, _, _ in pending])
+    insert_rows = [
+        (user.username, user.email, password_hash, role, is_active)
+        for (_, user, role, is_active), password_hash in zip(pending, hashes)
+    ]
+    failed = user_db.bulk_insert_users(insert_rows)
+    for position, message in failed:
+        index, user, _, _ = pending[position]
+        errors.append({"row": index, "username": user.username, "error": message})
+
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "total": len(rows),
+        "created": len(pending) - len(failed),
+        "failed": len(errors),
+        "errors": errors,
+    }
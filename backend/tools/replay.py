@@ -0,0 +1,488 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import math
+import os
+import random
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.utils.data_processor import COLUMN_MAPPING
+from src.utils.quality import RANGE_RULES
+from .ws_loadtest import LoadClient, _free_port, login, percentiles, spawn_server, wait_until_healthy, ws_url
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_HEADER = 'Tijdstip'
+TIMESTAMP_FORMAT = '%d-%m-%Y %H:%M'
+
+FAULT_KINDS = ('dropout', 'stuck', 'spike')
+
+TARGETS = ('api', 'spool')
+
+
+class Sample(NamedTuple):
+    """One row as replayed by one site.
+
+    ``due`` is the sample time on the accelerated clock (seconds after the
+    replay started), ``send_at`` the same plus jitter.
+    """
+    id: int
+    site: int
+    timestamp: datetime
+    values: List[str]
+    due: float
+    send_at: float
+    fault: Optional[str]
+
+
+def _format_timestamp(ts: datetime) -> str:
+    # Same shape as the meter exports: 14-6-2025 00:15
+    return f"{ts.day}-{ts.month}-{ts.year} {ts:%H:%M}"
+
+
+def _format_value(value: float) -> str:
+    return f"{value:.4f}".replace('.', ',')
+
+
+def read_source(path: str) -> Tuple[List[str], List[Tuple[datetime, List[str]]]]:
+    """Header and (timestamp, raw values) rows of a meter export, oldest first."""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = next(reader)
+        if not header or header[0] != TIMESTAMP_HEADER:
+            raise ValueError(f"{path}: first column must be {TIMESTAMP_HEADER}")
+        rows = [(datetime.strptime(row[0], TIMESTAMP_FORMAT), row[1:]) for row in reader if row]
+    rows.sort(key=lambda row: row[0])
+    return header, rows
+
+
+def synthetic_rows(days: float, interval_minutes: float, start: datetime,
+                   rng: random.Random) -> Tuple[List[str], List[Tuple[datetime, List[str]]]]:
+    """A plausible meter export: solar follows the sun, consumption peaks
+    morning and evening, storage levels drift with the balance."""
+    header = list(COLUMN_MAPPING)
+    interval = timedelta(minutes=interval_minutes)
+    rows = []
+    battery, house_h2, car_h2 = 60.0, 50.0, 70.0
+    for i in range(int(days * 24 * 60 / interval_minutes)):
+        ts = start + i * interval
+        hour = ts.hour + ts.minute / 60
+        sun = max(0.0, math.sin(math.pi * (hour - 6) / 14)) if 6 <= hour <= 20 else 0.0
+        voltage = 4.1 + 30 * sun + rng.gauss(0, 0.5 * sun)
+        current = max(0.0, 8 * sun * rng.uniform(0.7, 1.0))
+        consumption = 0.4 + 1.2 * math.exp(-((hour - 7.5) ** 2) / 2) + 1.8 * math.exp(-((hour - 19) ** 2) / 3)
+        consumption = max(0.05, consumption + rng.gauss(0, 0.1))
+        surplus = voltage * current / 1000 - consumption
+        production = max(0.0, surplus) * 20
+        car_use = rng.uniform(5, 15) if 8 <= hour < 9 or 17 <= hour < 18 else 0.0
+        battery = min(100.0, max(0.0, battery + surplus * 2))
+        house_h2 = min(100.0, max(0.0, house_h2 + production / 200 - 0.01))
+        car_h2 = min(100.0, max(0.0, car_h2 - car_use / 100 + (0.5 if hour < 6 else 0.0)))
+        temperature = 10 + 6 * math.sin(math.pi * (hour - 9) / 12)
+        values = [voltage, current, production, consumption, car_use, temperature + rng.gauss(0, 0.3),
+                  20.5 + rng.gauss(0, 0.3), 1013 + rng.gauss(0, 1), 70 + rng.gauss(0, 3), battery,
+                  480 + rng.gauss(0, 15), house_h2, car_h2]
+        rows.append((ts, [_format_value(v) for v in values]))
+    return header, rows
+
+
+def _spike(header: List[str], values: List[str], rng: random.Random) -> List[str]:
+    """One sensor reports a physically impossible value."""
+    ruled = [i for i, name in enumerate(header[1:]) if COLUMN_MAPPING.get(name) in RANGE_RULES]
+    if not ruled:
+        return values
+    i = rng.choice(ruled)
+    rule = RANGE_RULES[COLUMN_MAPPING[header[i + 1]]]
+    value = rule.max * 10 + 1 if rule.max is not None else rule.min - 1000
+    values = list(values)
+    values[i] = _format_value(value)
+    return values
+
+
+def build_schedule(header: List[str], rows: List[Tuple[datetime, List[str]]], sites: int = 1,
+                   speedup: float = 1000.0, loops: int = 1, start: datetime = None, jitter: float = 0.0,
+                   gap_rate: float = 0.0, max_gap: int = 8, fault_rate: float = 0.0,
+                   faults: Tuple[str, ...] = FAULT_KINDS, rng: random.Random = None) -> Tuple[List[Sample], dict]:
+    """Expand the rows into per-site samples, sorted by send time.
+
+    The measurements table is keyed on timestamp alone, so each site replays
+    into its own stretch of time (whole days apart) instead of overwriting
+    the others. ``loops`` repeats the source back to back.
+    """
+    rng = rng or random.Random()
+    first = rows[0][0]
+    interval = rows[1][0] - first if len(rows) > 1 else timedelta(minutes=15)
+    loop_span = rows[-1][0] - first + interval
+    site_spacing = timedelta(days=math.ceil((loop_span * loops) / timedelta(days=1)) + 1)
+    base = start or first
+
+    samples: List[Sample] = []
+    skipped = 0
+    fault_counts = {kind: 0 for kind in faults}
+    for site in range(sites):
+        gap_left = 0
+        previous = None
+        for loop in range(loops):
+            for ts, values in rows:
+                offset = ts - first + loop * loop_span
+                if gap_left:
+                    gap_left -= 1
+                    skipped += 1
+                    continue
+                if gap_rate and rng.random() < gap_rate:
+                    gap_left = rng.randint(1, max_gap) - 1
+                    skipped += 1
+                    continue
+                fault = rng.choice(faults) if fault_rate and faults and rng.random() < fault_rate else None
+                sent = values
+                if fault == 'dropout':
+                    sent = [''] * len(values)
+                elif fault == 'stuck' and previous is not None:
+                    sent = previous
+                elif fault == 'spike':
+                    sent = _spike(header, values, rng)
+                if fault:
+                    fault_counts[fault] += 1
+                previous = sent
+                due = offset.total_seconds() / speedup
+                samples.append(Sample(len(samples), site, base + site * site_spacing + offset, sent, due,
+                                      due + (rng.uniform(0, jitter) if jitter else 0.0), fault))
+    samples.sort(key=lambda s: s.send_at)
+    stats = {
+        'scheduled': len(samples),
+        'gap_rows': skipped,
+        'faults': fault_counts,
+        'sites': sites,
+        'interval_seconds': interval.total_seconds(),
+        'replay_seconds': round(samples[-1].due, 3) if samples else 0.0,
+    }
+    return samples, stats
+
+
+def batch_csv(header: List[str], samples: List[Sample]) -> bytes:
+    lines = ['\t'.join(header)]
+    lines.extend('\t'.join([_format_timestamp(s.timestamp), *s.values]) for s in samples)
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class LatencyTracker:
+    """Matches ``measurements`` push events to the samples they cover.
+
+    An event carries the timestamp range of an ingested batch; every sample
+    in that range that had been sent by then counts as delivered.
+    """
+
+    def __init__(self, samples: List[Sample]):
+        ordered = sorted(samples, key=lambda s: s.timestamp)
+        self._timestamps = [s.timestamp for s in ordered]
+        self._ids = [s.id for s in ordered]
+        self.sent_at: Dict[int, float] = {}
+        self.received_at: Dict[int, float] = {}
+        self.events = 0
+
+    def sent(self, samples: List[Sample], at: float):
+        for sample in samples:
+            self.sent_at[sample.id] = at
+
+    def on_event(self, first: datetime, last: datetime, at: float):
+        self.events += 1
+        lo = bisect_left(self._timestamps, first)
+        hi = bisect_right(self._timestamps, last)
+        for sample_id in self._ids[lo:hi]:
+            sent = self.sent_at.get(sample_id)
+            if sent is not None and sent <= at and sample_id not in self.received_at:
+                self.received_at[sample_id] = at
+
+    def outstanding(self, delivered: Dict[int, float]) -> int:
+        return sum(1 for sample_id in delivered if sample_id not in self.received_at)
+
+
+class ReplayClient(LoadClient):
+    """A /ws client that feeds ``measurements`` events to a LatencyTracker."""
+
+    def __init__(self, tracker: LatencyTracker, url: str):
+        super().__init__("normal", url)
+        self.tracker = tracker
+
+    def on_text(self, text: str, now: float):
+        try:
+            message = json.loads(text)
+        except ValueError:
+            message = None
+        if isinstance(message, dict) and message.get("event") == "measurements":
+            self.tracker.on_event(datetime.fromisoformat(message["first"]),
+                                  datetime.fromisoformat(message["last"]), now)
+        else:
+            self.other_messages += 1
+
+
+class Replayer:
+    """Sends due samples in per-site batches to the upload API or the spool."""
+
+    def __init__(self, base_url: str, token: str, header: List[str], tracker: LatencyTracker,
+                 target: str = 'api', spool_dir: str = None, settle_seconds: float = 5.0,
+                 trigger: bool = True, concurrency: int = 4):
+        import requests
+        self.base_url = base_url
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.header = header
+        self.tracker = tracker
+        self.target = target
+        self.spool_dir = spool_dir
+        self.settle_seconds = settle_seconds
+        self.trigger = trigger
+        self.session = requests.Session()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.delivered: Dict[int, float] = {}  # sample id -> sent, for batches the server accepted
+        self.statuses: Dict[str, int] = {}
+        self.request_ms: List[float] = []
+        self._sequence = 0
+
+    def _count(self, status):
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    async def send(self, site: int, samples: List[Sample]):
+        async with self.semaphore:
+            body = batch_csv(self.header, samples)
+            self._sequence += 1
+            name = f"replay-site{site}-{self._sequence:06d}.csv"
+            start = time.perf_counter()
+            # Sent before the request, so a push racing the response still matches
+            self.tracker.sent(samples, start)
+            try:
+                if self.target == 'api':
+                    response = await asyncio.to_thread(
+                        self.session.post, f"{self.base_url}/api/measurements/upload", headers=self.headers,
+                        files={"file": (name, body, "text/csv")}, timeout=60)
+                    status = response.status_code
+                else:
+                    await asyncio.to_thread(self._write_spool_file, name, body)
+                    status = "spooled"
+            except Exception as e:
+                status = type(e).__name__
+            self.request_ms.append((time.perf_counter() - start) * 1000)
+            self._count(status)
+            if status in (200, "spooled"):
+                for sample in samples:
+                    self.delivered[sample.id] = start
+
+    def _write_spool_file(self, name: str, body: bytes):
+        path = os.path.join(self.spool_dir, name)
+        partial = path + '.part'
+        with open(partial, 'wb') as f:
+            f.write(body)
+        os.replace(partial, path)
+        # Written in one go, so there is nothing to wait for: backdate past the settle time
+        settled = time.time() - self.settle_seconds - 1
+        os.utime(path, (settled, settled))
+
+    async def trigger_spool(self):
+        if self.target != 'spool' or not self.trigger:
+            return
+        try:
+            # 409: a spool job is running and the next trigger picks the file up
+            await asyncio.to_thread(self.session.post, f"{self.base_url}/api/measurements/import/spool",
+                                    headers=self.headers, timeout=30)
+        except Exception as e:
+            logger.warning(f"Spool trigger failed: {e}")
+
+    def close(self):
+        self.session.close()
+
+
+async def run_replay(base_url: str, token: str, header: List[str], samples: List[Sample],
+                     target: str = 'api', spool_dir: str = None, settle_seconds: float = 5.0,
+                     trigger: bool = True, flush_interval: float = 0.25, concurrency: int = 4,
+                     drain_timeout: float = 30.0) -> dict:
+    """Replay the samples on their schedule and measure sample-to-WebSocket latency."""
+    tracker = LatencyTracker(samples)
+    client = ReplayClient(tracker, ws_url(base_url))
+    await client.connect()
+    reader = asyncio.create_task(client.run())
+    replayer = Replayer(base_url, token, header, tracker, target=target, spool_dir=spool_dir,
+                        settle_seconds=settle_seconds, trigger=trigger, concurrency=concurrency)
+    if target == 'spool':
+        os.makedirs(spool_dir, exist_ok=True)
+
+    sends: List[asyncio.Task] = []
+    batch_wait = []
+    start = time.perf_counter()
+    i = 0
+    try:
+        while i < len(samples):
+            now = time.perf_counter() - start
+            due = []
+            while i < len(samples) and samples[i].send_at <= now:
+                due.append(samples[i])
+                i += 1
+            if due:
+                by_site: Dict[int, List[Sample]] = {}
+                for sample in due:
+                    by_site.setdefault(sample.site, []).append(sample)
+                    batch_wait.append((now - sample.send_at) * 1000)
+                for site, batch in by_site.items():
+                    sends.append(asyncio.create_task(replayer.send(site, batch)))
+                if target == 'spool':
+                    sends.append(asyncio.create_task(replayer.trigger_spool()))
+            if i < len(samples):
+                wait = samples[i].send_at - (time.perf_counter() - start)
+                await asyncio.sleep(max(wait, flush_interval if due else 0.0, 0.0))
+        await asyncio.gather(*sends)
+        sent_done = time.perf_counter()
+
+        # Wait for the pushes of everything the server accepted
+        deadline = time.perf_counter() + drain_timeout
+        next_trigger = 0.0
+        while tracker.outstanding(replayer.delivered) and time.perf_counter() < deadline:
+            if target == 'spool' and time.perf_counter() >= next_trigger:
+                await replayer.trigger_spool()
+                next_trigger = time.perf_counter() + 1.0
+            await asyncio.sleep(0.1)
+    finally:
+        await client.close()
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        replayer.close()
+
+    def latency(group: List[Sample]) -> dict:
+        accepted = [s for s in group if s.id in replayer.delivered]
+        received = [s for s in accepted if s.id in tracker.received_at]
+        return {
+            "samples": len(group),
+            "accepted": len(accepted),
+            "received": len(received),
+            "missing": len(accepted) - len(received),
+            # sample time (accelerated clock) -> WebSocket receipt
+            "latency_ms": percentiles([(tracker.received_at[s.id] - start - s.due) * 1000 for s in received]),
+            # batch sent -> WebSocket receipt: ingest, validation and push
+            "pipeline_ms": percentiles([(tracker.received_at[s.id] - replayer.delivered[s.id]) * 1000
+                                        for s in received]),
+        }
+
+    by_fault: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        by_fault.setdefault(sample.fault or "none", []).append(sample)
+
+    return {
+        "replay": {
+            "wall_seconds": round(sent_done - start, 3),
+            "batch_wait_ms": percentiles(batch_wait),
+        },
+        "batches": {
+            "sent": sum(replayer.statuses.values()),
+            "status_codes": replayer.statuses,
+            "request_ms": percentiles(replayer.request_ms),
+        },
+        "websocket": {
+            "measurement_events": tracker.events,
+            "other_messages": client.other_messages,
+            "error": client.error,
+        },
+        "delivery": latency(samples),
+        "by_fault": {kind: latency(group) for kind, group in sorted(by_fault.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay a meter export (or synthetic data) at a speed-up across simulated sites "
+                    "into the upload API or the spool, with jitter, gaps and sensor faults, and report "
+                    "sample-to-WebSocket latency as JSON.")
+    parser.add_argument("--url", help="base URL of a running server (default: spawn one locally)")
+    parser.add_argument("--token", default=os.getenv("LOADTEST_TOKEN"), help="admin access token")
+    parser.add_argument("--username", default=os.getenv("LOADTEST_USERNAME"), help="admin to log in as")
+    parser.add_argument("--password", default=os.getenv("LOADTEST_PASSWORD"))
+    parser.add_argument("--source", default="data/energy_consumption.csv", help="meter export to replay")
+    parser.add_argument("--synthetic-days", type=float, help="generate this many days instead of --source")
+    parser.add_argument("--interval-minutes", type=float, default=float(os.getenv("QUALITY_INTERVAL_MINUTES", "15")),
+                        help="sample interval of synthetic data")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="timestamp of the first replayed row (default: that of the source)")
+    parser.add_argument("--loops", type=int, default=1, help="replay the source this many times back to back")
+    parser.add_argument("--sites", type=int, default=1)
+    parser.add_argument("--speedup", type=float, default=1000.0)
+    parser.add_argument("--jitter", type=float, default=0.0, help="max extra send delay per sample (seconds)")
+    parser.add_argument("--gap-rate", type=float, default=0.0, help="chance per row that a gap starts")
+    parser.add_argument("--max-gap", type=int, default=8, help="longest gap in rows")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="share of rows with a sensor fault")
+    parser.add_argument("--faults", default=",".join(FAULT_KINDS), help="fault kinds to draw from")
+    parser.add_argument("--target", choices=TARGETS, default="api")
+    parser.add_argument("--spool-dir", default=os.getenv("SPOOL_DIR", "data/spool"),
+                        help="spool directory of the server (--target spool; must be local)")
+    parser.add_argument("--settle-seconds", type=float, default=5.0, help="settle time of the server's spool")
+    parser.add_argument("--no-trigger", action="store_true",
+                        help="don't start spool jobs; the server polls (SPOOL_POLL_SECONDS)")
+    parser.add_argument("--flush-interval", type=float, default=0.25, help="minimum seconds between batches")
+    parser.add_argument("--concurrency", type=int, default=4, help="batches in flight at once")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--label", help="free-form label stored with the result (e.g. a git revision)")
+    parser.add_argument("--output", help="append the result as one JSON line to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    faults = tuple(kind for kind in args.faults.split(",") if kind)
+    unknown = set(faults) - set(FAULT_KINDS)
+    if unknown:
+        parser.error(f"unknown fault kinds: {', '.join(sorted(unknown))}")
+    rng = random.Random(args.seed)
+    if args.synthetic_days:
+        start = args.start or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        header, rows = synthetic_rows(args.synthetic_days, args.interval_minutes, start, rng)
+    else:
+        header, rows = read_source(args.source)
+    if not rows:
+        parser.error("nothing to replay")
+    samples, stats = build_schedule(
+        header, rows, sites=args.sites, speedup=args.speedup, loops=args.loops, start=args.start,
+        jitter=args.jitter, gap_rate=args.gap_rate, max_gap=args.max_gap, fault_rate=args.fault_rate,
+        faults=faults, rng=rng)
+    logger.info(f"Replaying {stats['scheduled']} samples from {stats['sites']} sites "
+                f"over {stats['replay_seconds']}s")
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        port = _free_port()
+        server = spawn_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_healthy(base_url)
+        token = args.token
+        if not token:
+            if not args.username or not args.password:
+                parser.error("give --token or --username/--password of an admin")
+            token = login(base_url, args.username, args.password)
+        result = asyncio.run(run_replay(
+            base_url, token, header, samples, target=args.target, spool_dir=args.spool_dir,
+            settle_seconds=args.settle_seconds, trigger=not args.no_trigger,
+            flush_interval=args.flush_interval, concurrency=args.concurrency,
+            drain_timeout=args.drain_timeout,
+        ))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    result = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "label": args.label,
+        "config": {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in vars(args).items()
+                   if k not in ("token", "password", "output", "label")},
+        "samples": stats,
+        **result,
+    }
+    line = json.dumps(result)
+    print(line)
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+# Handshakes in flight at once; more overflows the listen backlog
+CONNECT_CONCURRENCY = 200
+
+CLIENT_KINDS = ("normal", "slow", "flaky")
+
+
+def _notification_id(text: str) -> Optional[int]:
+    """Id of a broadcast notification; None for other events (e.g. import jobs)."""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or "event" in message:
+        return None
+    return message.get("id")
+
+
+def ws_url(base_url: str, path: str = "/ws") -> str:
+    """WebSocket URL of ``path`` on the server at ``base_url``."""
+    parsed = urlparse(base_url)
+    scheme = "wss" if parsed.scheme == "https" else "ws"
+    return f"{scheme}://{parsed.netloc}{path}"
+
+
+class LoadClient:
+    """One WebSocket client that records the broadcasts it receives.
+
+    ``slow`` clients pause after every message, so the server's sends back
+    up once the client's receive queue is full; ``flaky`` ones drop their
+    TCP connection without a close handshake at ``abort_at``
+    (``perf_counter`` time). Receive times are recorded per notification id.
+    """
+
+    def __init__(self, kind: str, url: str):
+        self.kind = kind
+        self.url = url
+        self.received: Dict[int, float] = {}
+        self.other_messages = 0
+        self.connected_at: Optional[float] = None
+        self.closed_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._ws = None
+
+    async def connect(self, timeout: float = 10.0) -> float:
+        """Open the connection; returns the handshake time in seconds."""
+        start = time.perf_counter()
+        # No keepalive pings, so a slow client isn't dropped for not answering; a
+        # one-message receive queue makes it push back on the server right away
+        self._ws = await websockets.connect(self.url, open_timeout=timeout, ping_interval=None,
+                                            max_size=None, max_queue=1, compression=None)
+        self.connected_at = time.perf_counter()
+        return self.connected_at - start
+
+    async def run(self, slow_delay: float = 0.0, abort_at: Optional[float] = None):
+        abort_handle = None
+        if abort_at is not None:
+            abort_handle = asyncio.get_running_loop().call_later(max(0.0, abort_at - time.perf_counter()), self.abort)
+        try:
+            async for message in self._ws:
+                if not isinstance(message, str):
+                    continue
+                self.on_text(message, time.perf_counter())
+                if slow_delay:
+                    await asyncio.sleep(slow_delay)
+        except (websockets.ConnectionClosedError, OSError) as e:
+            if self.closed_at is None:
+                self.error = type(e).__name__
+        finally:
+            if abort_handle is not None:
+                abort_handle.cancel()
+            if self.closed_at is None:
+                self.closed_at = time.perf_counter()
+
+    def on_text(self, text: str, now: float):
+        """Record a received text message (``now`` is its ``perf_counter`` time)."""
+        notification_id = _notification_id(text)
+        if notification_id is None:
+            self.other_messages += 1
+        else:
+            self.received.setdefault(notification_id, now)
+
+    def abort(self):
+        """Drop the connection abruptly: RST, no close frame."""
+        if self._ws is not None and self.closed_at is None:
+            self.closed_at = time.perf_counter()
+            sock = self._ws.transport.get_extra_info("socket")
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self._ws.transport.abort()
+
+    async def close(self):
+        if self._ws is None or self.closed_at is not None:
+            return
+        self.closed_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._ws.close(), 5)
+        except (asyncio.TimeoutError, websockets.WebSocketException, OSError):
+            self._ws.transport.abort()
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def at(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident memory of a process (Linux /proc), None where unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _raise_fd_limit(needed: int):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(hard, needed)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        if target < needed:
+            logger.warning(f"Open file limit is {target}; some of the {needed} connections will fail")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(port: int) -> subprocess.Popen:
+    """Run the app in a single uvicorn worker, as the server under test."""
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+    )
+
+
+def wait_until_healthy(base_url: str, timeout: float = 30.0):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/healthz", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become healthy within {timeout}s")
+
+
+def login(base_url: str, username: str, password: str) -> str:
+    import requests
+    response = requests.post(f"{base_url}/token", data={"username": username, "password": password}, timeout=30)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def _trigger_alert(session, base_url: str, token: str) -> dict:
+    start = time.perf_counter()
+    try:
+        response = await asyncio.to_thread(
+            session.post, f"{base_url}/api/notifications/test-alert",
+            headers={"Authorization": f"Bearer {token}"}, timeout=60)
+        status = response.status_code
+        notification_id = response.json().get("data", {}).get("id") if status == 200 else None
+    except Exception as e:
+        status, notification_id = type(e).__name__, None
+    return {"id": notification_id, "start": start, "end": time.perf_counter(), "status": status}
+
+
+async def run_load_test(base_url: str, token: str, clients: int = 1000, slow_fraction: float = 0.05,
+                        flaky_fraction: float = 0.05, slow_delay: float = 0.5, bursts: int = 10,
+                        burst_size: int = 5, burst_interval: float = 1.0, drain_timeout: float = 10.0,
+                        server_pid: Optional[int] = None) -> dict:
+    """Connect the clients, fire alert bursts and measure their delivery."""
+    import requests
+    url = ws_url(base_url)
+    slow = int(clients * slow_fraction)
+    flaky = int(clients * flaky_fraction)
+    kinds = ["slow"] * slow + ["flaky"] * flaky + ["normal"] * (clients - slow - flaky)
+    random.shuffle(kinds)
+    population = [LoadClient(kind, url) for kind in kinds]
+
+    rss_baseline = rss_bytes(server_pid) if server_pid else None
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    connect_times, connect_errors = [], {}
+
+    async def connect(client):
+        async with semaphore:
+            try:
+                connect_times.append(await client.connect() * 1000)
+            except Exception as e:
+                client.error = type(e).__name__
+                connect_errors[client.error] = connect_errors.get(client.error, 0) + 1
+
+    await asyncio.gather(*(connect(client) for client in population))
+    connected = [client for client in population if client.connected_at is not None]
+    await asyncio.sleep(1.0)
+    rss_connected = rss_bytes(server_pid) if server_pid else None
+
+    test_duration = bursts * burst_interval
+    start = time.perf_counter()
+    readers = [
+        asyncio.create_task(client.run(
+            slow_delay=slow_delay if client.kind == "slow" else 0.0,
+            abort_at=start + random.uniform(0, test_duration) if client.kind == "flaky" else None,
+        ))
+        for client in connected
+    ]
+
+    alerts = []
+    with requests.Session() as session:
+        for _ in range(bursts):
+            burst_start = time.perf_counter()
+            alerts.extend(await asyncio.gather(*(_trigger_alert(session, base_url, token) for _ in range(burst_size))))
+            await asyncio.sleep(max(0.0, burst_interval - (time.perf_counter() - burst_start)))
+
+    sent = {alert["id"]: alert for alert in alerts if alert["id"] is not None}
+    # Wait until every client that stayed connected has every alert (or time out)
+    expecting = [client for client in connected if client.kind != "flaky"]
+    deadline = time.perf_counter() + drain_timeout
+    while time.perf_counter() < deadline:
+        if all(len(client.received.keys() & sent.keys()) == len(sent) for client in expecting if client.closed_at is None):
+            break
+        await asyncio.sleep(0.1)
+
+    for client in connected:
+        await client.close()
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    delivery = {}
+    for kind in CLIENT_KINDS + ("all",):
+        members = [c for c in connected if kind in ("all", c.kind)]
+        latencies, expected, delivered = [], 0, 0
+        for client in members:
+            for notification_id, alert in sent.items():
+                received = client.received.get(notification_id)
+                if received is not None:
+                    delivered += 1
+                    latencies.append((received - alert["start"]) * 1000)
+                # Flaky clients only owe what was sent before they dropped
+                if client.kind != "flaky" or (client.closed_at and alert["end"] <= client.closed_at):
+                    expected += 1
+        dropped = max(0, expected - delivered) if kind != "flaky" else None
+        delivery[kind] = {
+            "clients": len(members),
+            "expected": expected,
+            "delivered": delivered,
+            "dropped": dropped,
+            "drop_rate": round(dropped / expected, 6) if expected and dropped is not None else None,
+            "latency_ms": percentiles(latencies),
+            "disconnected_early": sum(1 for c in members if c.error is not None),
+        }
+
+    statuses: Dict[str, int] = {}
+    for alert in alerts:
+        statuses[str(alert["status"])] = statuses.get(str(alert["status"]), 0) + 1
+
+    return {
+        "connections": {
+            "requested": clients,
+            "established": len(connected),
+            "failed": clients - len(connected),
+            "errors": connect_errors,
+            "connect_ms": percentiles(connect_times),
+            "by_kind": {kind: kinds.count(kind) for kind in CLIENT_KINDS},
+        },
+        "server_memory": {
+            "rss_baseline_bytes": rss_baseline,
+            "rss_connected_bytes": rss_connected,
+            "bytes_per_connection": (
+                round((rss_connected - rss_baseline) / len(connected))
+                if rss_baseline and rss_connected and connected else None
+            ),
+        },
+        "alerts": {
+            "sent": len(alerts),
+            "succeeded": len(sent),
+            "status_codes": statuses,
+            # test-alert returns after the broadcast, so this is the fan-out time
+            "request_ms": percentiles([(a["end"] - a["start"]) * 1000 for a in alerts]),
+        },
+        "delivery": delivery,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="WebSocket scale and soak test: connect many /ws clients, fire test-alert "
+                    "bursts and report delivery latency, memory per connection and drops as JSON.")
+    parser.add_argument("--url", help="base URL of a running server (default: spawn one locally)")
+    parser.add_argument("--server-pid", type=int, help="pid of the server at --url, for memory figures")
+    parser.add_argument("--token", default=os.getenv("LOADTEST_TOKEN"), help="superadmin access token")
+    parser.add_argument("--username", default=os.getenv("LOADTEST_USERNAME"), help="superadmin to log in as")
+    parser.add_argument("--password", default=os.getenv("LOADTEST_PASSWORD"))
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--slow-fraction", type=float, default=0.05, help="share of clients that read slowly")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="seconds a slow client waits per message")
+    parser.add_argument("--flaky-fraction", type=float, default=0.05,
+                        help="share of clients that drop their connection mid-test")
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--burst-size", type=int, default=5, help="alerts fired concurrently per burst")
+    parser.add_argument("--burst-interval", type=float, default=1.0)
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    parser.add_argument("--label", help="free-form label stored with the result (e.g. a git revision)")
+    parser.add_argument("--output", help="append the result as one JSON line to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    _raise_fd_limit(args.clients + 256)
+    server = None
+    base_url = args.url
+    server_pid = args.server_pid
+    if base_url is None:
+        port = _free_port()
+        server = spawn_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+        server_pid = server.pid
+    try:
+        wait_until_healthy(base_url)
+        token = args.token
+        if not token:
+            if not args.username or not args.password:
+                parser.error("give --token or --username/--password of a superadmin")
+            token = login(base_url, args.username, args.password)
+        logger.info(f"Connecting {args.clients} clients to {base_url}")
+        result = asyncio.run(run_load_test(
+            base_url, token, clients=args.clients, slow_fraction=args.slow_fraction,
+            flaky_fraction=args.flaky_fraction, slow_delay=args.slow_delay, bursts=args.bursts,
+            burst_size=args.burst_size, burst_interval=args.burst_interval,
+            drain_timeout=args.drain_timeout, server_pid=server_pid,
+        ))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    result = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "label": args.label,
+        "config": {k: v for k, v in vars(args).items() if k not in ("token", "password", "output", "label")},
+        **result,
+    }
+    line = json.dumps(result)
+    print(line)
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
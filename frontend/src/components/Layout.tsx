@@ -249,7 +249,9 @@ const Layout: React.FC<{ children: React.ReactNode }> = ({ children }) => {
     const ws = new WebSocket(`${WS_URL}/ws`);
     ws.onmessage = (event) => {
       try {
-        const newNotification = JSON.parse(event.data.replace(/'/g, '"'));
+        const newNotification = JSON.parse(event.data);
+        // Other server events (e.g. import job progress) are not notifications
+        if (newNotification.event) return;
         setNotifications(prev => [newNotification, ...prev]);
         toast.custom((t) => (
           <motion.div
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { FiUser, FiSearch, FiEdit, FiTrash2, FiPlus, FiShield, FiCheckCircle, FiXCircle, FiChevronDown, FiSettings, FiLogOut, FiDownload, FiBarChart2, FiRefreshCw, FiAlertTriangle, FiEye, FiSend } from 'react-icons/fi';
 import { motion } from 'framer-motion';
 import { useNavigate } from 'react-router-dom';
@@ -16,6 +16,7 @@ const Admin = () => {
   const [users, setUsers] = useState([]);
   const [usersLoading, setUsersLoading] = useState(true);
   const [usersError, setUsersError] = useState('');
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [models, setModels] = useState([]);
   const [modelsLoading, setModelsLoading] = useState(true);
   const [modelsError, setModelsError] = useState('');
@@ -32,26 +33,41 @@ const Admin = () => {
   const [apiKey, setApiKey] = useState('********************');
   const navigate = useNavigate();
   const user = authService.getUser();
+  const usersRequest = useRef<AbortController | null>(null);
 
-  const fetchUsers = async () => {
-    setUsersLoading(true);
+  // Server-side filtered, one page at a time; a cursor appends the next page
+  const fetchUsers = async (cursor?: string) => {
+    // A response to an older search must not overwrite a newer one
+    usersRequest.current?.abort();
+    const controller = new AbortController();
+    usersRequest.current = controller;
+    if (!cursor) setUsersLoading(true);
     setUsersError('');
     try {
+      const params: Record<string, string> = {};
+      if (search.trim()) params.search = search.trim();
+      if (roleFilter !== 'Alle rollen') params.role = roleFilter;
+      if (cursor) params.cursor = cursor;
       const res = await axios.get(`${API_URL}/users/`, {
         headers: { Authorization: `Bearer ${localStorage.getItem('token')}` },
+        params,
+        signal: controller.signal,
       });
-      setUsers(res.data);
+      setUsers(prev => cursor ? [...prev, ...res.data] as any : res.data);
+      setNextCursor(res.headers['x-next-cursor'] || null);
     } catch (e: any) {
+      if (axios.isCancel(e)) return;
       setUsersError(e.response?.data?.detail || 'Fout bij ophalen gebruikers');
     } finally {
-      setUsersLoading(false);
+      if (usersRequest.current === controller) setUsersLoading(false);
     }
   };
 
-  // Fetch users
+  // Fetch users (debounced while typing)
   useEffect(() => {
-    fetchUsers();
-  }, []);
+    const timeout = setTimeout(() => fetchUsers(), 300);
+    return () => clearTimeout(timeout);
+  }, [search, roleFilter]);
 
   // Add user
   const handleAddUser = async () => {
@@ -63,10 +79,7 @@ const Admin = () => {
       setAddingUser(false);
       setNewUser({ username: '', email: '', password: '', role: 'user' });
       // Refresh users
-      const res = await axios.get(`${API_URL}/users/`, {
-        headers: { Authorization: `Bearer ${localStorage.getItem('token')}` },
-      });
-      setUsers(res.data);
+      fetchUsers();
     } catch (e: any) {
       setAddUserError(e.response?.data?.detail || 'Fout bij toevoegen gebruiker');
     }
@@ -119,12 +132,6 @@ const Admin = () => {
     }
   };
 
-  // Filtered users
-  const filteredUsers = users.filter((u: any) =>
-    (roleFilter === 'Alle rollen' || u.role === roleFilter) &&
-    (`${u.username} ${u.email}`.toLowerCase().includes(search.toLowerCase()))
-  );
-
   return (
     <Layout>
       <div className="px-2 sm:px-4 md:px-8 w-full">
@@ -166,7 +173,7 @@ const Admin = () => {
                   </tr>
                 </thead>
                 <tbody>
-                  {filteredUsers.map((u: any) => (
+                  {users.map((u: any) => (
                     <tr key={u.id} className="border-b border-primary-200/30 hover:bg-primary-100/10 transition">
                       <td className="py-2 px-4 font-semibold flex items-center gap-2"><FiUser className="text-primary-400" /> {u.username}</td>
                       <td className="py-2 px-4">{u.email}</td>
@@ -185,6 +192,9 @@ const Admin = () => {
                   ))}
                 </tbody>
               </table>
+              {nextCursor && (
+                <button className="mt-3 px-4 py-2 rounded-xl bg-white/40 text-primary-900 font-semibold hover:bg-white/60 transition" onClick={() => fetchUsers(nextCursor)}>Meer laden</button>
+              )}
             </div>
           )}
           {/* Add user modal */}
@@ -3,16 +3,93 @@ import type { LoginCredentials, User, RegisterCredentials } from '../types/auth'
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
+// Renew the access token this long before it expires
+const REFRESH_MARGIN_MS = 60 * 1000;
+
+// Web Lock held while exchanging the refresh token, shared by all tabs
+const REFRESH_LOCK = 'auth-refresh';
+
 // Create the service class
 class AuthService {
   private token: string | null = null;
   private user: User | null = null;
+  private refreshTimer: ReturnType<typeof setTimeout> | null = null;
 
   constructor() {
     console.log('AuthService: Initializing');
     this.token = localStorage.getItem('token');
     this.user = this.getUserFromToken(this.token);
     console.log('AuthService: Initial state:', { hasToken: !!this.token, user: this.user });
+    window.addEventListener('storage', this.onStorage);
+    this.scheduleRefresh();
+  }
+
+  // Another tab refreshed, logged in or logged out: take over its tokens
+  private onStorage = (event: StorageEvent): void => {
+    if (event.key !== null && event.key !== 'token') return;
+    this.token = localStorage.getItem('token');
+    this.user = this.getUserFromToken(this.token);
+    this.scheduleRefresh();
+  };
+
+  private expiresSoon(token: string | null): boolean {
+    const exp = (this.getUserFromToken(token) as any)?.exp;
+    return !exp || exp * 1000 - Date.now() <= REFRESH_MARGIN_MS;
+  }
+
+  private setTokens(accessToken: string, refreshToken: string): void {
+    this.token = accessToken;
+    this.user = this.getUserFromToken(accessToken);
+    localStorage.setItem('token', accessToken);
+    localStorage.setItem('refresh_token', refreshToken);
+    this.scheduleRefresh();
+  }
+
+  // Swap the refresh token for new tokens shortly before the access token
+  // expires, so an open dashboard never has to send the password again
+  private scheduleRefresh(): void {
+    if (this.refreshTimer) clearTimeout(this.refreshTimer);
+    this.refreshTimer = null;
+    const exp = (this.getUserFromToken(this.token) as any)?.exp;
+    if (!exp || !localStorage.getItem('refresh_token')) return;
+    const delay = Math.max(exp * 1000 - Date.now() - REFRESH_MARGIN_MS, 0);
+    this.refreshTimer = setTimeout(() => {
+      this.refresh().catch(() => undefined);
+    }, delay);
+  }
+
+  // Tabs refresh one at a time; a refresh token is only accepted once, so the
+  // others pick up the tokens the first one stored instead of exchanging again
+  public async refresh(): Promise<void> {
+    if ('locks' in navigator) {
+      return navigator.locks.request(REFRESH_LOCK, () => this.exchange());
+    }
+    return this.exchange();
+  }
+
+  private async exchange(): Promise<void> {
+    const stored = localStorage.getItem('token');
+    if (stored && !this.expiresSoon(stored)) {
+      this.token = stored;
+      this.user = this.getUserFromToken(stored);
+      this.scheduleRefresh();
+      return;
+    }
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) throw new Error('No refresh token');
+    try {
+      const response = await axios.post(`${API_URL}/token/refresh`, { refresh_token: refreshToken });
+      this.setTokens(response.data.access_token, response.data.refresh_token);
+    } catch (error: any) {
+      if (error.response?.status === 401) {
+        console.warn('AuthService: Session expired');
+        this.logout();
+      } else {
+        // Server unreachable; try again shortly
+        this.refreshTimer = setTimeout(() => this.refresh().catch(() => undefined), 30 * 1000);
+      }
+      throw error;
+    }
   }
 
   private getUserFromToken(token: string | null): User | null {
@@ -54,10 +131,8 @@ class AuthService {
       });
       // Extra debug: log after axios
       console.log('AuthService: Login response', response);
-      const { access_token } = response.data;
-      this.token = access_token;
-      this.user = this.getUserFromToken(access_token);
-      localStorage.setItem('token', access_token);
+      const { access_token, refresh_token } = response.data;
+      this.setTokens(access_token, refresh_token);
       console.log('AuthService: Login successful');
     } catch (error: any) {
       // Extra debug: log error details
@@ -74,9 +149,16 @@ class AuthService {
 
   public logout(): void {
     console.log('AuthService: Logging out');
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      axios.post(`${API_URL}/token/revoke`, { refresh_token: refreshToken }).catch(() => undefined);
+    }
+    if (this.refreshTimer) clearTimeout(this.refreshTimer);
+    this.refreshTimer = null;
     this.token = null;
     this.user = null;
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
   }
 
   public getToken(): string | null {